@@ -0,0 +1,92 @@
+"""
+Benchmark of the batch board evaluation in model/analysis.py against per-board Python loops.
+
+Both evaluate the same seeded random boards: territory, frontier, vanquish threats and whether
+a conquest is possible, for both players. The results are checked to agree before timing.
+
+Usage:
+    python -m bench.analysis --boards 2000
+"""
+import argparse
+import sys
+import time
+
+from bench.positions import *
+from model.analysis import BoardBatch
+
+
+def loop_evaluate(board: Board) -> ([int], [int], [[Position]], [bool]):
+    """
+    Evaluates one board by walking its cells, the way analysis was done before batches.
+    """
+    territory, frontier, threats, conquest = [], [], [], []
+    for player in (1, 2):
+        territory.append(sum(1 for row in board for cell in row if cell.player == player and not cell.base))
+        frontier.append(sum(1 for i in range(board.rows) for j in range(board.cols) if board[i][j].player == 0 and
+                            any(board[a][b].player == player for a, b in board.adjacent((i, j), base=True))))
+        threats.append(board.vanquish_spots(player))
+        try:
+            board.deepcopy().conquest(player)
+            conquest.append(True)
+        except InvalidMove:
+            conquest.append(False)
+    return territory, frontier, threats, conquest
+
+
+def batch_evaluate(batch: BoardBatch) -> ([[int]], [[int]], [[[Position]]], [[bool]]):
+    threats = [batch.vanquish_threats(player) for player in (1, 2)]
+    distances = [batch.conquest_distance(player) for player in (1, 2)]
+    return batch.territory(), batch.frontier(), threats, distances
+
+
+def check(boards: [Board], batch: BoardBatch):
+    """
+    Raises AssertionError at the first board where the two evaluations disagree.
+    """
+    territory, frontier, threats, distances = batch_evaluate(batch)
+    for k, board in enumerate(boards):
+        l_territory, l_frontier, l_threats, l_conquest = loop_evaluate(board)
+        assert list(territory[k]) == l_territory, f'territory of board {k}'
+        assert list(frontier[k]) == l_frontier, f'frontier of board {k}'
+        for p in range(2):
+            spots = [tuple(int(x) for x in pos) for pos in zip(*threats[p][k].nonzero())]
+            assert spots == l_threats[p], f'vanquish threats of player {p + 1} on board {k}'
+            assert (distances[p][k] >= 0) == l_conquest[p], f'conquest of player {p + 1} on board {k}'
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(description='Batch board evaluation against per-board loops.')
+    parser.add_argument('--boards', type=int, default=2000, help='boards per batch')
+    parser.add_argument('--rows', type=int, default=14)
+    parser.add_argument('--cols', type=int, default=28)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    boards = [random_board(args.rows, args.cols, seed=args.seed + k, density=rng.uniform(0.3, 0.9))
+              for k in range(args.boards)]
+
+    start = time.perf_counter()
+    batch = BoardBatch.from_boards(boards)
+    stack_time = time.perf_counter() - start
+    check(boards[:200], BoardBatch.from_boards(boards[:200]))
+
+    start = time.perf_counter()
+    for board in boards:
+        loop_evaluate(board)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_evaluate(batch)
+    batch_time = time.perf_counter() - start
+
+    print(f'boards:   {args.boards} of {args.rows}x{args.cols}')
+    print(f'loops:    {loop_time:.3f}s ({args.boards / loop_time:.0f} boards/sec)')
+    print(f'batch:    {batch_time:.3f}s ({args.boards / batch_time:.0f} boards/sec), '
+          f'plus {stack_time:.3f}s to stack the boards')
+    print(f'speedup:  {loop_time / batch_time:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
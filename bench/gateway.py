@@ -0,0 +1,411 @@
+"""
+An in-process stand-in for the parts of the discord.py API that DisquidClient uses.
+
+Guilds, channels, roles, members and messages behave like their discord.py counterparts closely
+enough for the bot's commands to run, but every call that would reach Discord is recorded on the
+Gateway instead, after a simulated round trip and per-route rate limit.
+
+Typical use:
+    gateway = Gateway(latency=0.05, time_scale=0.01)
+    guild = gateway.add_guild()
+    alice, bob = guild.add_member('alice'), guild.add_member('bob')
+    client = gateway.client()
+    await client.on_message(gateway.message(guild.text_channels[0], alice, '*c @bob', mentions=[bob]))
+"""
+import asyncio
+import itertools
+import tempfile
+import time
+from collections import deque, Counter
+from pathlib import Path
+
+
+class MessageTooLong(Exception):
+    """
+    Thrown when a message is longer than Discord accepts, which Discord rejects with a 400 error.
+    """
+    pass
+
+
+def check_length(content: str):
+    if content is not None and len(str(content)) > Gateway.message_limit:
+        raise MessageTooLong(f'{len(str(content))} characters')
+
+
+class Gateway(object):
+    """
+    Holds every fake object and records the outbound calls made on them.
+    :param latency: Simulated seconds per outbound call.
+    :param rate: Calls allowed per route within each period, like Discord's per-channel buckets.
+    :param per: Length of a rate limit period in simulated seconds.
+    :param time_scale: Real seconds slept per simulated second, so long scenarios can run quickly.
+    """
+    message_limit = 2000
+
+    def __init__(self, latency: float = 0.05, rate: int = 5, per: float = 5.0, time_scale: float = 1.0):
+        self.latency = latency
+        self.rate = rate
+        self.per = per
+        self.time_scale = time_scale
+        self.calls: [(str, int)] = []
+        self.rate_limited = 0
+        self.guilds: {int, FakeGuild} = {}
+        self.channels: {int, FakeChannel} = {}
+        self._ids = itertools.count(10 ** 17)
+        self._buckets: {(str, int), deque} = {}
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def clock(self) -> float:
+        """
+        :return: Simulated seconds.
+        """
+        return time.perf_counter() / self.time_scale
+
+    async def call(self, route: str, major_id: int):
+        """
+        Records an outbound call, waiting out the rate limit of its route and the round trip.
+        """
+        bucket = self._buckets.setdefault((route, major_id), deque())
+        while True:
+            now = self.clock()
+            while bucket and now - bucket[0] >= self.per:
+                bucket.popleft()
+            if not self.rate or len(bucket) < self.rate:
+                break
+            self.rate_limited += 1
+            await asyncio.sleep((self.per - (now - bucket[0])) * self.time_scale)
+        bucket.append(now)
+        self.calls.append((route, major_id))
+        if self.latency:
+            await asyncio.sleep(self.latency * self.time_scale)
+
+    def call_counts(self) -> Counter:
+        return Counter(route for route, _ in self.calls)
+
+    def add_guild(self, guild_id: int = None, name: str = 'guild', channels: int = 1):
+        guild = FakeGuild(self, guild_id or self.next_id(), name)
+        self.guilds[guild.id] = guild
+        for n in range(channels):
+            guild._add_channel(f'general-{n}')
+        return guild
+
+    def message(self, channel, author, content: str, mentions: [] = None, attachments: [bytes] = None):
+        """
+        Creates a message as if a user had sent it, without recording an outbound call.
+        :param attachments: Contents of the files attached to the message.
+        """
+        msg = FakeMessage(self, channel, author, content, mentions)
+        msg.attachments = [FakeAttachment(data) for data in attachments or []]
+        channel._history.append(msg)
+        return msg
+
+    def client(self, data_path: Path = None, admins: [int] = None, **options):
+        """
+        Creates a DisquidClient that talks to this gateway instead of Discord.
+        Must be called from a running event loop, since the client schedules its auto save.
+        :param data_path: Directory for the client's files, a new temporary directory by default.
+        :param admins: uids of bot admins.
+        """
+        from botworks import DisquidClient
+
+        gateway = self
+        data_path = Path(data_path or tempfile.mkdtemp(prefix='disquid-bench-'))
+        admin_file = data_path.joinpath('admins.json')
+        if not admin_file.exists():
+            admin_file.write_text(str(list(admins or [0])))
+
+        class GatewayClient(DisquidClient):
+            """
+            DisquidClient connected to a Gateway.
+            Replays are recorded instead of rendered, since rendering video is not part of the bot's hot path.
+            """
+
+            def is_ready(self):
+                return True
+
+            def get_guild(self, gid):
+                return gateway.guilds.get(gid)
+
+            def get_channel(self, cid):
+                return gateway.channels.get(cid)
+
+            @property
+            def latency(self):
+                return gateway.latency
+
+            async def gen_replay(self, game):
+                await gateway.call('replay', game.game_id)
+
+        GatewayClient.data_path = data_path
+        return GatewayClient(**options)
+
+
+class FakeColor(object):
+
+    def __init__(self, value: int = 0):
+        self.value = getattr(value, 'value', value)
+
+
+class FakePermissions(object):
+
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+
+class FakeRole(object):
+
+    def __init__(self, guild, role_id: int, name: str, color=None):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.color = FakeColor(color or 0)
+
+    @property
+    def mention(self):
+        return f'<@&{self.id}>'
+
+    async def edit(self, name: str = None, color=None, **kwargs):
+        await self.guild.gateway.call('edit_role', self.guild.id)
+        if name is not None:
+            self.name = name
+        if color is not None:
+            self.color = FakeColor(color)
+
+    async def delete(self, reason: str = None):
+        await self.guild.gateway.call('delete_role', self.guild.id)
+        self.guild._roles.pop(self.id, None)
+
+
+class FakeEmoji(object):
+
+    def __init__(self, guild, emoji_id: int, name: str, image: bytes):
+        self.guild = guild
+        self.id = emoji_id
+        self.name = name
+        self.image = image
+
+    @property
+    def url(self):
+        return f'https://cdn.discordapp.com/emojis/{self.id}.png'
+
+    def __str__(self):
+        return f'<:{self.name}:{self.id}>'
+
+    async def delete(self, reason: str = None):
+        await self.guild.gateway.call('delete_emoji', self.guild.id)
+        if self in self.guild.emojis:
+            self.guild.emojis.remove(self)
+
+
+class FakeMember(object):
+
+    def __init__(self, guild, uid: int, name: str, bot: bool = False, administrator: bool = False):
+        self.guild = guild
+        self.id = uid
+        self.name = name
+        self.bot = bot
+        self.roles: [FakeRole] = []
+        self.guild_permissions = FakePermissions(administrator)
+        self.dms: [str] = []
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    async def add_roles(self, *roles, reason: str = None):
+        await self.guild.gateway.call('add_roles', self.guild.id)
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def remove_roles(self, *roles, reason: str = None):
+        await self.guild.gateway.call('remove_roles', self.guild.id)
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def send(self, content: str = None, **kwargs):
+        check_length(content)
+        await self.guild.gateway.call('dm', self.id)
+        self.dms.append(content)
+
+    async def edit(self, nick: str = None, **kwargs):
+        await self.guild.gateway.call('edit_member', self.guild.id)
+
+
+class FakeCategory(object):
+
+    def __init__(self, category_id: int, name: str):
+        self.id = category_id
+        self.name = name
+
+
+class FakeHistory(object):
+    """
+    Iterates a channel's messages the way discord.py's HistoryIterator does.
+    """
+
+    def __init__(self, channel, limit: int = 100, after=None, before=None, oldest_first: bool = None):
+        self.channel = channel
+        messages = list(channel._history)
+        if after is not None:
+            messages = [m for m in messages if m.id > after.id]
+        if before is not None:
+            messages = [m for m in messages if m.id < before.id]
+        if not oldest_first:
+            messages.reverse()
+        self.messages = messages if limit is None else messages[:limit]
+        self.fetched = False
+
+    async def _fetch(self):
+        if not self.fetched:
+            self.fetched = True
+            # one request per hundred messages, like the real API
+            for _ in range(max(1, (len(self.messages) + 99) // 100)):
+                await self.channel.guild.gateway.call('history', self.channel.id)
+
+    async def flatten(self):
+        await self._fetch()
+        return list(self.messages)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._fetch()
+        for msg in self.messages:
+            yield msg
+
+
+class FakeChannel(object):
+
+    def __init__(self, guild, channel_id: int, name: str, category=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.category_id = category.id if category else None
+        self._history: [FakeMessage] = []
+
+    @property
+    def mention(self):
+        return f'<#{self.id}>'
+
+    async def send(self, content: str = None, embed=None, file=None, **kwargs):
+        check_length(content)
+        gateway = self.guild.gateway
+        await gateway.call('send', self.id)
+        msg = FakeMessage(gateway, self, self.guild.me, str(content) if content is not None else '')
+        msg.embed = embed
+        msg.file = file
+        self._history.append(msg)
+        return msg
+
+    def history(self, limit: int = 100, after=None, before=None, oldest_first: bool = None, **kwargs):
+        return FakeHistory(self, limit, after, before, oldest_first)
+
+    async def edit(self, name: str = None, category=None, **kwargs):
+        await self.guild.gateway.call('edit_channel', self.id)
+        if name is not None:
+            self.name = name
+        if category is not None:
+            self.category = category
+            self.category_id = category.id
+
+    async def delete(self, reason: str = None):
+        await self.guild.gateway.call('delete_channel', self.id)
+        self.guild.text_channels.remove(self)
+        self.guild.gateway.channels.pop(self.id, None)
+
+
+class FakeAttachment(object):
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class FakeMessage(object):
+
+    def __init__(self, gateway: Gateway, channel: FakeChannel, author: FakeMember, content: str,
+                 mentions: [FakeMember] = None):
+        self.gateway = gateway
+        self.id = gateway.next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.mentions = list(mentions or [])
+        self.attachments = []
+        self.embed = None
+        self.file = None
+
+    async def edit(self, content: str = None, **kwargs):
+        await self.gateway.call('edit_message', self.channel.id)
+        if content is not None:
+            self.content = content
+
+    async def delete(self, **kwargs):
+        await self.gateway.call('delete_message', self.channel.id)
+        if self in self.channel._history:
+            self.channel._history.remove(self)
+
+
+class FakeGuild(object):
+
+    def __init__(self, gateway: Gateway, guild_id: int, name: str):
+        self.gateway = gateway
+        self.id = guild_id
+        self.name = name
+        self.text_channels: [FakeChannel] = []
+        self.categories: [FakeCategory] = []
+        self.emojis: [FakeEmoji] = []
+        self._roles: {int, FakeRole} = {}
+        self._members: {int, FakeMember} = {}
+        self.me = FakeMember(self, gateway.next_id(), 'Disquid', bot=True)
+
+    @property
+    def roles(self) -> [FakeRole]:
+        return list(self._roles.values())
+
+    @property
+    def members(self) -> [FakeMember]:
+        return list(self._members.values())
+
+    def add_member(self, name: str, administrator: bool = False) -> FakeMember:
+        member = FakeMember(self, self.gateway.next_id(), name, administrator=administrator)
+        self._members[member.id] = member
+        return member
+
+    def add_category(self, name: str) -> FakeCategory:
+        category = FakeCategory(self.gateway.next_id(), name)
+        self.categories.append(category)
+        return category
+
+    def _add_channel(self, name: str, category: FakeCategory = None) -> FakeChannel:
+        channel = FakeChannel(self, self.gateway.next_id(), name, category)
+        self.text_channels.append(channel)
+        self.gateway.channels[channel.id] = channel
+        return channel
+
+    def get_member(self, uid: int) -> FakeMember:
+        return self._members.get(uid)
+
+    def get_role(self, role_id: int) -> FakeRole:
+        return self._roles.get(role_id)
+
+    async def create_role(self, name: str = 'new role', color=None, **kwargs) -> FakeRole:
+        await self.gateway.call('create_role', self.id)
+        role = FakeRole(self, self.gateway.next_id(), name, color)
+        self._roles[role.id] = role
+        return role
+
+    async def create_text_channel(self, name: str, category: FakeCategory = None, **kwargs) -> FakeChannel:
+        await self.gateway.call('create_channel', self.id)
+        return self._add_channel(name, category)
+
+    async def create_custom_emoji(self, name: str, image: bytes, **kwargs):
+        await self.gateway.call('create_emoji', self.id)
+        emoji = FakeEmoji(self, self.gateway.next_id(), name, image)
+        self.emojis.append(emoji)
+        return emoji
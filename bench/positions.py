@@ -0,0 +1,92 @@
+"""
+Seeded board positions for benchmarking and simulation.
+Every generator only touches non-base cells, so the bases stay as Board made them.
+"""
+import random
+
+from model.state import *
+
+board_sizes: [Position] = [(7, 14), (14, 28), (21, 42)]
+
+
+def default_bases(rows: int, cols: int) -> [Position]:
+    """
+    Base positions for a board of the given size, placed like the standard Game layout.
+    """
+    return Layout.of(rows, cols).bases
+
+
+def empty_board(rows: int, cols: int) -> Board:
+    return Board(rows, cols, default_bases(rows, cols))
+
+
+def open_cells(board: Board) -> [Position]:
+    """
+    :return: Every non-base position on the board.
+    """
+    return [(i, j) for i in range(board.rows) for j in range(board.cols) if not board[i][j].base]
+
+
+def random_board(rows: int, cols: int, seed: int, density: float = 0.6) -> Board:
+    """
+    A board where roughly the given fraction of cells belongs to a random player.
+    """
+    rng = random.Random(seed)
+    board = empty_board(rows, cols)
+    for i, j in open_cells(board):
+        if rng.random() < density:
+            board[i][j].player = rng.choice((1, 2))
+    return board
+
+
+def cascade_board(rows: int, cols: int) -> Board:
+    """
+    Player 2 owns everything except the first row and column, which belong to player 1.
+    A conquer by player 1 then spreads diagonally over the whole board.
+    """
+    board = empty_board(rows, cols)
+    for i, j in open_cells(board):
+        board[i][j].player = 1 if i == 0 or j == 0 else 2
+    return board
+
+
+def flood_board(rows: int, cols: int, walled: bool = False) -> Board:
+    """
+    Player 1 owns everything, so a conquest search explores most of the board.
+    :param walled: If True, the enemy base is ringed by empty cells and no path exists,
+    so a conquest must explore every cell before failing.
+    """
+    board = empty_board(rows, cols)
+    for i, j in open_cells(board):
+        board[i][j].player = 1
+    if walled:
+        top, left = board.bases[1]
+        side = board.layout.hq_size
+        for dx in range(-1, side + 1):
+            for dy in range(-1, side + 1):
+                loc = (top + dx, left + dy)
+                if board.is_valid_position(loc) and not board[loc[0]][loc[1]].base:
+                    board[loc[0]][loc[1]].player = 0
+    return board
+
+
+def lattice_board(rows: int, cols: int) -> Board:
+    """
+    Empty except for player 1 lines on every fifth row and column,
+    which makes a large number of vanquish squares valid at once.
+    """
+    board = empty_board(rows, cols)
+    for i, j in open_cells(board):
+        if i % 5 == 4 or j % 5 == 4:
+            board[i][j].player = 1
+    return board
+
+
+def random_acquire(board: Board, rng: random.Random) -> [Position]:
+    """
+    :return: Three random empty positions, or None if there are not enough.
+    """
+    empty = [(i, j) for i, j in open_cells(board) if board[i][j].player == 0]
+    if len(empty) < 3:
+        return None
+    return rng.sample(empty, 3)
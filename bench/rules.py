@@ -0,0 +1,228 @@
+"""
+Benchmarks for the rule engine in model/state.py.
+
+Every rule function and Board.deepcopy is timed on seeded positions for each board size,
+reporting calls per second and the peak memory allocated by a single call.
+Only model.state is imported, so this runs offline without discord.py.
+
+Usage:
+    python -m bench.rules                    run every benchmark
+    python -m bench.rules -k conquer         run benchmarks whose name contains 'conquer'
+    python -m bench.rules --save             store the results as the new baseline
+    python -m bench.rules --compare          compare against the stored baseline
+
+Each result records a fingerprint of the position it ran on, so results for a position that
+has since changed, such as after a change to a board size's bases, are reported as stale
+instead of being compared.
+A baseline is always saved whole from a single run, together with the commit and the board
+layouts it was recorded on. A baseline that mixes runs, or was recorded on other layouts,
+is reported instead of being compared.
+"""
+import argparse
+import hashlib
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from bench.positions import *
+
+default_baseline = Path(__file__).parent.joinpath('baseline.json')
+
+
+class Case(object):
+    """
+    A single benchmark.
+    :param name: Name of the benchmark, including its board size.
+    :param setup: Returns the board to run on.
+    :param run: The operation to time, called with a board.
+    :param mutates: Whether run changes the board, in which case every call gets a fresh copy.
+    """
+
+    def __init__(self, name: str, setup: callable, run: callable, mutates: bool):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.mutates = mutates
+
+
+def attempt_conquest(board: Board):
+    try:
+        board.conquest(1)
+    except InvalidMove:
+        pass
+
+
+def make_cases(rows: int, cols: int) -> [Case]:
+    """
+    :return: The benchmarks for a board of the given size.
+    """
+    size = f'{rows}x{cols}'
+    rng = random.Random(rows * cols)
+    random_pos = random_board(rows, cols, seed=rows * cols)
+    locs = random_acquire(random_pos, rng)
+    lattice = lattice_board(rows, cols)
+    corner = lattice.vanquish_spots(1)[0]
+
+    def fixed(board):
+        return lambda: board
+
+    return [
+        Case(f'deepcopy[random]-{size}', fixed(random_pos), Board.deepcopy, False),
+        Case(f'acquire[random]-{size}', fixed(random_pos), lambda b: b.acquire(1, locs, validate=True), True),
+        Case(f'conquer[random]-{size}', fixed(random_pos), lambda b: b.conquer(1), True),
+        Case(f'conquer[cascade]-{size}', fixed(cascade_board(rows, cols)), lambda b: b.conquer(1), True),
+        Case(f'vanquish_spots[random]-{size}', fixed(random_pos), lambda b: b.vanquish_spots(1), False),
+        Case(f'vanquish_spots[lattice]-{size}', fixed(lattice), lambda b: b.vanquish_spots(1), False),
+        Case(f'is_valid_vanquish[lattice]-{size}', fixed(lattice), lambda b: b.is_valid_vanquish(1, corner), False),
+        Case(f'vanquish[lattice]-{size}', fixed(lattice), lambda b: b.vanquish(1, corner, validate=True), True),
+        Case(f'conquest[flood]-{size}', fixed(flood_board(rows, cols)), attempt_conquest, True),
+        Case(f'conquest[walled]-{size}', fixed(flood_board(rows, cols, walled=True)), attempt_conquest, True),
+        Case(f'move_A[random]-{size}', fixed(random_pos), Move('A', 1, locs=locs), False),
+        Case(f'move_C[cascade]-{size}', fixed(cascade_board(rows, cols)), Move('C', 1), False),
+        Case(f'move_V[lattice]-{size}', fixed(lattice), Move('V', 1, corner=corner), False),
+    ]
+
+
+def fingerprint(board: Board) -> str:
+    """
+    :return: A short hash of the size and cells of a position.
+    """
+    data = bytes([board.rows, board.cols] + [cell.player * 2 + cell.base for row in board for cell in row])
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+def recorded_on() -> {str: str}:
+    """
+    :return: The commit of the working tree, marked dirty if it has changes, and a fingerprint of the empty
+    board of every size, which changes with the layouts.
+    """
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=Path(__file__).parent,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    layouts = hashlib.sha1(''.join(fingerprint(empty_board(rows, cols)) for rows, cols in board_sizes).encode())
+    return {'commit': commit, 'layouts': layouts.hexdigest()[:12]}
+
+
+def time_case(case: Case, min_time: float = 0.2, repeat: int = 3) -> float:
+    """
+    :return: Calls per second, from the best of several timed rounds.
+    """
+    board = case.setup()
+    start = time.perf_counter()
+    case.run(board.deepcopy() if case.mutates else board)
+    single = max(time.perf_counter() - start, 1e-7)
+    number = max(1, int(min_time / single))
+
+    best = math.inf
+    for _ in range(repeat):
+        boards = [board.deepcopy() if case.mutates else board for _ in range(number)]
+        start = time.perf_counter()
+        for b in boards:
+            case.run(b)
+        best = min(best, time.perf_counter() - start)
+    return number / best
+
+
+def peak_allocation(case: Case) -> int:
+    """
+    :return: Peak bytes allocated while making a single call.
+    """
+    board = case.setup()
+    board = board.deepcopy() if case.mutates else board
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        case.run(board)
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def run(keyword: str = None, min_time: float = 0.2) -> {str: {str: float}}:
+    """
+    Runs every benchmark whose name contains the keyword, printing results as they finish.
+    :return: Results by benchmark name.
+    """
+    results = {}
+    print(f'{"benchmark":<40}{"ops/sec":>14}{"peak KiB":>12}')
+    for rows, cols in board_sizes:
+        for case in make_cases(rows, cols):
+            if keyword and keyword not in case.name:
+                continue
+            ops = time_case(case, min_time)
+            peak = peak_allocation(case) / 1024
+            results[case.name] = {'ops': ops, 'peak_kib': peak, 'position': fingerprint(case.setup())}
+            print(f'{case.name:<40}{ops:>14.1f}{peak:>12.1f}')
+    return results
+
+
+def compare(results: {str: {str: float}}, baseline: {str: object}, threshold: float) -> bool:
+    """
+    Prints each result relative to the baseline.
+    :return: True if the baseline was recorded in one run and no benchmark got slower than the threshold allows.
+    """
+    if 'recorded_on' not in baseline:
+        print('The baseline does not say what it was recorded on, record it again with --save.')
+        return False
+    current = recorded_on()
+    print(f'\nbaseline recorded on {baseline["recorded_on"]["commit"]}, comparing with {current["commit"]}')
+    if baseline['recorded_on']['layouts'] != current['layouts']:
+        print('The board layouts changed since the baseline was recorded, record it again with --save.')
+        return False
+    ok = True
+    print(f'{"benchmark":<40}{"ops ratio":>12}{"KiB ratio":>12}')
+    for name, result in results.items():
+        if name not in baseline['results']:
+            print(f'{name:<40}{"new":>12}')
+            continue
+        recorded = baseline['results'][name]
+        if recorded.get('commit') != baseline['recorded_on']['commit']:
+            # an entry from another run would compare against a different machine state
+            print(f'{name:<40}{"mixed":>12}')
+            ok = False
+            continue
+        if recorded['position'] != result['position']:
+            print(f'{name:<40}{"stale":>12}')
+            continue
+        ops_ratio = result['ops'] / recorded['ops']
+        kib_ratio = result['peak_kib'] / recorded['peak_kib'] if recorded['peak_kib'] else 1.0
+        regressed = ops_ratio < 1 - threshold
+        ok = ok and not regressed
+        print(f'{name:<40}{ops_ratio:>12.2f}{kib_ratio:>12.2f}{"  REGRESSED" if regressed else ""}')
+    return ok
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(description='Benchmarks for the Disquid rule engine.')
+    parser.add_argument('-k', dest='keyword', help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timed round')
+    parser.add_argument('--baseline', type=Path, default=default_baseline, help='baseline file')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare the results with the baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='fraction of ops/sec that may be lost before a benchmark counts as regressed')
+    args = parser.parse_args(argv)
+    if args.save and args.keyword:
+        parser.error('a baseline is recorded from every benchmark in one run, so --save cannot be used with -k')
+
+    results = run(args.keyword, args.min_time)
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            return 1
+    if args.save:
+        recorded = recorded_on()
+        for result in results.values():
+            result['commit'] = recorded['commit']
+        with open(args.baseline, 'w') as f:
+            json.dump({'recorded_on': recorded, 'results': results}, f, indent=4, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+End-to-end scenarios that drive DisquidClient through the fake gateway in bench/gateway.py.
+
+Each game is played the way users would play it: a challenge and accept in the lobby channel,
+start in the new game channel, then typed moves until a conquest or the move limit.
+Games run concurrently on one event loop, and the report covers commands per second,
+on_message latency, and outbound API calls per move by route.
+
+Usage:
+    python -m bench.scenarios --games 50
+    python -m bench.scenarios --games 20 --official --latency 0.1 --time-scale 0.01
+    python -m bench.scenarios --games 20 --size large
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from bench.gateway import Gateway
+from bench.selfplay import choose_move, flag_aliases
+from bench.positions import *
+
+
+class ScenarioStats(object):
+
+    def __init__(self):
+        self.commands = 0
+        self.moves = 0
+        self.finished = 0
+        self.latencies: [float] = []
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def deliver(client, gateway: Gateway, stats: ScenarioStats, channel, author, content: str,
+                  mentions: [] = None):
+    """
+    Sends a user message through on_message, timing how long the bot takes to handle it.
+    """
+    start = time.perf_counter()
+    await client.on_message(gateway.message(channel, author, content, mentions))
+    stats.latencies.append(time.perf_counter() - start)
+    stats.commands += 1
+
+
+async def play_game(client, gateway: Gateway, guild, number: int, stats: ScenarioStats,
+                    aliases: {Position, str}, seed: int, max_moves: int, size: str = 'medium'):
+    """
+    Plays a single game from challenge to conquest.
+    """
+    rng = random.Random(seed)
+    prefix = client.get_prefix(guild.id)
+    lobby = guild.text_channels[0]
+    p1 = guild.add_member(f'a{number:04d}')
+    p2 = guild.add_member(f'b{number:04d}')
+    for member in (p1, p2):
+        await deliver(client, gateway, stats, lobby, member, f'{prefix}name {member.name}')
+
+    await deliver(client, gateway, stats, lobby, p1, f'{prefix}c <@{p2.id}> {size}', [p2])
+    await deliver(client, gateway, stats, lobby, p2, f'{prefix}a <@{p1.id}>', [p1])
+    game = next((g for g in client.active_games.values()
+                 if [p.uid for p in g.players] == [p1.id, p2.id]), None)
+    if game is None:
+        return
+    channel = gateway.channels[game.channel_id]
+    await deliver(client, gateway, stats, channel, p1, f'{prefix}start')
+
+    for _ in range(max_moves):
+        if game.channel_id not in client.active_games:
+            stats.finished += 1
+            return
+        # hibernated games are a new object each time they are woken
+        game = client.active_games[game.channel_id]
+        player = game.cache.current_player
+        text = choose_move(game.cache.latest, player, rng, aliases)
+        await deliver(client, gateway, stats, channel, p1 if player == 1 else p2, text)
+        stats.moves += 1
+
+
+async def run(games: int, seed: int, max_moves: int, official: bool, gateway: Gateway,
+              size: str = 'medium') -> ScenarioStats:
+    from botworks import DisquidClient
+
+    if official:
+        guild = gateway.add_guild(DisquidClient.official_guild, 'official')
+        gateway.add_guild(DisquidClient.colors_guild, 'colors', channels=0)
+        gateway.add_guild(DisquidClient.debug_guild, 'debug', channels=0)
+    else:
+        guild = gateway.add_guild()
+    client = gateway.client()
+    aliases = flag_aliases(Layout.of(*Layout.sizes[size]))
+    stats = ScenarioStats()
+    await asyncio.gather(*(play_game(client, gateway, guild, n, stats, aliases, seed + n, max_moves, size)
+                           for n in range(games)))
+    # drop the challenge expiry, channel deletion and auto save timers the bot left behind
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task():
+            task.cancel()
+    return stats
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(description='End-to-end DisquidClient scenarios without Discord.')
+    parser.add_argument('--games', type=int, default=20, help='number of concurrent games')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--max-moves', type=int, default=400, help='moves before a game is abandoned')
+    parser.add_argument('--size', choices=list(Layout.sizes), default='medium', help='board size of every game')
+    parser.add_argument('--official', action='store_true', help='play in the official guild, with roles')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per API call')
+    parser.add_argument('--rate', type=int, default=5, help='calls per route per rate limit period, 0 for none')
+    parser.add_argument('--per', type=float, default=5.0, help='rate limit period in simulated seconds')
+    parser.add_argument('--time-scale', type=float, default=0.001, help='real seconds per simulated second')
+    args = parser.parse_args(argv)
+
+    gateway = Gateway(args.latency, args.rate, args.per, args.time_scale)
+    start = time.perf_counter()
+    stats = asyncio.get_event_loop().run_until_complete(
+        run(args.games, args.seed, args.max_moves, args.official, gateway, args.size))
+    elapsed = time.perf_counter() - start
+
+    counts = gateway.call_counts()
+    total = sum(counts.values())
+    moves = max(stats.moves, 1)
+    print(f'games:          {args.games} ({stats.finished} finished)')
+    print(f'commands:       {stats.commands} ({stats.moves} moves) in {elapsed:.2f}s')
+    print(f'throughput:     {stats.commands / elapsed:.1f} commands/sec')
+    print(f'latency:        p50 {stats.percentile(0.5) * 1000:.2f}ms, p99 {stats.percentile(0.99) * 1000:.2f}ms')
+    print(f'outbound calls: {total} ({total / moves:.2f} per move), {gateway.rate_limited} rate limit waits')
+    for route, count in counts.most_common():
+        print(f'    {route:<16}{count:>8}{count / moves:>8.2f}/move')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Headless self-play for load and throughput testing.
+
+Plays seeded random games end to end through the same calls the bot makes for each message:
+Utility.read_move on the move text, Cache.receive, and rendering the board with str(Game).
+Reports moves per second, per-move latency percentiles and peak memory.
+
+With --fuzz every move is also checked against invariants of the rules, and the first
+violation stops the run with the seed and move number needed to reproduce it.
+
+Usage:
+    python -m bench.selfplay --games 1000 --seed 1
+    python -m bench.selfplay --games 200 --fuzz --memory
+    python -m bench.selfplay --games 100 --size large
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+from bench.positions import *
+from model.game import *
+
+
+class InvariantViolation(Exception):
+    """
+    Thrown when a move leaves the board in a state the rules do not allow.
+    """
+    pass
+
+
+class GameStats(object):
+    """
+    Counts and timings collected over a run.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.moves = 0
+        self.rejected = 0
+        self.latencies: [float] = []
+        self.move_types: {str, int} = {'A': 0, 'C': 0, 'V': 0, 'Q': 0}
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def flag_aliases(layout: Layout = None) -> {Position, str}:
+    """
+    :param layout: Layout of the board, the medium board by default.
+    :return: An alias for every position that read_move translates back to the same position.
+    """
+    layout = layout or Layout.of(Game.standard_height, Game.standard_width)
+    return {(r, c): layout.alias((r, c)) for r in range(layout.rows) for c in range(layout.cols)
+            if layout.alias((r, c)) is not None}
+
+
+def choose_move(board: Board, player: int, rng: random.Random, aliases: {Position, str}) -> str:
+    """
+    Picks the text of a random move, the way a player would type it.
+    The move may still be invalid, for example an early conquest.
+    """
+    roll = rng.random()
+    if roll < 0.08:
+        return 'Q'
+    if roll < 0.25:
+        return 'C'
+    if roll < 0.35:
+        spots = board.vanquish_spots(player)
+        if spots:
+            corner = rng.choice(spots)
+            return f'V {corner[0]} {corner[1]}'
+    locs = random_acquire(board, rng)
+    if locs is None:
+        return 'C'
+    return 'A ' + ' '.join(aliases[loc] for loc in locs)
+
+
+def snapshot(board: Board) -> [(int, bool)]:
+    return [(cell.player, cell.base) for row in board for cell in row]
+
+
+def check_move(before: Board, after: Board, move: Move):
+    """
+    Checks that a move only changed what the rules allow it to change.
+    """
+    old, new = snapshot(before), snapshot(after)
+    cols = before.cols
+    changed = [divmod(k, cols) for k, (a, b) in enumerate(zip(old, new)) if a != b]
+    for i, j in changed:
+        was, now = before[i][j], after[i][j]
+        if was.base and move.move_type != 'Q':
+            raise InvariantViolation(f'{move.move_type} changed base cell {(i, j)}')
+        if move.move_type == 'A' and (was.player != 0 or (i, j) not in [tuple(loc) for loc in move.locs]):
+            raise InvariantViolation(f'acquire changed {(i, j)} which was not an empty target')
+        if move.move_type == 'C' and (was.player != 3 - move.player or now.player != move.player):
+            raise InvariantViolation(f'conquer changed {(i, j)} from {was.player} to {now.player}')
+        if move.move_type == 'V':
+            top, left = move.corner
+            if not (top <= i < top + 4 and left <= j < left + 4) or now.player != 0:
+                raise InvariantViolation(f'vanquish of {move.corner} changed {(i, j)}')
+    if move.move_type == 'Q':
+        check_conquest_path(after, changed, move.player)
+
+
+def check_conquest_path(board: Board, path: [Position], player: int):
+    """
+    Checks that the cells marked by a conquest join the player's base to the enemy base.
+    """
+    if any(board[i][j].player != player or not board[i][j].base for i, j in path):
+        raise InvariantViolation('conquest marked a cell it does not own')
+    # walk from the player's base over the marked path, then look for the enemy base
+    reached = set()
+    frontier = [pos for pos in path if any(
+        board[i][j].base and board[i][j].player == player and (i, j) not in path
+        for i, j in board.adjacent(pos, base=True))]
+    while frontier:
+        pos = frontier.pop()
+        if pos in reached:
+            continue
+        reached.add(pos)
+        frontier.extend(adj for adj in board.adjacent(pos, base=True) if adj in path)
+    enemy = 3 - player
+    if not any(board[i][j].base and board[i][j].player == enemy
+               for pos in reached for i, j in board.adjacent(pos, base=True)):
+        raise InvariantViolation('conquest path does not reach the enemy base')
+
+
+def play_game(seed: int, stats: GameStats, aliases: {Position, str}, max_moves: int, render: bool,
+              fuzz: bool, size: str = 'medium'):
+    """
+    Plays a single game until a conquest or the move limit.
+    """
+    rng = random.Random(seed)
+    game = Game(seed, [Player(1), Player(2)], *Layout.sizes[size])
+    cache = game.cache
+    for turn in range(max_moves):
+        player = cache.current_player
+        text = choose_move(cache.latest, player, rng, aliases)
+        # moves change the latest board in place
+        before = cache.latest.deepcopy() if fuzz else None
+        start = time.perf_counter()
+        try:
+            move = Utility.read_move(player, text, game.layout)
+            cache.receive(move)
+            if render:
+                str(game)
+        except InvalidMove:
+            stats.rejected += 1
+            continue
+        finally:
+            cache.move = None
+        stats.latencies.append(time.perf_counter() - start)
+        stats.moves += 1
+        stats.move_types[move.move_type] += 1
+        if fuzz:
+            try:
+                check_move(before, cache.latest, move)
+            except InvariantViolation as e:
+                raise InvariantViolation(f'game seed {seed}, move {turn} ({text!r}): {e}')
+        if move.move_type == 'Q':
+            stats.wins += 1
+            break
+        cache.current_player = 3 - player
+    stats.games += 1
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(description='Headless Disquid self-play.')
+    parser.add_argument('--games', type=int, default=100, help='number of games to play')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--max-moves', type=int, default=400, help='moves before a game is abandoned')
+    parser.add_argument('--no-render', dest='render', action='store_false', help='skip rendering boards')
+    parser.add_argument('--fuzz', action='store_true', help='check rule invariants after every move')
+    parser.add_argument('--memory', action='store_true', help='trace peak memory, which slows the run')
+    parser.add_argument('--size', choices=list(Layout.sizes), default='medium', help='board size')
+    args = parser.parse_args(argv)
+
+    aliases = flag_aliases(Layout.of(*Layout.sizes[args.size]))
+    stats = GameStats()
+    if args.memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        for seed in range(args.seed, args.seed + args.games):
+            play_game(seed, stats, aliases, args.max_moves, args.render, args.fuzz, args.size)
+    except InvariantViolation as e:
+        print(f'Invariant violated in {e}')
+        return 1
+    elapsed = time.perf_counter() - start
+
+    print(f'games:        {stats.games} ({stats.wins} won by conquest)')
+    print(f'moves:        {stats.moves} accepted, {stats.rejected} rejected')
+    print(f'move types:   {stats.move_types}')
+    print(f'throughput:   {stats.moves / elapsed:.1f} moves/sec, {stats.games / elapsed:.2f} games/sec')
+    print(f'latency:      p50 {stats.percentile(0.5) * 1000:.3f}ms, p99 {stats.percentile(0.99) * 1000:.3f}ms')
+    if args.memory:
+        print(f'peak memory:  {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MiB')
+        tracemalloc.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
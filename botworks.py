@@ -1,9 +1,28 @@
 import asyncio
-import glob
+import io
 import pickle
+import threading
+import time
+import discord
 from discord import Intents
 
+from model.archive import GameArchive
+from model.book import OpeningBook, EndgameCache
+from model.challenges import ChallengeRegistry
 from model.game import *
+from model.hibernation import ActiveGames
+from model.hints import compute_hint, move_text
+from model.matchmaking import MatchmakingPool
+from model.names import NameIndex
+from model.render import BoardRenderer, rgb
+from model.ranking import RankIndex
+from model.reindex import Reindexer
+from runtime.metrics import metrics
+from runtime.pools import ResourcePool, save_pools, load_pools
+from runtime.profiler import LoopMonitor, SamplingProfiler
+from runtime.replays import ReplayBuilder
+from runtime.scheduler import Scheduler
+from runtime.store import SharedStore, PlayerStore, PrefixStore, GuildSettings
 
 __version__ = 'v1.0'
 
@@ -77,6 +96,19 @@ class DisquidClient(discord.Client):
     default_prefix = '*'
     data_path = Path('data/')
     auto_save_duration = 300  # in seconds
+    challenge_duration = 300  # in seconds
+    channel_delete_delay = 3600  # in seconds
+    matchmaking_interval = 5  # in seconds, between pairing batches
+    matchmaking_retry_delay = 60  # in seconds, before pairing again after a game could not be set up
+    pool_size = 8  # free game channels and color roles kept per guild and category or color
+    hibernate_interval = 3600  # in seconds, between checks for idle games
+    hibernate_after = 6  # in hours without a move, before a game is written to disk
+    max_resident_games = 1000  # games kept in memory, beyond which the least recently used are written to disk
+    reindex_page_size = 100  # messages fetched per history request
+    welcome_text = 'Game creation success!'  # start of the first message of every game, which reindex looks for
+    metrics_port = 9108  # local port serving timings for Prometheus
+    lag_threshold = 0.5  # in seconds, event loop lag that gets logged
+    max_profile_duration = 60  # in seconds
     admins: []
     debug_guild = 762071050007609344
     colors_guild = 764673692650831893
@@ -97,16 +129,27 @@ class DisquidClient(discord.Client):
     def __init__(self, prefix_file_name: str = 'prefixes', admin_file_name: str = 'admins',
                  player_file_name: str = 'players', game_file_name: str = 'games',
                  history_file_name: str = 'history', video_dir_name: str = 'videos',
-                 rank_file_name: str = 'ranks',
+                 rank_file_name: str = 'ranks', store_file_name: str = 'shared',
+                 book_file_name: str = 'book', timer_file_name: str = 'timers', pool_file_name: str = 'pools',
+                 hibernation_dir_name: str = 'hibernated',
                  **options):
         super().__init__(**options)
-        self.prefix_file = DisquidClient.data_path.joinpath(prefix_file_name + '.json')
-        self.admin_file = DisquidClient.data_path.joinpath(admin_file_name + '.json')
-        self.player_file = DisquidClient.data_path.joinpath(player_file_name + '.pickle')
-        self.game_file = DisquidClient.data_path.joinpath(game_file_name + '.pickle')
-        self.history_file = DisquidClient.data_path.joinpath(history_file_name + '.pickle')
-        self.video_dir = DisquidClient.data_path.joinpath(video_dir_name + '/')
-        self.ranks_file = DisquidClient.data_path.joinpath(rank_file_name + '.json')
+        # Shard processes share players and prefixes, and keep their own games
+        shard_id = options.get('shard_id')
+        shard_suffix = '' if shard_id is None else f'-{shard_id}'
+        self.prefix_file = self.data_path.joinpath(prefix_file_name + '.json')
+        self.admin_file = self.data_path.joinpath(admin_file_name + '.json')
+        self.player_file = self.data_path.joinpath(player_file_name + '.pickle')
+        self.store_file = self.data_path.joinpath(store_file_name + '.db')
+        self.game_file = self.data_path.joinpath(game_file_name + shard_suffix + '.pickle')
+        self.history_file = self.data_path.joinpath(history_file_name + '.pickle')
+        self.history_dir = self.data_path.joinpath(history_file_name + '/')
+        self.video_dir = self.data_path.joinpath(video_dir_name + '/')
+        self.ranks_file = self.data_path.joinpath(rank_file_name + '.json')
+        self.book_file = self.data_path.joinpath(book_file_name + '.dqb')
+        self.timer_file = self.data_path.joinpath(timer_file_name + shard_suffix + '.json')
+        self.pool_file = self.data_path.joinpath(pool_file_name + shard_suffix + '.json')
+        self.hibernation_dir = self.data_path.joinpath(hibernation_dir_name + '/')
 
         # Data directory loading
         if not os.path.exists(self.data_path):
@@ -114,16 +157,22 @@ class DisquidClient(discord.Client):
 
         if not os.path.exists(self.video_dir):
             os.mkdir(self.video_dir)
-
-        # Prefix file loading
-        if not os.path.exists(self.prefix_file):
-            with open(self.prefix_file, 'w') as f:
-                json.dump({}, f)
-            self.prefixes: {int, str} = {}
-        else:
+        self.replays = ReplayBuilder(self.video_dir, self.data_path.joinpath('temp/'))
+        self.regen_task: asyncio.Future = None
+
+        # Shared store loading
+        self.store = SharedStore(self.store_file)
+        self.prefixes = PrefixStore(self.store)
+        # how each guild's boards are drawn, as emoji messages or as one image
+        self.renderers = GuildSettings(self.store, 'renderer', 'emoji')
+        self.players = PlayerStore(self.store)
+
+        # Prefix file importing
+        if os.path.exists(self.prefix_file):
             with open(self.prefix_file, 'r') as f:
                 temp: {} = json.load(f)
-                self.prefixes = {int(k): v for k, v in temp.items()}
+                self.prefixes.import_prefixes({int(k): v for k, v in temp.items()})
+            os.replace(self.prefix_file, str(self.prefix_file) + '.imported')
 
         # Admin id file loading:
         if not os.path.exists(self.admin_file):
@@ -136,75 +185,98 @@ class DisquidClient(discord.Client):
                 temp: [] = json.load(f)
                 DisquidClient.admins = [int(i) for i in temp]
 
-        # Player file loading
-        if not os.path.exists(self.player_file):
-            with open(self.player_file, 'wb') as f:
-                pickle.dump({}, f)
-            self.players: {int, Player} = {}
-        else:
+        # Player file importing
+        if os.path.exists(self.player_file):
             with open(self.player_file, 'rb') as f:
-                self.players: {int, Player} = pickle.load(f)
+                self.players.import_players(pickle.load(f))
+            os.replace(self.player_file, str(self.player_file) + '.imported')
+
+        self.names = NameIndex(self.players.names())
 
         # Active Challenge list
-        self.active_challenges: [Challenge] = []
-        self.queued_player = None
+        self.active_challenges = ChallengeRegistry()
+        self.matchmaking = MatchmakingPool()
 
         # Active Game file loading
-        if not os.path.exists(self.game_file):
+        # A shard starting for the first time takes its games from the unsharded file in on_ready
+        unsharded_game_file = self.data_path.joinpath(game_file_name + '.pickle')
+        self.claim_games = (shard_id is not None and not os.path.exists(self.game_file)
+                            and os.path.exists(unsharded_game_file))
+        if self.claim_games:
+            with open(unsharded_game_file, 'rb') as f:
+                games: {int, Game} = pickle.load(f)
+        elif not os.path.exists(self.game_file):
             with open(self.game_file, 'wb') as f:
                 pickle.dump({}, f)
-            self.active_games: {int, Game} = {}
+            games: {int, Game} = {}
         else:
             with open(self.game_file, 'rb') as f:
-                self.active_games: {int, Game} = pickle.load(f)
-
-        # Active Game file loading
-        if not os.path.exists(self.history_file):
-            with open(self.history_file, 'wb') as f:
-                pickle.dump([], f)
-                self.game_history: [Game] = []
-        else:
-            with open(self.history_file, 'rb') as f:
-                self.game_history: [Game] = pickle.load(f)
+                games: {int, Game} = pickle.load(f)
+        # Idle games are kept on disk and read back on the next message in their channel
+        self.active_games = ActiveGames(self.hibernation_dir, self.players, games,
+                                        max_resident=DisquidClient.max_resident_games)
 
-        self.ranks = self.rank_arr(self.players)
+        # Game history, loaded per game when needed
+        self.game_history = GameArchive(self.history_dir, self.players,
+                                        legacy_file=self.history_file if not shard_id else None,
+                                        index_name='index' + shard_suffix)
 
-        # Adding auto save
-        async def auto_save(duration: int):
-            while True:
-                await asyncio.sleep(duration)
-                await self.save(bypass=True)
-
-        asyncio.run_coroutine_threadsafe(auto_save(DisquidClient.auto_save_duration), asyncio.get_event_loop())
-
-    def rank_arr(self, d: {}):
-        """
-        :return: an array in order of ELO of the players
-        """
-        arr = []
-        for key in d:
-            arr.append(d[key])
-
-        def val(p):
-            return p.elo
+        self.ranks = RankIndex(self.players.values())
 
-        arr.sort(key=val, reverse=True)
-        return arr
+        # Opening book, built offline with model/book.py, and solved endgames
+        self.book = None
+        if os.path.exists(self.book_file):
+            try:
+                self.book = OpeningBook(self.book_file)
+            except InvalidRecord:
+                print(f'Ignoring unreadable opening book {self.book_file}.')
+        self.endgame = EndgameCache()
+
+        # Game channels and color roles of finished games, kept for new games
+        self.channel_pool = ResourcePool(DisquidClient.pool_size)
+        self.role_pool = ResourcePool(DisquidClient.pool_size)
+        load_pools(self.pool_file, {'channels': self.channel_pool, 'roles': self.role_pool})
+        # estimated color of every emoji, since estimating a custom emoji downloads it
+        self.emoji_colors: {str, int} = {}
+
+        # Timers, including those pending when the bot last stopped
+        self.scheduler = Scheduler()
+        self.scheduler.register('auto_save', self.auto_save)
+        self.scheduler.register('expire_challenge', self.expire_challenge)
+        self.scheduler.register('delete_channel', self.delete_channel)
+        self.scheduler.register('match_players', self.match_players)
+        self.scheduler.register('hibernate_games', self.hibernate_games)
+        self.scheduler.load(self.timer_file)
+        self.scheduler.schedule('auto_save', DisquidClient.auto_save_duration)
+        self.scheduler.schedule('hibernate_games', DisquidClient.hibernate_interval)
+        asyncio.run_coroutine_threadsafe(self.scheduler.run(), asyncio.get_event_loop())
+
+        self.loop_monitor = LoopMonitor(asyncio.get_event_loop(), DisquidClient.lag_threshold)
+        self.metrics_port = DisquidClient.metrics_port + (shard_id or 0)
 
     async def regen_videos(self):
         """
-        Clears video dir and regenerates all of the videos.
-        """
-        for game in self.game_history:
-            game.to_video(self.data_path.joinpath('temp/'), self.video_dir)
-        replays = []
-        for file in os.listdir(self.video_dir):
-            if str(file).split('.')[-1] == 'mp4':
-                replays.append(file)
-        for replay in replays:
-            with open(self.video_dir.joinpath(replay), 'rb') as f:
-                attachment = discord.File(f)
-                await self.get_channel(DisquidClient.replay_channel).send(replay, file=attachment)
+        Renders the replays of archived games without an up to date video, in parallel, and posts the new ones.
+        """
+        # reading every archived game is slow, so it is done off the event loop, without looking up players,
+        # whose store can only be used from this thread
+        games = await asyncio.get_event_loop().run_in_executor(None, self.replays.stale, self.game_history.games({}))
+        for game in games:
+            game.players = [self.players[player.uid] if player.uid in self.players else player
+                            for player in game.players]
+        if games:
+            print(f'Rendering {len(games)} replays.')
+            await self.replays.build(games)
+        replay_channel = self.get_channel(DisquidClient.replay_channel)
+        for game_id in self.replays.unposted():
+            await self.post_replay(replay_channel, game_id)
+
+    async def post_replay(self, replay_channel: discord.TextChannel, game_id: int):
+        replay = self.replays.manifest[game_id]['name']
+        with open(self.replays.path(game_id), 'rb') as f:
+            attachment = discord.File(f, filename=replay)
+            await replay_channel.send(replay, file=attachment)
+        self.replays.mark_posted(game_id)
 
     def get_prefix(self, gid: discord.Guild.id):
         """
@@ -226,7 +298,7 @@ class DisquidClient(discord.Client):
             return self.players[uid]
         except KeyError:
             self.players[uid] = Player(uid)
-            self.ranks.append(self.get_player(uid))
+            self.ranks.add(self.get_player(uid))
             return self.get_player(uid)
 
     async def make_player_role(self, gid: discord.Guild.id, uid: discord.User.id):
@@ -243,19 +315,7 @@ class DisquidClient(discord.Client):
         """
         Takes in a player's name and returns a uid
         """
-        for key in self.players:
-            if self.players[key].name == name:
-                return key
-        return 0
-
-    @save_action
-    def save_prefixes(self):
-        """
-        Saves current dict of prefixes to a file using JSON.
-        """
-        with open(self.prefix_file, 'w') as f:
-            f.truncate(0)
-            json.dump(self.prefixes, f, indent=4)
+        return self.names.lookup(name)
 
     @save_action
     def save_admins(self):
@@ -269,29 +329,150 @@ class DisquidClient(discord.Client):
     @save_action
     def save_players(self):
         """
-        Saves current dict of players to a file using pickle.
+        Writes changed players to the shared store.
+        Prefixes and Elo are written to the store as soon as they change.
         """
-        with open(self.player_file, 'wb') as f:
-            f.truncate(0)
-            pickle.dump(self.players, f)
+        self.players.flush()
+
+    def refresh_players(self):
+        """
+        Picks up the Elo and names other shard processes have written to the shared store.
+        """
+        for player, old_name in self.players.refresh():
+            self.ranks.update(player)
+            self.names.rename(player.uid, old_name, player.name)
 
     @save_action
     def save_games(self):
         """
-        Saves current dict of players to a file using pickle.
+        Saves the games in memory to a file using pickle. Hibernated games are already on disk.
         """
         with open(self.game_file, 'wb') as f:
             f.truncate(0)
-            pickle.dump(self.active_games, f)
+            pickle.dump(self.active_games.resident(), f)
+
+    @save_action
+    def save_timers(self):
+        """
+        Saves pending timers, so they still fire after a restart.
+        """
+        self.scheduler.save(self.timer_file)
+
+    async def auto_save(self):
+        self.scheduler.schedule('auto_save', DisquidClient.auto_save_duration)
+        await self.save(bypass=True)
+        self.refresh_players()
+
+    async def hibernate_games(self):
+        self.scheduler.schedule('hibernate_games', DisquidClient.hibernate_interval)
+        count = self.active_games.hibernate_idle(datetime.timedelta(hours=DisquidClient.hibernate_after))
+        if count:
+            print(f'Hibernated {count} idle games, {len(self.active_games)} still in memory.')
+            self.save_games()
+
+    async def expire_challenge(self, channel_id: int, p1_id: int, p2_id: int):
+        chal = self.active_challenges.pop(p1_id, p2_id)
+        if chal is not None:
+            channel = self.get_channel(channel_id)
+            if channel is not None:
+                await channel.send(f'Challenge between {chal.p1.name} and {chal.p2.name} expired.')
+
+    async def match_players(self):
+        """
+        Challenges every pair of queued players the matchmaking pool can pair, and accepts for them.
+        """
+        channel = self.get_channel(DisquidClient.matchmaking_channel)
+        failed = False
+        for p1, p2 in self.matchmaking.pair():
+            chal = Challenge(p1, p2, ['medium'])
+            self.active_challenges.add(chal)
+            game = None
+            try:
+                if channel is not None:
+                    game = await self.confirm_challenge(channel, chal)
+            except Exception as e:
+                print(f'Matchmaking game for {p1.uid} and {p2.uid} failed: {e!r}')
+            if game is None:
+                # the players go back in the queue rather than silently dropping out of matchmaking
+                self.active_challenges.pop(p1.uid, p2.uid)
+                self.matchmaking.requeue((p1, p2))
+                failed = True
+        if len(self.matchmaking):
+            delay = DisquidClient.matchmaking_retry_delay if failed else DisquidClient.matchmaking_interval
+            self.scheduler.schedule('match_players', delay)
+
+    async def delete_channel(self, channel_id: int):
+        channel = self.get_channel(channel_id)
+        if channel is not None:
+            await channel.delete(reason='Game Complete')
+
+    async def retire_channel(self, channel: discord.TextChannel):
+        """
+        Returns the channel of a finished game to the pool, or schedules it for deletion if the pool is full.
+        """
+        if self.channel_pool.give((channel.guild.id, channel.category_id), channel.id):
+            await channel.send('Game over! This game has been moved to game history, '
+                               'and the channel will be reused for a later game.')
+            return
+        await channel.send('Channel will be deleted in 1hr, and has been moved to game history.')
+        self.scheduler.schedule('delete_channel', DisquidClient.channel_delete_delay, channel.id, channel.id)
+
+    async def take_game_channel(self, guild: discord.Guild, category, name: str) -> discord.TextChannel:
+        """
+        Renames a pooled channel for a new game, or creates one if the pool has none.
+        """
+        key = (guild.id, category.id if category else None)
+        channel_id = self.channel_pool.take(key)
+        while channel_id is not None:
+            channel = self.get_channel(channel_id)
+            if channel is not None:
+                await channel.edit(name=name)
+                return channel
+            channel_id = self.channel_pool.take(key)
+        return await guild.create_text_channel(name, category=category)
+
+    async def take_color_role(self, guild: discord.Guild, color: int) -> discord.Role:
+        """
+        Takes a pooled role of the given color, or creates one if the pool has none.
+        Roles are named by their color, so they can be reused by any game.
+        """
+        role_id = self.role_pool.take((guild.id, color))
+        while role_id is not None:
+            role = guild.get_role(role_id)
+            if role is not None:
+                return role
+            role_id = self.role_pool.take((guild.id, color))
+        return await guild.create_role(name=f'#{color:06x}', color=discord.Color(color))
+
+    async def release_roles(self, guild: discord.Guild, game: Game):
+        """
+        Takes the color roles of a game from its players and returns them to the pool,
+        or deletes them if the pool is full.
+        """
+        for player, role_id in zip(game.players, game.role_ids):
+            role = guild.get_role(role_id) if role_id else None
+            if role is None:
+                continue
+            member = guild.get_member(player.uid)
+            if member is not None:
+                await member.remove_roles(role)
+            if not self.role_pool.give((guild.id, role.color.value), role.id):
+                await role.delete()
+        game.role_ids = [None, None]
+
+    @save_action
+    def save_pools(self):
+        """
+        Saves the pooled channels and roles.
+        """
+        save_pools(self.pool_file, {'channels': self.channel_pool, 'roles': self.role_pool})
 
     @save_action
     def save_history(self):
         """
-        Saves current dict of players to a file using pickle.
+        Saves newly finished games to the game archive.
         """
-        with open(self.history_file, 'wb') as f:
-            f.truncate(0)
-            pickle.dump(self.game_history, f)
+        self.game_history.save()
 
     async def on_ready(self):
         """
@@ -301,9 +482,21 @@ class DisquidClient(discord.Client):
         print(f'Disquid {__version__} ready.')
         if self.get_channel(764699769829982218) is not None:
             await self.get_channel(764699769829982218).send(f'Disquid {__version__} is now online and ready.')
-        #if len(self.game_history) > len(glob.glob(str(self.video_dir.joinpath('*.mp4')))):
-        #    print(len(self.game_history))
-        #    await self.regen_videos()
+        if self.claim_games:
+            # keep only the games in this shard's guilds
+            for cid in [cid for cid in self.active_games if self.get_channel(cid) is None]:
+                self.active_games.forget(cid)
+            self.claim_games = False
+            self.save_games()
+        self.loop_monitor.start()
+        try:
+            await metrics.serve(port=self.metrics_port)
+        except OSError:
+            print(f'Metrics port {self.metrics_port} is unavailable.')
+        if self.get_channel(DisquidClient.replay_channel) is not None and (
+                self.regen_task is None or self.regen_task.done()):
+            # only the process that posts replays renders missing ones, once however often it reconnects
+            self.regen_task = asyncio.ensure_future(self.regen_videos())
 
     async def on_guild_join(self, guild: discord.Guild):
         """
@@ -333,8 +526,10 @@ class DisquidClient(discord.Client):
         prefix = self.get_prefix(message.guild.id)
         if len(str(message.content)) >= len(prefix) and prefix == str(message.content)[0:len(prefix)]:
             cmd = str(message.content).strip(prefix).split()[0].lower()
+            name = commands[cmd].__name__ if cmd in commands else 'unknown'
             try:
-                await commands[cmd](self, message=message)
+                with metrics.timer('disquid_command_seconds', command=name):
+                    await commands[cmd](self, message=message)
             except KeyError:
                 print('User tried nonexistent command')
         else:
@@ -392,8 +587,10 @@ class DisquidClient(discord.Client):
                     await message.channel.send('Not your turn!')
                 return
             try:
-                move = Utility.read_move(game.cache.current_player, message.content)
-                cache.receive(move)
+                move = Utility.read_move(game.cache.current_player, message.content, game.layout)
+                with metrics.timer('disquid_move_seconds', move=move.move_type) as timing:
+                    cache.receive(move)
+                metrics.add('disquid_game_seconds_total', timing.elapsed, channel=game.channel_id)
                 if not reindexing:
                     await message.channel.send('Move Success!')
                 # Test for win condition
@@ -416,7 +613,7 @@ class DisquidClient(discord.Client):
             except InvalidMove:
                 move_prefix = message.content.split()[0]
                 if move_prefix == 'V' and not reindexing:
-                    vanquish_spots: str = Utility.format_locations(cache.latest.vanquish_spots(cache.current_player),
+                    vanquish_spots: str = Utility.format_locations(cache.vanquish_spots(cache.current_player),
                                                                    game)
                     await message.channel.send('Vanquish options:\n' + vanquish_spots)
                 else:
@@ -498,8 +695,8 @@ class DisquidClient(discord.Client):
         """
         Returns color that estimates prominent color of emoji
         """
-        c_guild = self.get_guild(self.colors_guild)
-        d_guild = self.get_guild(self.debug_guild)
+        if emoji_name in self.emoji_colors:
+            return self.emoji_colors[emoji_name]
         emoji = None
         emoji_opts = {
             ':black_large_square:': 0x31373d,
@@ -514,12 +711,10 @@ class DisquidClient(discord.Client):
             ':purple_square:': 0xaa8ed6,
             ':white_large_square:': 0xe6e7e8
         }
-        for e in c_guild.emojis:
-            if str(e) == emoji_name:
-                emoji = e
-        for e in d_guild.emojis:
-            if str(e) == emoji_name:
-                emoji = e
+        for guild in (self.get_guild(self.colors_guild), self.get_guild(self.debug_guild)):
+            for e in guild.emojis if guild else []:
+                if str(e) == emoji_name:
+                    emoji = e
         if emoji is not None:
             color = Utility.color_estimate(await emoji.url.read())
         elif emoji_name in emoji_opts.keys():
@@ -528,7 +723,7 @@ class DisquidClient(discord.Client):
             color = 0xffffff
         if color == 0:
             color = 65793
-        print(color)
+        self.emoji_colors[emoji_name] = color
         return color
 
     @command(['changeprefix', 'cp'])
@@ -549,6 +744,22 @@ class DisquidClient(discord.Client):
         else:
             await message.channel.send('Only administrators may do this.')
 
+    @command(['renderer', 'render'])
+    async def change_renderer(self, message: discord.Message):
+        """
+        [emoji/image] Usable by admins to choose whether boards are sent as emoji or as one image.
+        """
+        if message.author.guild_permissions.administrator:
+            processed_message = str(message.content).split()
+            del processed_message[0]
+            if len(processed_message) != 1 or processed_message[0].lower() not in ('emoji', 'image'):
+                await message.channel.send('Boards can be sent as \'emoji\' or as an \'image\'.')
+                return
+            self.renderers[message.guild.id] = processed_message[0].lower()
+            await message.channel.send(f'Boards are now sent as {processed_message[0].lower()}.')
+        else:
+            await message.channel.send('Only administrators may do this.')
+
     @command(['profile'])
     async def player_profile(self, message: discord.Message):
         """
@@ -584,7 +795,7 @@ class DisquidClient(discord.Client):
                     f'\n\nSecondary Emojis (tile, base)\n{str(player.emoji[1]).strip("[").strip("]")}' \
                     f'\n\nCustom Emojis\n{str(custom_emoji_strings).strip("[").strip("]").strip(",")}'
         embed_var.add_field(name='Emojis', value=emoji_str, inline=False)
-        embed_var.add_field(name='Rank', value=f'#{self.ranks.index(player) + 1}/{len(self.players)} Worldwide',
+        embed_var.add_field(name='Rank', value=f'#{self.ranks.rank(player) + 1}/{len(self.players)} Worldwide',
                             inline=False)
         title = None
         for role_name, role_id in zip(self.title_roles.keys(), self.title_roles.values()):
@@ -603,9 +814,7 @@ class DisquidClient(discord.Client):
         """
         embed_var = discord.Embed(title='Worldwide Leaderboard', color=0xc0365e)
         leaderboard_str = ''
-        for i, player in enumerate(self.ranks):
-            if i > 9:
-                break
+        for player in self.ranks.top(10):
             leaderboard_str += f'`[{player.elo}]`: {player.name}\n'
         embed_var.add_field(name='Top 10', value=leaderboard_str, inline=False)
         await message.channel.send(embed=embed_var)
@@ -613,12 +822,15 @@ class DisquidClient(discord.Client):
     @command(['c'])
     async def challenge(self, message: discord.Message):
         """
-        [@mention/name] Initiates a challenge against another player.
+        [@mention/name] [small/medium/large] Initiates a challenge against another player.
         """
         p1_id = message.author.id
         mentions: [discord.Member] = message.mentions
         processed_message = str(message.content).split()
         del processed_message[0]
+        size = 'medium'
+        if processed_message and processed_message[-1].lower() in Layout.sizes:
+            size = processed_message.pop().lower()
         if len(mentions) == 1:
             p2_id = mentions[0].id
             chal = Challenge(self.get_player(p1_id), self.get_player(p2_id))
@@ -637,20 +849,17 @@ class DisquidClient(discord.Client):
                                        'challenge failed.')
             return
 
-        async def del_challenge():
-            await asyncio.sleep(300)
-            if chal in self.active_challenges:
-                await message.channel.send(f'Challenge between {chal.p1.name} and {chal.p2.name} expired.')
-                self.active_challenges.remove(chal)
-
-        self.active_challenges.append(Challenge(self.get_player(p1_id), self.get_player(p2_id)))
-        asyncio.run_coroutine_threadsafe(del_challenge(), asyncio.get_event_loop())
-        await message.channel.send(f'{chal.p1.name} challenges {chal.p2.name} they have 5 minutes to accept.')
+        chal.game_args = [size]
+        self.active_challenges.add(chal)
+        self.scheduler.schedule('expire_challenge', DisquidClient.challenge_duration, (chal.p1.uid, chal.p2.uid),
+                                message.channel.id, chal.p1.uid, chal.p2.uid)
+        await message.channel.send(f'{chal.p1.name} challenges {chal.p2.name} to a {size} game, '
+                                   f'they have 5 minutes to accept.')
 
     @command(['a'])
     async def accept(self, message: discord.Message):
         """
-        [@mention/name] Accepts an existing challenge from another user.
+        [@mention/name] Accepts an existing challenge from another user, or the only one if there is one.
         """
         p2_id = message.author.id
         mentions: [discord.Member] = message.mentions
@@ -669,11 +878,18 @@ class DisquidClient(discord.Client):
             else:
                 message.channel.send('Player does not exist!')
                 return
+        elif len(mentions) == 0 and len(processed_message) == 0:
+            challenges = self.active_challenges.challengers_of(p2_id)
+            if len(challenges) != 1:
+                await message.channel.send(f'You have {len(challenges)} open challenges, '
+                                           f'mention or name the player to accept.')
+                return
+            temp_chal = challenges[0]
         else:
             await message.channel.send('Too many or too few players mentioned, '
                                        'accept failed.')
             return
-        await self.confirm_challenge(message, temp_chal)
+        await self.confirm_challenge(message.channel, temp_chal)
 
     @command(['q'])
     async def queue(self, message: discord.Message):
@@ -682,48 +898,60 @@ class DisquidClient(discord.Client):
         """
         if not message.channel.id == DisquidClient.matchmaking_channel:
             return
-        id = message.author.id
-        if not self.queued_player:
-            self.queued_player = self.get_player(id)
-            await message.channel.send('Player is now queued for a challenge.')
+        if not self.matchmaking.join(self.get_player(message.author.id)):
+            await message.channel.send('Player is already queued')
+            return
+        await message.channel.send(f'Player is now queued for a challenge, {len(self.matchmaking)} waiting.')
+        if ('match_players', None) not in self.scheduler:
+            self.scheduler.schedule('match_players', DisquidClient.matchmaking_interval)
+
+    @command(['unqueue', 'uq'])
+    async def unqueue(self, message: discord.Message):
+        """
+        Removes current user from challenge queue.
+        """
+        if self.matchmaking.leave(message.author.id):
+            await message.channel.send('Player is no longer queued.')
         else:
-            p2 = self.get_player(id)
-            if p2 == self.queued_player:
-                await message.channel.send('Player is already queued')
-                return
-            chal = Challenge(self.queued_player, p2)
-            self.active_challenges.append(chal)
-            self.queued_player = None
-            await self.confirm_challenge(message, chal)
-
-    async def confirm_challenge(self, message: discord.Message, chal: Challenge):
-        for c in self.active_challenges:
-            if chal == c:
-                channel = message.channel
-                guild = channel.guild
-                category = None
-                category_id = channel.category_id if not guild.id == self.official_guild else 764879389648617522
-                for ca in guild.categories:
-                    if ca.id == category_id:
-                        category = ca
-                        break
-                try:
-                    channel = await guild.create_text_channel(f'{c.p1.name}-v-{c.p2.name}', category=category)
-                except discord.errors.Forbidden:
-                    await message.channel.send(
-                        'I don\'t have permissions to create game channels!')
-                    return
-                try:
-                    new_game = Game(channel.id, [c.p1, c.p2])
-                    self.active_games[channel.id] = new_game
-                except InvalidGameSetup:
-                    await message.channel.send('Invalid game setup... aborting.')
-                    return
-                await message.channel.send(
-                    f'Challenge accepted! Game started in <#{channel.id}>')
-                await channel.send(
-                    f'Game creation success! Welcome to Conquid!. Type {self.get_prefix(guild.id)}start to begin.')
-                self.active_challenges.remove(c)
+            await message.channel.send('Player is not queued.')
+
+    async def confirm_challenge(self, lobby: discord.TextChannel, chal: Challenge) -> Game:
+        """
+        Sets up the game of an accepted challenge in a new game channel.
+        :return: The new game, or None if it could not be set up.
+        """
+        c = self.active_challenges.get(chal.p1.uid, chal.p2.uid)
+        if c is None:
+            return
+        guild = lobby.guild
+        category = None
+        category_id = lobby.category_id if not guild.id == self.official_guild else 764879389648617522
+        for ca in guild.categories:
+            if ca.id == category_id:
+                category = ca
+                break
+        try:
+            channel = await self.take_game_channel(guild, category, f'{c.p1.name}-v-{c.p2.name}')
+        except discord.errors.Forbidden:
+            await lobby.send(
+                'I don\'t have permissions to create game channels!')
+            return
+        try:
+            size = c.game_args[0] if c.game_args else 'medium'
+            new_game = Game(channel.id, [c.p1, c.p2], *Layout.sizes[size])
+        except InvalidGameSetup:
+            await lobby.send('Invalid game setup... aborting.')
+            return
+        welcome = await channel.send(
+            f'{DisquidClient.welcome_text} Welcome to Conquid!. Type {self.get_prefix(guild.id)}start to begin.')
+        # channels are reused, so the game is known by its first message, which also marks where its moves start
+        new_game.game_id = welcome.id
+        self.active_games[channel.id] = new_game
+        await lobby.send(
+            f'Challenge accepted! Game started in <#{channel.id}>')
+        self.active_challenges.pop(c.p1.uid, c.p2.uid)
+        self.scheduler.cancel('expire_challenge', (c.p1.uid, c.p2.uid))
+        return new_game
 
     @command(['start', 's'])
     async def start_game(self, message: discord.Message):
@@ -736,10 +964,7 @@ class DisquidClient(discord.Client):
             if not message.author.id == target_game.players[0].uid:
                 await message.channel.send('Challenger needs to start the game!')
                 return
-            await message.channel.send('Incoming Board!')
-            board_string = str(target_game)
-            for substring in board_string.split('#msg'):
-                await message.channel.send(substring)
+            await self.send_board(message.channel, target_game)
             player = target_game.players[target_game.cache.current_player - 1]
             if player.role_id:
                 send = (
@@ -759,9 +984,7 @@ class DisquidClient(discord.Client):
                         emoji_num += 1
                         emoji = player.emoji[emoji_num][0]
                     used_emoji.append(emoji)
-                    role = await self.get_guild(message.guild.id).create_role(name=message.channel.name,
-                                                                              color=discord.Color(
-                                                                                  await self.emoji_color_test(emoji)))
+                    role = await self.take_color_role(message.guild, await self.emoji_color_test(emoji))
                     await self.get_guild(message.guild.id).get_member(player.uid).add_roles(role)
                     target_game.role_ids[i] = role.id
 
@@ -782,7 +1005,7 @@ class DisquidClient(discord.Client):
             move_string = ''
             for sub in processed_message:
                 move_string += f' {sub}'
-            move = Utility.read_move(game.cache.current_player, move_string)
+            move = Utility.read_move(game.cache.current_player, move_string, game.layout)
             for substring in game.get_board_string(move(cache.latest, validate=True)).split('#msg'):
                 await message.author.send(substring)
             await message.channel.send('Move Success! Sent to your DMs.')
@@ -793,13 +1016,49 @@ class DisquidClient(discord.Client):
         except InvalidMove:
             move_prefix = processed_message[0]
             if move_prefix == 'V':
-                vanquish_spots: str = Utility.format_locations(cache.latest.vanquish_spots(cache.current_player),
+                vanquish_spots: str = Utility.format_locations(cache.vanquish_spots(cache.current_player),
                                                                game)
                 await message.channel.send('Vanquish options:\n' + vanquish_spots)
             else:
                 await message.channel.send(
                     f'Not a valid move! Use \'{self.get_prefix(message.guild.id)}help moves\' to get help.')
 
+    @command(['hint'])
+    async def send_hint(self, message: discord.Message):
+        """
+        Sends you your vanquish options, whether you can make a conquest, and the best cells to acquire.
+        """
+        if message.channel.id not in self.active_games:
+            await message.channel.send('No game here.')
+            return
+        game = self.active_games[message.channel.id]
+        if message.author.id not in game.players:
+            await message.channel.send('Only players of this game can ask for hints.')
+            return
+        player = game.players.index(message.author.id) + 1
+        hint = game.cache.analysis('hint', player, lambda board, p: compute_hint(board, p, self.endgame, self.book))
+
+        lines = [f'**Hints for player {player}:**']
+        if hint.conquest:
+            lines.append('You can make a conquest now with `Q`!')
+        elif hint.distance is None:
+            lines.append('Your route to the enemy base is cut off.')
+        else:
+            lines.append(f'You need {hint.distance} more cells for a conquest.')
+            if hint.finisher is not None:
+                lines.append(f'`{move_text(hint.finisher, game.layout)}` would make a conquest possible.')
+        if hint.acquires:
+            lines.append('Best cells to acquire: ' + ', '.join(
+                f'{Utility.flag_alias(pos, game.layout)} ({remaining} left)' for pos, remaining in hint.acquires))
+        if hint.vanquish_spots:
+            lines.append('Vanquish options:\n' + Utility.format_locations(hint.vanquish_spots[:10], game))
+        else:
+            lines.append('No vanquish options.')
+        for entry in hint.book_moves:
+            lines.append(f'Played here before: `{move_text(entry.move, game.layout)}`, {entry.wins}/{entry.plays} won.')
+        await message.author.send('\n'.join(lines))
+        await message.channel.send('Hint sent to your DMs.')
+
     @command(['refresh', 'reprint', 'update'])
     async def reprint_board(self, message: discord.Message):
         """
@@ -971,11 +1230,12 @@ class DisquidClient(discord.Client):
         if not 3 <= len(processed_message[0]) <= 5:
             await message.channel.send('Name too long or short. Names must be 3-5 characters.')
             return
-        for key in self.players:
-            if processed_message[0] == self.players[key].name:
-                await message.channel.send('Name taken.')
-                return
+        if self.names.is_taken(processed_message[0]) or self.players.name_owner(processed_message[0]):
+            await message.channel.send('Name taken.')
+            return
+        self.names.rename(uid, self.get_player(uid).name, processed_message[0])
         self.get_player(uid).name = str(processed_message[0]).lower()
+        self.players.flush([self.get_player(uid)])
         for i in range(len(self.get_player(uid).custom_emoji)):
             if 'empty' not in self.get_player(uid).custom_emoji[i]:
                 if i == 0:
@@ -1000,22 +1260,14 @@ class DisquidClient(discord.Client):
             channel_id = message.channel.id
             game = self.active_games.get(channel_id)
             if game:
-                for i, role_id in enumerate(game.role_ids):
-                    role = message.guild.get_role(role_id)
-                    if role:
-                        await role.delete()
+                await self.release_roles(message.guild, game)
             processed_message = str(message.content).split()
             del processed_message[0]
             if channel_id in self.active_games:
                 self.active_games.pop(channel_id)
+                metrics.remove('disquid_game_seconds_total', channel=channel_id)
                 await message.channel.send('Game Deleted.')
-
-                async def channel_del():
-                    await message.channel.send('Channel will be deleted in 1hr, and has been moved to game history.')
-                    await asyncio.sleep(3600)
-                    await message.channel.delete(reason='Game Complete')
-
-                asyncio.run_coroutine_threadsafe(channel_del(), asyncio.get_event_loop())
+                await self.retire_channel(message.channel)
             else:
                 await message.channel.send('No game to delete in this channel.')
         else:
@@ -1040,26 +1292,67 @@ class DisquidClient(discord.Client):
             else:
                 replay = False
             if message.mentions and len(message.mentions) == 2:
-                await self.delete_game(message)
-                self.active_games[message.channel.id] = Game(channel_id,
-                                                             [self.get_player(message.mentions[0].id),
-                                                              self.get_player(message.mentions[1].id)])
+                players = [self.get_player(message.mentions[0].id), self.get_player(message.mentions[1].id)]
             elif len(message.mentions) == 1 and not len(str(message.content).split()) < 3:
-                await self.delete_game(message)
-                self.active_games[message.channel.id] = Game(channel_id,
-                                                             [self.get_player(message.mentions[0].id),
-                                                              self.get_player(message.mentions[0].id)])
+                players = [self.get_player(message.mentions[0].id), self.get_player(message.mentions[0].id)]
             else:
                 await message.channel.send(
                     'Invalid arguments, please mention both players in order for the command to be successful.')
                 return
-            await message.channel.send('Beginning of reindexed game.')
-            async for msg in message.channel.history(limit=None, oldest_first=True):
-                if prefix != str(msg.content)[:len(prefix)]:
-                    if not msg.author.bot and replay:
-                        await msg.channel.send(f'{msg.author.name}: {msg.content}')
-                    await self.on_message(msg, not replay)
-            await message.channel.send('Reindex complete.')
+            # moves before the current game's first message belong to earlier games in the channel
+            old = self.active_games.get(channel_id)
+            game_id = old.game_id if old else channel_id
+            size = (old.history.rows, old.history.cols) if old else (Game.standard_height, Game.standard_width)
+            await self.delete_game(message)
+            # the channel is still in use, so take it back from the pool
+            self.channel_pool.discard(channel_id)
+            self.scheduler.cancel('delete_channel', channel_id)
+            game = Game(channel_id, players, *size, game_id=game_id)
+            reindexer = Reindexer(game)
+            transcript = []
+            status = await message.channel.send('Beginning of reindexed game.')
+            after = discord.Object(id=game_id) if game_id != channel_id else None
+            while True:
+                page = await message.channel.history(limit=DisquidClient.reindex_page_size, after=after,
+                                                     oldest_first=True).flatten()
+                for msg in page:
+                    if msg.author.bot:
+                        if str(msg.content).startswith(DisquidClient.welcome_text):
+                            # a later game was started in the channel, so start over from its first message
+                            game = Game(channel_id, players, *size, game_id=msg.id)
+                            reindexer = Reindexer(game)
+                            transcript.clear()
+                        continue
+                    if prefix == str(msg.content)[:len(prefix)]:
+                        continue
+                    if replay:
+                        transcript.append(f'{msg.author.name}: {msg.content}'[:1900])
+                    reindexer.feed(msg.author.id, str(msg.content))
+                if len(page) < DisquidClient.reindex_page_size:
+                    break
+                after = page[-1]
+                await status.edit(content=f'Reindexing... {reindexer.read} messages read, '
+                                          f'{reindexer.applied} moves applied.')
+            reindexer.finish()
+            self.active_games[channel_id] = game
+            if replay:
+                # send the transcript in as few messages as the length limit allows
+                chunk = ''
+                for line in transcript:
+                    if len(chunk) + len(line) + 1 > 1900:
+                        await message.channel.send(chunk)
+                        chunk = ''
+                    chunk += line + '\n'
+                if chunk:
+                    await message.channel.send(chunk)
+            await message.channel.send(f'Reindex complete. {reindexer.read} messages read, '
+                                       f'{reindexer.applied} moves applied.')
+            if reindexer.won:
+                await self.on_win(game)
+            elif reindexer.drawn:
+                await self.on_draw(game)
+            else:
+                await self.update_board(game)
         else:
             await message.channel.send('Insufficient user permissions.')
 
@@ -1070,15 +1363,52 @@ class DisquidClient(discord.Client):
         """
         if bypass:
             for fun in save_actions:
-                fun(self)
+                with metrics.timer('disquid_save_seconds', action=fun.__name__):
+                    fun(self)
             return
         if message.author.id in DisquidClient.admins:
             for fun in save_actions:
-                fun(self)
+                with metrics.timer('disquid_save_seconds', action=fun.__name__):
+                    fun(self)
             await message.channel.send('Save Successful.')
         else:
             await message.channel.send('Insufficient user permissions.')
 
+    @command(['stats'], True)
+    async def show_stats(self, message: discord.Message):
+        """
+        Called by a bot admin to see which commands, moves and games take the most time.
+        """
+        if message.author.id in DisquidClient.admins:
+            summary = '\n'.join(metrics.summary(8)) or 'No timings recorded yet.'
+            await message.channel.send(f'```\n{summary[:1950]}\n```')
+        else:
+            await message.channel.send('Insufficient user permissions.')
+
+    @command(['flame'], True)
+    async def sample_profile(self, message: discord.Message):
+        """
+        [seconds] Called by a bot admin to sample the event loop and upload the collapsed stacks.
+        """
+        if message.author.id in DisquidClient.admins:
+            processed_message = str(message.content).split()
+            del processed_message[0]
+            try:
+                seconds = float(processed_message[0]) if processed_message else 10.0
+            except ValueError:
+                await message.channel.send('Invalid duration.')
+                return
+            seconds = min(max(seconds, 1.0), DisquidClient.max_profile_duration)
+            await message.channel.send(f'Sampling the event loop for {seconds:g}s.')
+            profiler = SamplingProfiler(threading.get_ident())
+            await asyncio.get_event_loop().run_in_executor(None, profiler.run, seconds)
+            attachment = discord.File(io.BytesIO(profiler.collapsed().encode()),
+                                      filename=f'disquid-{int(time.time())}.collapsed')
+            await message.channel.send(f'{sum(profiler.samples.values())} samples, in collapsed stack format.',
+                                       file=attachment)
+        else:
+            await message.channel.send('Insufficient user permissions.')
+
     @command(['exit', 'stop'], True)
     async def exit_command(self, message: discord.Message):
         """
@@ -1145,12 +1475,8 @@ class DisquidClient(discord.Client):
             if len(mentions) == 0 or not str(message.content).split()[1].isnumeric():
                 await message.channel.send('No argument provided!')
             for mention in mentions:
-                self.get_player(mention.id).elo = int(str(message.content).split()[1])
-
-                def val(p):
-                    return p.elo
-
-                self.ranks.sort(key=val, reverse=True)
+                self.players.set_elo(self.get_player(mention.id), int(str(message.content).split()[1]))
+                self.ranks.update(self.get_player(mention.id))
                 if message.guild.id == self.official_guild:
                     await self.update_rank_role(message.guild, self.get_player(mention.id))
                 await message.channel.send(f'<@{mention.id}>\'s elo has been set.')
@@ -1188,10 +1514,8 @@ class DisquidClient(discord.Client):
 
     async def update_board(self, game: Game, turn_incicator=False):
         channel = self.get_channel(game.channel_id)
-        await channel.send('Incoming Board!')
-        for final_substring in str(game).split('#msg'):
-            print(len(final_substring))
-            await channel.send(final_substring)
+        elapsed = await self.send_board(channel, game)
+        metrics.add('disquid_game_seconds_total', elapsed, channel=game.channel_id)
         if turn_incicator:
             player = game.players[game.cache.current_player - 1]
             if player is not None:
@@ -1202,67 +1526,105 @@ class DisquidClient(discord.Client):
                 send = f'It is <@{game.players[game.cache.current_player - 1].uid}>\'s turn! '
             await channel.send(send)
 
+    async def send_board(self, channel: discord.TextChannel, game: Game) -> float:
+        """
+        Sends the latest board of a game, drawn the way the guild has chosen.
+        :return: Seconds spent rendering.
+        """
+        if self.renderers[channel.guild.id] == 'image':
+            palette = [(rgb(await self.emoji_color_test(tile)), rgb(await self.emoji_color_test(base)))
+                       for tile, base in game.player_emoji()]
+            renderer = BoardRenderer.of(game.history.rows, game.history.cols)
+            board = game.cache.latest.deepcopy()
+            with metrics.timer('disquid_render_seconds') as timing:
+                # drawn off the event loop, from a copy in case a move arrives meanwhile
+                image = await asyncio.get_event_loop().run_in_executor(None, renderer.render_bytes, board, palette)
+            await channel.send('Incoming Board!', file=discord.File(io.BytesIO(image), filename='board.png'))
+            return timing.elapsed
+        await channel.send('Incoming Board!')
+        with metrics.timer('disquid_render_seconds') as timing:
+            board_string = str(game)
+        for substring in board_string.split('#msg'):
+            await channel.send(substring)
+        return timing.elapsed
+
     async def on_win(self, game):
         channel = self.get_channel(game.channel_id)
         winner = game.players[game.cache.current_player - 1]
         loser = game.players[(3 - game.cache.current_player) - 1]
         await channel.send(f'<@{winner.uid}> WINS!')
-        for i, role_id in enumerate(game.role_ids):
-            role = channel.guild.get_role(role_id)
-            await role.delete() if role else role
+        metrics.remove('disquid_game_seconds_total', channel=game.channel_id)
+        await self.release_roles(channel.guild, game)
         self.active_games.pop(channel.id)
-        if game.channel_id not in self.game_history:
+        if game.game_id not in self.game_history:
             self.game_history.append(game)
             await self.update_board(game)
-            winner.calc_elo(loser, True)
-            loser.calc_elo(winner, False)
+            self.players.record_result(winner, loser)
             if channel.guild.id == self.official_guild:
                 for player in game.players:
                     await self.update_rank_role(channel.guild, player)
-
-            def val(p):
-                return p.elo
-
-            self.ranks.sort(key=val, reverse=True)
-
-        async def channel_del():
-            await channel.send('Channel will be deleted in 1hr, and has been moved to game history.')
-            await asyncio.sleep(3600)
-            await channel.delete(reason='Game Complete')
-
-        asyncio.run_coroutine_threadsafe(channel_del(), asyncio.get_event_loop())
+            self.ranks.update(winner)
+            self.ranks.update(loser)
+        await self.retire_channel(channel)
         await self.gen_replay(game)
 
     async def on_draw(self, game):
         channel = self.get_channel(game.channel_id)
         await channel.send('Game ends in a draw. Shake hands now.')
-        for i, role_id in enumerate(game.role_ids):
-            await channel.guild.get_role(role_id).delete()
+        metrics.remove('disquid_game_seconds_total', channel=game.channel_id)
+        await self.release_roles(channel.guild, game)
         self.active_games.pop(channel.id)
-        if game.channel_id not in self.active_games:
+        if game.game_id not in self.game_history:
             self.game_history.append(game)
-
-        async def channel_del():
-            await channel.send('Channel will be deleted in 1hr, and has been moved to game history.')
-            await asyncio.sleep(3600)
-            await channel.delete(reason='Game Complete')
-
-        asyncio.run_coroutine_threadsafe(channel_del(), asyncio.get_event_loop())
+        await self.retire_channel(channel)
         await self.gen_replay(game)
 
     async def gen_replay(self, game: Game):
-        game.to_video(self.data_path.joinpath('temp/'), self.video_dir)
-        replay = f'{game.players[0].name}-v-{game.players[1].name}.mp4'
-        with open(self.video_dir.joinpath(replay), 'rb') as f:
-            attachment = discord.File(f, filename=f'{game.players[0].name}-v-{game.players[1].name}.mp4')
-            await self.get_channel(DisquidClient.replay_channel).send(replay, file=attachment)
+        with metrics.timer('disquid_replay_seconds'):
+            built = await self.replays.build([game])
+        if built:
+            await self.post_replay(self.get_channel(DisquidClient.replay_channel), game.game_id)
 
     async def close(self):
         await self.save(bypass=True)
+        self.replays.close()
         await super(DisquidClient, self).close()
 
 
-if __name__ == '__main__':
+def run_shard(token: str, shard_id: int = None, shard_count: int = None):
+    """
+    Runs the client until it is closed, as one shard of shard_count when given.
+    """
     intents = Intents.default()
     intents.members = True
-    DisquidClient(intents=intents).run(input('Bot API Token: '))
+    if shard_count is None:
+        DisquidClient(intents=intents).run(token)
+    else:
+        DisquidClient(intents=intents, shard_id=shard_id, shard_count=shard_count).run(token)
+
+
+if __name__ == '__main__':
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description='Runs the Disquid bot.')
+    parser.add_argument('--shards', type=int, default=1, help='number of shard processes to run')
+    args = parser.parse_args()
+
+    # Shard processes cannot prompt for the first admin, so ask before starting them
+    admin_file = DisquidClient.data_path.joinpath('admins.json')
+    if args.shards > 1 and not os.path.exists(admin_file):
+        os.makedirs(DisquidClient.data_path, exist_ok=True)
+        with open(admin_file, 'w') as f:
+            json.dump([int(input('Please give the first admin\'s userID '))], f)
+
+    bot_token = input('Bot API Token: ')
+    if args.shards <= 1:
+        run_shard(bot_token)
+    else:
+        shards = [multiprocessing.Process(target=run_shard, args=(bot_token, i, args.shards), name=f'shard-{i}')
+                  for i in range(args.shards)]
+        for shard in shards:
+            shard.start()
+        for shard in shards:
+            shard.join()
@@ -0,0 +1,234 @@
+"""
+Evaluation of many boards at once, for AI search, post-game statistics and replays.
+
+Boards are stacked into two arrays of shape (boards, rows, cols): the owner of every cell
+(0 for empty, 1 or 2 for a player) and whether every cell is part of a base. Every evaluation
+works on the whole stack with NumPy instead of walking Cell objects one board at a time.
+"""
+import numpy as np
+
+from model.state import *
+
+class BoardBatch(object):
+    """
+    A stack of boards of the same size.
+    To evaluate a list of boards, call
+        batch = BoardBatch.from_boards(<boards>)
+        batch.territory()
+    Results are indexed by board first, and per player results have player 1 in column 0.
+    """
+
+    def __init__(self, players: np.ndarray, bases: np.ndarray):
+        """
+        :param players: Owner of every cell, with shape (boards, rows, cols).
+        :param bases: Whether every cell is a base cell, with the same shape.
+        """
+        self.players = np.asarray(players, dtype=np.int8)
+        self.bases = np.asarray(bases, dtype=bool)
+        self._uniform: np.ndarray = None
+
+    @staticmethod
+    def from_boards(boards: [Board]):
+        """
+        Stacks boards into a batch. The boards must all have the same size.
+        """
+        if not boards:
+            return BoardBatch(np.zeros((0, 0, 0)), np.zeros((0, 0, 0)))
+        # one pass over the cells, with owner and base packed into one number
+        codes = np.array([[cell.player * 2 + cell.base for cell in board.cells()] for board in boards], dtype=np.int8)
+        codes = codes.reshape(len(boards), boards[0].rows, boards[0].cols)
+        return BoardBatch(codes >> 1, codes & 1)
+
+    def __len__(self):
+        return self.players.shape[0]
+
+    def owned(self, player: int) -> np.ndarray:
+        """
+        :return: Where the player owns a cell that is not part of a base, the cells moves can change.
+        """
+        return (self.players == player) & ~self.bases
+
+    def territory(self) -> np.ndarray:
+        """
+        :return: The number of non-base cells each player owns, with shape (boards, 2).
+        """
+        return np.stack([self.owned(player).sum(axis=(1, 2)) for player in (1, 2)], axis=1)
+
+    def frontier(self) -> np.ndarray:
+        """
+        :return: The number of empty cells next to each player's cells, with shape (boards, 2).
+        """
+        empty = self.players == 0
+        return np.stack([(adjacent_any(self.players == player) & empty).sum(axis=(1, 2)) for player in (1, 2)],
+                        axis=1)
+
+    def vanquish_threats(self, player: int) -> np.ndarray:
+        """
+        Finds every vanquish the player could make, as Board.is_valid_vanquish would.
+        :return: Whether each cell is the top left corner of a valid vanquish, with shape (boards, rows, cols).
+        """
+        n, rows, cols = self.players.shape
+        threats = np.zeros((n, rows, cols), dtype=bool)
+        if rows < 4 or cols < 4:
+            return threats
+        # a single owner and no base cells within the square, the same for both players
+        if self._uniform is None:
+            self._uniform = (window_sum(self.bases, 4, 4) == 0) & \
+                np.any([window_sum(self.players == owner, 4, 4) == 16 for owner in (0, 1, 2)], axis=0)
+        uniform = self._uniform
+        # at least four of the player's non-base cells along the edges outside the square
+        ring = np.pad(self.owned(player), ((0, 0), (1, 1), (1, 1)))
+        surrounding = window_sum(ring, 6, 6) - window_sum(ring[:, 1:-1, 1:-1], 4, 4) - \
+            ring[:, :-5, :-5] - ring[:, :-5, 5:] - ring[:, 5:, :-5] - ring[:, 5:, 5:]
+        threats[:, :rows - 3, :cols - 3] = uniform & (surrounding >= 4)
+        return threats
+
+    def approach(self, player: int) -> np.ndarray:
+        """
+        :return: The cells next to the enemy base, outside it, where the player's chains to the enemy base end.
+        """
+        enemy_base = (self.players == 3 - player) & self.bases
+        return adjacent_any(enemy_base) & ~enemy_base
+
+    def conquest_distance(self, player: int) -> np.ndarray:
+        """
+        :return: For each board, the number of non-base cells on the player's shortest chain of cells
+        from their base to the enemy base, or -1 if a conquest is not possible.
+        """
+        own = self.players == player
+        return self._search(own, self.owned(player), own & self.bases, self.approach(player) & own, record=False)[0]
+
+    def acquire_distance(self, player: int) -> np.ndarray:
+        """
+        :return: For each board, the fewest empty cells the player must acquire before a conquest is possible,
+        or -1 if the enemy has cut the player off.
+        """
+        return self._acquire_search(player, record=False)[0]
+
+    def acquire_costs(self, player: int, start: np.ndarray = None) -> np.ndarray:
+        """
+        :param start: Cells to measure from, the player's base by default.
+        :return: For every cell, the fewest empty cells the player must acquire to join it to the start cells,
+        counting the cell itself, or -1 where the enemy's cells block the way.
+        """
+        return self._acquire_search(player, start, stop=False)[1]
+
+    def acquire_route(self, player: int, board: int = 0) -> [Position]:
+        """
+        :param board: Index of the board in the batch.
+        :return: The empty cells on a cheapest route from the player's base to the enemy base, from the enemy base
+        back, which the player must acquire before a conquest, or None if the enemy has cut them off.
+        """
+        reach, costs, order = self._acquire_search(player)
+        if reach[board] < 0:
+            return None
+        ends = self.approach(player)[board] & (costs[board] == reach[board])
+        # the end reached first, so the route is the same every time
+        i, j = (int(x) for x in np.unravel_index(np.where(ends, order[board], np.iinfo(np.int32).max).argmin(),
+                                                   ends.shape))
+        # walked cell by cell, so plain lists are faster than indexing arrays
+        costs, order, empty = costs[board].tolist(), order[board].tolist(), (self.players[board] == 0).tolist()
+        rows, cols = ends.shape
+        route = []
+        while True:
+            if empty[i][j]:
+                route.append((i, j))
+            # a cell was reached from a neighbour reached before it, at its own cost less its own
+            previous = costs[i][j] - empty[i][j]
+            steps = [(order[a][b], a, b) for a, b in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1))
+                     if 0 <= a < rows and 0 <= b < cols and costs[a][b] == previous and 0 <= order[a][b] < order[i][j]]
+            if not steps:
+                return route
+            _, i, j = min(steps)
+
+    def _acquire_search(self, player: int, start: np.ndarray = None, stop: bool = True, record: bool = True) -> \
+            (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Searches the player's own cells for free and the empty cells at a cost of one each.
+        """
+        passable = (self.players == player) | (self.players == 0)
+        if start is None:
+            start = (self.players == player) & self.bases
+        return self._search(passable, self.players == 0, start, self.approach(player) & passable, stop, record)
+
+    def _search(self, passable: np.ndarray, counted: np.ndarray, start: np.ndarray, target: np.ndarray,
+                stop: bool = True, record: bool = True) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Searches outwards from the start cells on every board at once, one cost at a time.
+        Entering a counted cell costs one and entering any other passable cell costs nothing, so each cost spreads
+        over the passable cells it reaches for free, and the counted cells next to them wait for the next cost.
+        The conquest and acquire distances, the cost maps and the routes all come from this one search.
+        :param passable: Where the player's chains can go, with shape (boards, rows, cols).
+        :param counted: The passable cells that count towards the cost.
+        :param start: The cells to search from. A counted start cell costs one.
+        :param target: The cells to find the cheapest of.
+        :param stop: Whether a board leaves the search at the first cost that reaches a target cell, since no later
+        cost is cheaper. Costs above that are then left unknown.
+        :param record: Whether to keep the cost and step of every cell, which the distances alone do not need.
+        :return: The cost of the cheapest target cell for each board, or -1 if there is none, and if recorded,
+        for every cell its cost and the step of the search it was reached in, or -1 where it was not reached.
+        """
+        reach = np.full(len(self), -1, dtype=np.int32)
+        costs = order = None
+        if record:
+            costs = np.full(self.players.shape, -1, dtype=np.int32)
+            order = np.full(self.players.shape, -1, dtype=np.int32)
+        active = np.arange(len(self))
+        active_costs, active_order = costs, order
+        start = start & passable
+        free = passable & ~counted
+        frontier = start & free
+        waiting = start & counted
+        seen = frontier.copy()
+        cost = step = 0
+        while active.size:
+            while frontier.any():
+                if record:
+                    np.copyto(active_order, step, where=frontier)
+                spread = adjacent_any(frontier) & ~seen
+                waiting |= spread & counted
+                frontier = spread & free
+                seen |= frontier
+                step += 1
+            if record:
+                np.copyto(active_costs, cost, where=seen & (active_costs < 0))
+            found = (seen & target).any(axis=(1, 2))
+            reach[active[found & (reach[active] < 0)]] = cost
+            # boards with nothing left to search are done
+            keep = waiting.any(axis=(1, 2)) & ~(found & stop)
+            if not keep.all():
+                if record:
+                    costs[active[~keep]] = active_costs[~keep]
+                    order[active[~keep]] = active_order[~keep]
+                    active_costs, active_order = active_costs[keep], active_order[keep]
+                active = active[keep]
+                counted, free, target = counted[keep], free[keep], target[keep]
+                seen, waiting = seen[keep], waiting[keep]
+            seen |= waiting
+            frontier, waiting = waiting, np.zeros_like(waiting)
+            cost += 1
+        return reach, costs, order
+
+
+def window_sum(mask: np.ndarray, height: int, width: int) -> np.ndarray:
+    """
+    :return: The number of set cells in every height by width window of a stack of boolean planes,
+    indexed by the top left corner of the window.
+    """
+    # a board has fewer cells than an int16 holds
+    table = np.zeros((mask.shape[0], mask.shape[1] + 1, mask.shape[2] + 1), dtype=np.int16)
+    np.cumsum(np.cumsum(mask, axis=1, dtype=np.int16), axis=2, out=table[:, 1:, 1:])
+    return table[:, height:, width:] - table[:, :-height, width:] - table[:, height:, :-width] + \
+        table[:, :-height, :-width]
+
+
+def adjacent_any(mask: np.ndarray) -> np.ndarray:
+    """
+    :return: Where any of the four adjacent cells is set in a stack of boolean planes.
+    """
+    out = np.zeros_like(mask)
+    out[:, 1:, :] |= mask[:, :-1, :]
+    out[:, :-1, :] |= mask[:, 1:, :]
+    out[:, :, 1:] |= mask[:, :, :-1]
+    out[:, :, :-1] |= mask[:, :, 1:]
+    return out
@@ -0,0 +1,132 @@
+import glob
+import pickle
+
+from model.game import *
+
+
+class GameArchive(object):
+    """
+    Finished games, kept on disk as one record per game and loaded only when needed.
+    An index of the archived games is read the first time it is needed, so creating
+    an archive costs the same no matter how many games have been played.
+
+    To archive a game, call
+        <archive>.append(<game>)
+    and <archive>.save() to write it to disk.
+    To obtain a single game, call
+        <archive>.load(<game id>)
+    Iterating over the archive, or over <archive>.games(), loads one game at a time.
+
+    Several shard processes can share a directory. Each writes its own index file, named by its
+    index_name, and reads the index files of all of them.
+    """
+
+    record_suffix = '.dqd'
+
+    def __init__(self, directory: Path, players: {int, Player}, legacy_file: Path = None,
+                 index_name: str = 'index'):
+        """
+        :param directory: Directory holding the game records and index.
+        :param players: Known players by uid, used to resolve players of loaded games.
+        :param legacy_file: Pickled list of games to import the first time the index is read.
+        :param index_name: Name of the index file this process writes.
+        """
+        self.directory = directory
+        self.index_file = directory.joinpath(index_name + '.json')
+        self.players = players
+        self.legacy_file = legacy_file
+        self._index: {int: [int]} = None
+        self._own_index: {int: [int]} = {}
+        self._pending: {int, Game} = {}
+
+        if not os.path.exists(self.directory):
+            os.mkdir(self.directory)
+
+    @property
+    def index(self) -> {int: [int]}:
+        """
+        The uids of the players of every archived game, by game id.
+        """
+        if self._index is None:
+            self._index = {}
+            for index_file in sorted(glob.glob(str(self.directory.joinpath('index*.json')))):
+                with open(index_file, 'r') as f:
+                    entries = {int(k): v for k, v in json.load(f).items()}
+                self._index.update(entries)
+                # this process's own index may not exist yet, so compare paths rather than files
+                if Path(index_file).resolve() == self.index_file.resolve():
+                    self._own_index = entries
+            if self.legacy_file and os.path.exists(self.legacy_file):
+                self.import_legacy()
+        return self._index
+
+    def import_legacy(self):
+        """
+        Moves games out of the pickled history list and into the archive.
+        The legacy file is renamed afterwards so it is only imported once.
+        """
+        with open(self.legacy_file, 'rb') as f:
+            games: [Game] = pickle.load(f)
+        for game in games:
+            self.append(game)
+        self.save()
+        os.replace(self.legacy_file, str(self.legacy_file) + '.imported')
+
+    def record_path(self, game_id: int) -> Path:
+        return self.directory.joinpath(f'{game_id}{GameArchive.record_suffix}')
+
+    def append(self, game: Game):
+        """
+        Archives a finished game. It is written to disk on the next save.
+        """
+        self.index[game.game_id] = self._own_index[game.game_id] = [player.uid for player in game.players]
+        self._pending[game.game_id] = game
+
+    def load(self, game_id: int, players: {int, Player} = None) -> Game:
+        """
+        Reads a single archived game.
+        :param game_id: The id of the game.
+        :param players: Players to resolve the game's players with instead of the archive's own.
+        :return: The game, with its boards only rebuilt when they are first used.
+        """
+        if game_id in self._pending:
+            return self._pending[game_id]
+        try:
+            with open(self.record_path(game_id), 'rb') as f:
+                return Game.from_bytes(f.read(), self.players if players is None else players)
+        except FileNotFoundError:
+            raise KeyError(game_id)
+
+    def save(self):
+        """
+        Writes every newly archived game and the index.
+        """
+        if not self._pending and self._index is None:
+            return
+        for game_id, game in self._pending.items():
+            with open(self.record_path(game_id), 'wb') as f:
+                f.write(game.to_bytes())
+        self._pending.clear()
+        with open(self.index_file, 'w') as f:
+            json.dump(self._own_index, f)
+
+    def __contains__(self, item) -> bool:
+        game_id = item.game_id if isinstance(item, Game) else item
+        if self._index is None and self.legacy_file and os.path.exists(self.legacy_file):
+            self.index
+        return game_id in self._pending or os.path.exists(self.record_path(game_id))
+
+    def __len__(self):
+        return len(self.index)
+
+    def games(self, players: {int, Player} = None):
+        """
+        Loads the archived games one at a time.
+        :param players: Players to resolve the games' players with instead of the archive's own, such as an empty
+        dict when reading on a thread that cannot use the archive's players.
+        """
+        for game_id in list(self.index):
+            yield self.load(game_id, players)
+
+    def __iter__(self):
+        return self.games()
@@ -0,0 +1,269 @@
+"""
+An opening book and endgame cache, so common positions are answered by lookup instead of search.
+
+Positions are identified by a Zobrist hash of the board and the player to move. The book maps
+positions to the moves played from them in archived games, with how often each move was played
+and won. It is mined from the first plies of every game, where games share the fixed base layout,
+and from the last plies of every won game, where the winner was closing in on a conquest.
+
+A book file is laid out as:
+    header:  BOOK_MAGIC, version (B), entry count (I)
+    entries: position hash (Q), move key (8s), plays (I), wins (I), sorted by hash and move key
+The file is memory mapped and searched in place, so opening a book costs nothing however large it is.
+
+Usage:
+    python -m model.book                         build data/book.dqb from data/history/
+    python -m model.book --depth 30 --endgame 6 --min-plays 3
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+from collections import OrderedDict
+from functools import lru_cache
+
+from model.analysis import BoardBatch
+from model.archive import GameArchive
+from model.game import *
+
+BOOK_MAGIC = b'DQB'
+BOOK_VERSION = 1
+
+_book_header = struct.Struct('>3sBI')
+_book_entry = struct.Struct('>Q8sII')
+_hash = struct.Struct('>Q')
+
+# move keys hold up to this many acquired cells, as many as read_move accepts
+max_key_locs = 3
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(rows: int, cols: int) -> ([[(int, int, int, int)]], int):
+    """
+    :return: A random key for every cell and state (player 1, player 2, player 1 base, player 2 base),
+    and the key of player 2 being to move. The keys are the same on every run.
+    """
+    rng = random.Random(rows * 1000 + cols)
+    table = [[tuple(rng.getrandbits(64) for _ in range(4)) for c in range(cols)] for r in range(rows)]
+    return table, rng.getrandbits(64)
+
+
+def position_hash(board: Board, player: int) -> int:
+    """
+    :return: The Zobrist hash of a board with the given player to move.
+    """
+    table, second = zobrist_table(board.rows, board.cols)
+    h = second if player == 2 else 0
+    for row, keys in zip(board, table):
+        for cell, key in zip(row, keys):
+            if cell.player:
+                h ^= key[cell.player - 1 + (2 if cell.base else 0)]
+    return h
+
+
+def encode_move(move: Move) -> bytes:
+    """
+    Packs a move into an 8 byte key. Acquired cells are sorted, since their order does not matter.
+    :return: The key, or None for an acquire of more cells than a key holds.
+    """
+    key = bytearray(8)
+    key[0] = ord(move.move_type)
+    if move.move_type == 'A':
+        if len(move.locs) > max_key_locs:
+            return None
+        key[7] = len(move.locs)
+        for k, (r, c) in enumerate(sorted(tuple(loc) for loc in move.locs)):
+            key[1 + 2 * k], key[2 + 2 * k] = r, c
+    elif move.move_type == 'V':
+        key[1], key[2] = move.corner
+    return bytes(key)
+
+
+def decode_move(key: bytes, player: int) -> Move:
+    move_type = chr(key[0])
+    if move_type == 'A':
+        return Move('A', player, locs=[(key[1 + 2 * k], key[2 + 2 * k]) for k in range(key[7])])
+    if move_type == 'V':
+        return Move('V', player, corner=(key[1], key[2]))
+    return Move(move_type, player)
+
+
+class BookEntry(object):
+    """
+    A move played from a book position.
+    """
+
+    def __init__(self, move: Move, plays: int, wins: int):
+        self.move = move
+        self.plays = plays
+        self.wins = wins
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.plays if self.plays else 0.0
+
+
+class OpeningBook(object):
+    """
+    A book file, opened with a memory map.
+    To find the moves played from a position, call
+        <book>.lookup(<board>, <player>)
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.count = _book_header.unpack_from(self._map, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise InvalidRecord('Book is truncated.')
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise InvalidRecord('Not a Disquid book of a supported version.')
+        if _book_header.size + self.count * _book_entry.size > len(self._map):
+            self.close()
+            raise InvalidRecord('Book is truncated.')
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return self.count
+
+    def _hash_at(self, index: int) -> int:
+        return _hash.unpack_from(self._map, _book_header.size + index * _book_entry.size)[0]
+
+    def lookup(self, board: Board, player: int) -> [BookEntry]:
+        """
+        :return: The moves played from the position, most played first, or an empty list if it is not in the book.
+        """
+        h = position_hash(board, player)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._hash_at(mid) < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        while lo < self.count and self._hash_at(lo) == h:
+            _, key, plays, wins = _book_entry.unpack_from(self._map, _book_header.size + lo * _book_entry.size)
+            entries.append(BookEntry(decode_move(key, player), plays, wins))
+            lo += 1
+        entries.sort(key=lambda entry: (entry.plays, entry.wins), reverse=True)
+        return entries
+
+    def best(self, board: Board, player: int) -> Move:
+        """
+        :return: The move with the best win rate among those played from the position, or None.
+        """
+        entries = self.lookup(board, player)
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: (entry.win_rate, entry.plays)).move
+
+    @staticmethod
+    def build(games, path: Path, depth: int = 20, endgame: int = 4, min_plays: int = 2) -> int:
+        """
+        Mines games for a book and writes it.
+        :param games: Finished games, read once.
+        :param path: File to write the book to.
+        :param depth: Plies from the start of each game to include.
+        :param endgame: Plies before the conquest of each won game to include.
+        :param min_plays: Times a move must have been played from a position to be kept.
+        :return: The number of entries written.
+        """
+        stats: {(int, bytes): [int, int]} = {}
+        for game in games:
+            hist = game.history
+            moves = [Move(**mv) for mv in hist.moves]
+            winner = moves[-1].player if moves and moves[-1].move_type == 'Q' else 0
+            endgame_start = len(moves) - endgame if winner else len(moves)
+            board = Board(hist.rows, hist.cols, hist.bases)
+            for ply, move in enumerate(moves):
+                if ply < depth or ply >= endgame_start:
+                    key = encode_move(move)
+                    if key is not None:
+                        counts = stats.setdefault((position_hash(board, move.player), key), [0, 0])
+                        counts[0] += 1
+                        counts[1] += move.player == winner
+                elif not winner:
+                    break
+                move.apply(board)
+
+        entries = sorted((h, key, plays, wins) for (h, key), (plays, wins) in stats.items() if plays >= min_plays)
+        out = bytearray(_book_header.pack(BOOK_MAGIC, BOOK_VERSION, len(entries)))
+        for entry in entries:
+            out += _book_entry.pack(*entry)
+        with open(path, 'wb') as f:
+            f.write(out)
+        return len(entries)
+
+
+def conquest_route(board: Board, player: int) -> [Position]:
+    """
+    :return: The empty cells on a cheapest route from the player's base to the enemy base,
+    which the player must acquire before a conquest, or None if the enemy has cut them off.
+    """
+    return BoardBatch.from_boards([board]).acquire_route(player)
+
+
+class EndgameCache(object):
+    """
+    Solves near-conquest positions and remembers the answers by position hash.
+    A position is solved when the player to move can make a conquest now, or can acquire
+    every cell they are missing for one with a single acquire.
+    :param size: Positions to remember before the least recently used is forgotten.
+    """
+
+    def __init__(self, size: int = 4096):
+        self.size = size
+        self._solved: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def solve(self, board: Board, player: int) -> Move:
+        """
+        :return: A conquest if it is possible, the acquire that makes one possible next turn, or None.
+        """
+        h = position_hash(board, player)
+        if h in self._solved:
+            self.hits += 1
+            self._solved.move_to_end(h)
+            return self._solved[h]
+        self.misses += 1
+        route = conquest_route(board, player)
+        if route is None or len(route) > max_key_locs:
+            move = None
+        elif not route:
+            move = Move('Q', player)
+        else:
+            move = Move('A', player, locs=route)
+        self._solved[h] = move
+        if len(self._solved) > self.size:
+            self._solved.popitem(last=False)
+        return move
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(description='Builds the opening book from archived games.')
+    parser.add_argument('--data', type=Path, default=Path('data/'), help='the bot\'s data directory')
+    parser.add_argument('--out', type=Path, default=None, help='book file, <data>/book.dqb by default')
+    parser.add_argument('--depth', type=int, default=20, help='opening plies of each game to include')
+    parser.add_argument('--endgame', type=int, default=4, help='plies before each conquest to include')
+    parser.add_argument('--min-plays', type=int, default=2, help='plays needed to keep a move')
+    args = parser.parse_args(argv)
+
+    archive = GameArchive(args.data.joinpath('history/'), {})
+    count = OpeningBook.build(archive, args.out or args.data.joinpath('book.dqb'), args.depth, args.endgame,
+                              args.min_plays)
+    print(f'Wrote {count} book entries from {len(archive)} games.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
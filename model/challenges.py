@@ -0,0 +1,61 @@
+from model.game import Challenge
+
+
+class ChallengeRegistry(object):
+    """
+    Holds open challenges by (challenger uid, challenged uid), with an index of each player's
+    incoming challenges, so finding and accepting a challenge does not scan the others.
+    The registry does not expire challenges itself, the bot's scheduler pops a challenge when its time runs out.
+    """
+
+    def __init__(self):
+        self.challenges: {(int, int), Challenge} = {}
+        # uid to the uids that challenged them
+        self.incoming: {int, {int}} = {}
+
+    @staticmethod
+    def key(chal: Challenge) -> (int, int):
+        return chal.p1.uid, chal.p2.uid
+
+    def __len__(self):
+        return len(self.challenges)
+
+    def __iter__(self):
+        return iter(list(self.challenges.values()))
+
+    def __contains__(self, chal: Challenge):
+        return ChallengeRegistry.key(chal) in self.challenges
+
+    def add(self, chal: Challenge):
+        """
+        Opens a challenge, replacing an open challenge between the same players in the same direction.
+        """
+        p1, p2 = key = ChallengeRegistry.key(chal)
+        self.challenges[key] = chal
+        self.incoming.setdefault(p2, set()).add(p1)
+
+    def get(self, p1_id: int, p2_id: int) -> Challenge:
+        """
+        :return: The open challenge from p1 to p2, or None.
+        """
+        return self.challenges.get((p1_id, p2_id))
+
+    def pop(self, p1_id: int, p2_id: int) -> Challenge:
+        """
+        Closes a challenge.
+        :return: The closed challenge, or None if there was none.
+        """
+        chal = self.challenges.pop((p1_id, p2_id), None)
+        if chal is None:
+            return None
+        challengers = self.incoming[p2_id]
+        challengers.discard(p1_id)
+        if not challengers:
+            del self.incoming[p2_id]
+        return chal
+
+    def challengers_of(self, uid: int) -> [Challenge]:
+        """
+        :return: The open challenges made to the player.
+        """
+        return [self.challenges[(p1, uid)] for p1 in self.incoming.get(uid, ())]
@@ -1,15 +1,10 @@
 import copy
 import io
 import shutil
-
-import PIL
-import cairo
-import discord
-from PIL import Image
-from discord import Role
-from moviepy.editor import *
+import struct
 
 from model.memory import *
+from model.render import BoardRenderer
 
 EmojiSet = Tuple[str, str]
 EmojiArray = Tuple[EmojiSet, EmojiSet]
@@ -35,7 +30,7 @@ class Player(object):
     }
 
     def __init__(self, uid: int, elo: int = 0, emoji: EmojiArray = default_emoji, name: str = 'dft',
-                 role_id: Role.id = None):
+                 role_id: int = None):
         self.uid = uid
         self.elo = elo
         self.emoji = copy.deepcopy(emoji)
@@ -91,14 +86,29 @@ class Game(object):
     """
     standard_width = 28
     standard_height = 14
-
-    def __init__(self, channel_id: discord.TextChannel.id, players: [Player], r: int = standard_height,
-                 c: int = standard_width, bases: [Position] = None, role_ids: [Role] = None):
+    # longest message Discord accepts
+    message_limit = 2000
+    # channel id, game id, current player, draw suggested, forfeit suggested, time of last move, player count
+    record_header = struct.Struct('>QQBQQdB')
+    # version 1 records have no game id
+    record_header_v1 = struct.Struct('>QBQQdB')
+    # uid, role id
+    record_player = struct.Struct('>QQ')
+
+    def __init__(self, channel_id: int, players: [Player], r: int = standard_height,
+                 c: int = standard_width, bases: [Position] = None, role_ids: [int] = None, game_id: int = None):
+        """
+        :param channel_id: The channel the game is played in.
+        :param game_id: Unique id of the game, such as the id of the first message of the game. Channels are reused
+        for later games, so finished games are kept by this id rather than by channel. Defaults to the channel id,
+        which games from before channels were reused are kept by.
+        """
         self.channel_id = channel_id
+        self.game_id = channel_id if game_id is None else game_id
         self.players = players
         if not bases:
-            if r == Game.standard_height and c == Game.standard_width:
-                bases = [((r // 2) - 1, 4), ((r // 2) - 1, (c - 1) - 5)]
+            if (r, c) in Layout.sizes.values():
+                bases = Layout.of(r, c).bases
             else:
                 raise InvalidGameSetup
         self.history = History(r, c, bases, [])
@@ -107,10 +117,18 @@ class Game(object):
         self.forfeit_suggested = 0
         self.role_ids = [None, None] if not role_ids else role_ids
 
-    def __str__(self):
-        board_string = str(self.cache.latest)
+    @property
+    def layout(self) -> Layout:
+        return Layout.of(self.history.rows, self.history.cols)
+
+    def player_emoji(self) -> [EmojiSet]:
+        """
+        :return: The tile and base emoji each player is shown with, each player's highest priority emoji
+        that the other player does not use.
+        """
+        emoji = []
         used_emojis = []
-        for i, player in enumerate(self.players):
+        for player in self.players:
             # use highest priority emoji not used by another player
             base_emoji = player.emoji[0][1]
             tile_emoji = player.emoji[0][0]
@@ -126,111 +144,112 @@ class Game(object):
                 tile_emoji = player.emoji[priority_count][0]
                 priority_count += 1
             used_emojis.append(tile_emoji)
+            emoji.append((tile_emoji, base_emoji))
+        return emoji
 
+    def __str__(self):
+        board_string = str(self.cache.latest)
+        for i, (tile_emoji, base_emoji) in enumerate(self.player_emoji()):
             board_string = board_string.replace(f'p{i + 1}b', base_emoji)
             board_string = board_string.replace(f'p{i + 1}', tile_emoji)
-        # add message breaks to prevent passing character limit
-        updated_board_string = ''
-        for substring in board_string.split('#msg'):
-            chars = 0
-            for row_substring in substring.split('\n'):
-                chars += len(row_substring) + 2 # adding in the break length
-                if chars >= 1400:
-                    updated_board_string += '#msg'
-                    chars = 0
-                updated_board_string += row_substring + '\n'
-            updated_board_string += '#msg'
-        updated_board_string = updated_board_string.replace('#msg\n#msg', '#msg')
-        updated_board_string = updated_board_string.replace('#msg#msg', '#msg')
-        if updated_board_string[-4:] == '#msg':
-            updated_board_string = updated_board_string[:-4]
-        return updated_board_string
+        return Utility.split_messages(board_string, Game.message_limit)
 
     def get_board_string(self, board: Board):
         board_string = str(board)
         for i, player in enumerate(self.players):
             board_string = board_string.replace(f'p{i + 1}b', player.emoji[i][1])
             board_string = board_string.replace(f'p{i + 1}', player.emoji[i][0])
-        return board_string
+        return Utility.split_messages(board_string, Game.message_limit)
 
     def __eq__(self, other):
         if isinstance(other, Game):
-            return self.channel_id == other.channel_id
+            return self.game_id == other.game_id
         if isinstance(other, int):
             return self.channel_id == other
         else:
             return NotImplemented
 
+    def to_bytes(self) -> bytes:
+        """
+        Packs the game into a versioned binary record.
+        Players are stored by uid, so they must be resolved again on load.
+        :return: The packed game.
+        """
+        out = bytearray()
+        write_record(out)
+        out += Game.record_header.pack(self.channel_id, self.game_id, self.cache.current_player, self.draw_suggested,
+                                       self.forfeit_suggested, self.cache.time_since_last_move.timestamp(),
+                                       len(self.players))
+        for player, role_id in zip(self.players, self.role_ids):
+            out += Game.record_player.pack(player.uid, role_id or 0)
+        hist = self.history
+        write_history(out, hist.rows, hist.cols, hist.bases, hist.moves)
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data: bytes, players: {int, Player}):
+        """
+        Unpacks a game from a record made by Game.to_bytes.
+        :param data: The packed game.
+        :param players: Known players by uid, unknown uids get a new Player.
+        :return: The unpacked Game, with its board replayed from the move history.
+        """
+        version = record_version(data)
+        offset = read_record(data)
+        try:
+            if version == 1:
+                channel_id, current_player, draw_suggested, forfeit_suggested, last_move, player_count = \
+                    Game.record_header_v1.unpack_from(data, offset)
+                game_id = channel_id
+                offset += Game.record_header_v1.size
+            else:
+                channel_id, game_id, current_player, draw_suggested, forfeit_suggested, last_move, player_count = \
+                    Game.record_header.unpack_from(data, offset)
+                offset += Game.record_header.size
+            uids, role_ids = [], []
+            for _ in range(player_count):
+                uid, role_id = Game.record_player.unpack_from(data, offset)
+                offset += Game.record_player.size
+                uids.append(uid)
+                role_ids.append(role_id or None)
+        except struct.error:
+            raise InvalidRecord('Record is truncated.')
+        rows, cols, bases, moves, _ = read_history(data, offset)
+
+        game = Game.__new__(Game)
+        game.channel_id = channel_id
+        game.game_id = game_id
+        game.players = [players[uid] if uid in players else Player(uid) for uid in uids]
+        game.history = History(rows, cols, bases, moves)
+        game.cache = Cache(game.history)
+        game.cache.current_player = current_player
+        game.cache.time_since_last_move = datetime.datetime.fromtimestamp(last_move)
+        game.draw_suggested = draw_suggested
+        game.forfeit_suggested = forfeit_suggested
+        game.role_ids = role_ids
+        return game
+
+    def __reduce__(self):
+        return Game.from_bytes, (self.to_bytes(), {player.uid: player for player in self.players})
+
+    def __setstate__(self, state):
+        # games pickled before records were used have no game id
+        self.__dict__.update(state)
+        self.__dict__.setdefault('game_id', self.channel_id)
+
     def to_video(self, temp_dir: Path, video_dir: Path, file_name: str = None):
+        # the video library is slow to import, so only replays load it
+        from moviepy.editor import ImageClip, concatenate_videoclips
+
         if not file_name:
             file_name = f'{self.players[0].name}-v-{self.players[1].name}'
+        renderer = BoardRenderer.of(self.history.rows, self.history.cols)
         images = []
+        os.makedirs(temp_dir, exist_ok=True)
         for v, board in enumerate(self.cache.hist.board_history()):
-            arr = str(board).replace('#msg', '').split('\n')
-            final_arr = []
-            for i, line in enumerate(arr):
-                cell_arr = line.replace('||', '').split(':')
-                for r_cell in cell_arr:
-                    if r_cell == '':
-                        cell_arr.remove(r_cell)
-                for j, cell in enumerate(cell_arr):
-                    if 'p1' not in cell and 'p2' not in cell:
-                        cell_arr[j] = 'empty'
-                for cell in cell_arr:
-                    if 'p1' in cell or 'p2' in cell or 'p1b' in cell or 'p2b' in cell:
-                        char_arr = cell.replace('p1b', '3').replace('p2b', '4').replace('p1', '1').replace('p2', '2')
-                        for k, char in enumerate(char_arr):
-                            if k == len(char_arr) - 1:
-                                if char == '1':
-                                    cell_arr[cell_arr.index(cell)] = 'p1'
-                                elif char == '2':
-                                    cell_arr[cell_arr.index(cell)] = 'p2'
-                                elif char == '3':
-                                    cell_arr[cell_arr.index(cell)] = 'p1b'
-                                elif char == '4':
-                                    cell_arr[cell_arr.index(cell)] = 'p2b'
-                            else:
-                                if char == '1':
-                                    cell_arr.insert(cell_arr.index(cell), 'p1')
-                                elif char == '2':
-                                    cell_arr.insert(cell_arr.index(cell), 'p2')
-                                elif char == '3':
-                                    cell_arr.insert(cell_arr.index(cell), 'p1b')
-                                elif char == '4':
-                                    cell_arr.insert(cell_arr.index(cell), 'p2b')
-                if not len(line) == 0:
-                    final_arr.append(cell_arr)
-            width = 647
-            height = 324
-
-            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
-            ctx = cairo.Context(surface)
-
-            pat = cairo.SolidPattern(54.0 / 255, 57.0 / 255, 72.0 / 255)
-            ctx.set_source(pat)
-            ctx.rectangle(0, 0, width, height)
-            ctx.fill()
-
-            for i, line in enumerate(final_arr):
-                for j, cell in enumerate(line):
-                    if cell == 'empty':
-                        ctx.set_source_rgb(32.0 / 255, 34.0 / 255, 37.0 / 255)
-                    elif 'p1b' in cell:
-                        ctx.set_source_rgb(128.0 / 255, 30.0 / 255, 32.0 / 255)
-                    elif 'p2b' in cell:
-                        ctx.set_source_rgb(64.0 / 255, 57.0 / 255, 193.0 / 255)
-                    elif 'p1' in cell:
-                        ctx.set_source_rgb(221.0 / 255, 46.0 / 255, 68.0 / 255)
-                    elif 'p2' in cell:
-                        ctx.set_source_rgb(85.0 / 255, 172.0 / 255, 238.0 / 255)
-                    else:
-                        continue
-                    ctx.rectangle((j * 23) + 2, (i * 23) + 2, 22, 22)
-                    ctx.fill()
-            if not os.path.exists(temp_dir):
-                os.mkdir(temp_dir)
-            surface.write_to_png(str(temp_dir.joinpath(f'{v}.png').absolute()))
-            images.append(str(temp_dir.joinpath(f'{v}.png').absolute()))
+            image = str(temp_dir.joinpath(f'{v}.png').absolute())
+            renderer.render(board).save(image)
+            images.append(image)
         clips = [ImageClip(m, duration=0.1) for m in images]
         concat_clip = concatenate_videoclips(clips)
         concat_clip.write_videofile(str(video_dir.joinpath(file_name)) + '.mp4', fps=10)
@@ -239,6 +258,24 @@ class Game(object):
 
 class Utility:
 
+    @staticmethod
+    def split_messages(board_string: str, limit: int) -> str:
+        """
+        Packs the rows of a rendered board into as few messages as fit, each at most limit characters long,
+        so the number of messages depends on the emoji actually used rather than on the board size.
+        :return: The board with '#msg' between messages.
+        """
+        messages = []
+        message = ''
+        for row in board_string.splitlines(keepends=True):
+            if message and len(message) + len(row) > limit:
+                messages.append(message)
+                message = ''
+            message += row
+        if message:
+            messages.append(message)
+        return '#msg'.join(messages)
+
     @staticmethod
     def format_locations(locs: [Position], game):
         """
@@ -252,7 +289,7 @@ class Utility:
             player = board[i][j].player
             if player == 0:
                 # blank cell, use flag, add spoilers
-                return '||' + Board.flag_array[i][j][1] + '||'
+                return '||' + game.layout.flags[i][j][1] + '||'
             else:
                 # player cell stand-in code
                 return game.players[player - 1].emoji[1][0] if game.players[0].emoji[0][0] == game.players[1].emoji[0][
@@ -264,13 +301,15 @@ class Utility:
         return result
 
     @staticmethod
-    def read_move(player: int, action_text) -> Move:
+    def read_move(player: int, action_text, layout: Layout = None) -> Move:
         """
         Turns text into a move.
         :param action_text: Text that should be converted.
         :param player: Player doing the move.
+        :param layout: Layout of the board the move is for, the medium board by default.
         :return: The move based on the given text.
         """
+        layout = layout or Layout.of(Game.standard_height, Game.standard_width)
         args = action_text.split()
         prefix = args[0]
         player_num = player
@@ -280,7 +319,7 @@ class Utility:
         if prefix == 'A' and len(args) == 3:
             locs = []
             for flag_code in args:
-                loc = Utility.translate_flag(flag_code)
+                loc = layout.translate(flag_code)
                 if loc is None:
                     raise InvalidMove
                 locs.append(loc)
@@ -290,7 +329,7 @@ class Utility:
             if not len(args) == 2:
                 raise InvalidMove
             try:
-                if int(args[0]) < 0 or int(args[0]) > 13 or int(args[1]) < 0 or int(args[1]) > 27:
+                if not 0 <= int(args[0]) < layout.rows or not 0 <= int(args[1]) < layout.cols:
                     raise InvalidMove
             except ValueError:
                 raise InvalidMove
@@ -302,17 +341,24 @@ class Utility:
             raise InvalidMove
 
     @staticmethod
-    def translate_flag(flag):
+    def translate_flag(flag, layout: Layout = None):
         """
         Takes in a flag and turns it into coordinates.
         :param flag: The flag that should be translated.
-        :return: Coordinates of a given flag on the default layout.
+        :param layout: Layout to translate on, the medium board by default.
+        :return: Coordinates of the given flag.
         """
-        for r, row in enumerate(Board.flag_array):
-            for c, flag_dec in enumerate(row):
-                if flag in flag_dec[0]:
-                    return r, c
-        return
+        return (layout or Layout.of(Game.standard_height, Game.standard_width)).translate(flag)
+
+    @staticmethod
+    def flag_alias(pos: Position, layout: Layout = None) -> str:
+        """
+        Turns coordinates into a flag a player can type.
+        :param pos: Coordinates on the board.
+        :param layout: Layout of the board, the medium board by default.
+        :return: An alias that translate_flag turns back into the same coordinates.
+        """
+        return (layout or Layout.of(Game.standard_height, Game.standard_width)).alias(pos)
 
     @staticmethod
     def color_estimate(asset: []):
@@ -321,15 +367,15 @@ class Utility:
         :param asset: Bytes of image to be estimated.
         :return: Color estimation.
         """
+        from PIL import Image
+
         stream = io.BytesIO(asset)
-        img = PIL.Image.open(stream)
+        img = Image.open(stream)
 
         colors = Image.Image.getcolors(img, maxcolors=256 * 256 * 256)
         clumps = []
         min_dist = 30
         for color_item in colors:
-            print(color_item)
-            print(str(color_item) + str(len(clumps)))
             for i, (clump_item) in enumerate(clumps):
                 if color_item in colors and Utility.color_distance(color_item[1], clump_item[1]) < min_dist:
                     clumps[i] = clump_item[0] + color_item[0], Utility.average_colors(clump_item[0], clump_item[1],
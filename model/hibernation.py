@@ -0,0 +1,149 @@
+import glob
+from collections import OrderedDict
+
+from model.game import *
+
+
+class ActiveGames(object):
+    """
+    Games in progress by channel id, with idle games hibernated to disk as one record per game.
+    Hibernated games are woken transparently the next time their channel id is looked up, so the
+    games in memory are the ones being played rather than every game ever started.
+
+    Games are evicted from memory least recently used first, when
+        <games>.hibernate_idle(<idle time>)
+    finds games without a move for longer than the idle time, or when more than max_resident games are in memory.
+    Iterating, len() and resident() only see games in memory.
+
+    Several shard processes can share a directory, since a process only looks up the channels of its own guilds.
+    """
+
+    record_suffix = '.dqg'
+
+    def __init__(self, directory: Path, players: {int, Player}, games: {int, Game} = None,
+                 max_resident: int = 1000):
+        """
+        :param directory: Directory holding the hibernated games.
+        :param players: Known players by uid, used to resolve players of woken games.
+        :param games: Games in memory to start with.
+        :param max_resident: Games kept in memory before the least recently used is hibernated.
+        """
+        self.directory = directory
+        self.players = players
+        self.max_resident = max_resident
+        self._games: OrderedDict = OrderedDict()
+
+        if not os.path.exists(self.directory):
+            os.mkdir(self.directory)
+        # channel ids of the games on disk, so looking up a channel without a game does not touch the disk
+        self._hibernated: {int} = {int(Path(path).stem) for path in
+                                   glob.glob(str(self.directory.joinpath('*' + ActiveGames.record_suffix)))}
+        for channel_id, game in (games or {}).items():
+            self[channel_id] = game
+
+    def record_path(self, channel_id: int) -> Path:
+        return self.directory.joinpath(f'{channel_id}{ActiveGames.record_suffix}')
+
+    def resident(self) -> {int, Game}:
+        """
+        :return: The games in memory by channel id, to save along with the rest of the bot's state.
+        """
+        return dict(self._games)
+
+    def _wake(self, channel_id: int) -> Game:
+        """
+        Reads a hibernated game back into memory.
+        The record is kept until the game ends, so a game woken but not yet saved is never lost.
+        :return: The game, or None if there is no record of it.
+        """
+        if channel_id not in self._hibernated:
+            return None
+        try:
+            with open(self.record_path(channel_id), 'rb') as f:
+                game = Game.from_bytes(f.read(), self.players)
+        except FileNotFoundError:
+            self._hibernated.discard(channel_id)
+            return None
+        self[channel_id] = game
+        return game
+
+    def hibernate(self, channel_id: int):
+        """
+        Writes a game to disk and drops it from memory.
+        """
+        game = self._games.pop(channel_id)
+        path = self.record_path(channel_id)
+        with open(str(path) + '.tmp', 'wb') as f:
+            f.write(game.to_bytes())
+        os.replace(str(path) + '.tmp', path)
+        self._hibernated.add(channel_id)
+
+    def hibernate_idle(self, idle: datetime.timedelta) -> int:
+        """
+        Hibernates every game in memory without a move for longer than the idle time.
+        :return: The number of games hibernated.
+        """
+        cutoff = datetime.datetime.now() - idle
+        idle_games = [channel_id for channel_id, game in self._games.items()
+                      if game.cache.time_since_last_move < cutoff]
+        for channel_id in idle_games:
+            self.hibernate(channel_id)
+        return len(idle_games)
+
+    def __getitem__(self, channel_id: int) -> Game:
+        game = self.get(channel_id)
+        if game is None:
+            raise KeyError(channel_id)
+        return game
+
+    def get(self, channel_id: int, default: Game = None) -> Game:
+        if channel_id in self._games:
+            self._games.move_to_end(channel_id)
+            return self._games[channel_id]
+        game = self._wake(channel_id)
+        return default if game is None else game
+
+    def __setitem__(self, channel_id: int, game: Game):
+        self._games[channel_id] = game
+        self._games.move_to_end(channel_id)
+        while len(self._games) > self.max_resident:
+            self.hibernate(next(iter(self._games)))
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._games or channel_id in self._hibernated
+
+    def pop(self, channel_id: int, *default) -> Game:
+        """
+        Removes a game for good, from memory and from disk.
+        """
+        game = self.get(channel_id)
+        self._games.pop(channel_id, None)
+        if channel_id in self._hibernated:
+            self._hibernated.discard(channel_id)
+            try:
+                os.remove(self.record_path(channel_id))
+            except FileNotFoundError:
+                pass
+        if game is None:
+            if default:
+                return default[0]
+            raise KeyError(channel_id)
+        return game
+
+    def forget(self, channel_id: int):
+        """
+        Drops a game from memory without writing it to disk, such as a game another process is responsible for.
+        """
+        self._games.pop(channel_id, None)
+
+    def __len__(self):
+        return len(self._games)
+
+    def __iter__(self):
+        return iter(list(self._games))
+
+    def values(self):
+        return list(self._games.values())
+
+    def items(self):
+        return list(self._games.items())
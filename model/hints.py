@@ -0,0 +1,76 @@
+"""
+Hints for a player: what they can vanquish, whether they can make a conquest, and which cells
+bring a conquest closest. Hints are computed once per position through Cache.analysis.
+"""
+import numpy as np
+
+from model.book import *
+
+
+class Hint(object):
+    """
+    What a player can do from a position.
+    """
+
+    # cells suggested to acquire
+    top_cells = 5
+
+    def __init__(self, player: int, vanquish_spots: [Position], finisher: Move, distance: int,
+                 acquires: [(Position, int)], book_moves: [BookEntry]):
+        """
+        :param vanquish_spots: Corners of every vanquish the player can make.
+        :param finisher: A conquest, or an acquire that makes one possible, if the position is near the end.
+        :param distance: Empty cells the player still needs for a conquest, None if they are cut off.
+        :param acquires: The best cells to acquire, each with the cells still needed after acquiring it.
+        :param book_moves: Moves played from this position in archived games.
+        """
+        self.player = player
+        self.vanquish_spots = vanquish_spots
+        self.finisher = finisher
+        self.distance = distance
+        self.acquires = acquires
+        self.book_moves = book_moves
+
+    @property
+    def conquest(self) -> bool:
+        return self.distance == 0
+
+
+def best_acquires(board: Board, player: int, count: int = Hint.top_cells) -> [(Position, int)]:
+    """
+    Ranks empty cells by the shortest route to the enemy base that passes through them.
+    :return: The best cells, each with the empty cells still needed on that route after acquiring it.
+    """
+    batch = BoardBatch.from_boards([board])
+    from_base = batch.acquire_costs(player)[0]
+    # routes may end on any cell the player could hold next to the enemy base
+    from_enemy = batch.acquire_costs(player, batch.approach(player))[0]
+    # the cell itself is counted by both costs
+    remaining = from_base + from_enemy - 2
+    ranked = (batch.players[0] == 0) & (from_base >= 0) & (from_enemy >= 0)
+    cells = np.flatnonzero(ranked)
+    order = np.lexsort((cells, from_base.flat[cells], remaining.flat[cells]))[:count]
+    return [((int(k) // board.cols, int(k) % board.cols), int(remaining.flat[k])) for k in cells[order]]
+
+
+def compute_hint(board: Board, player: int, endgame: EndgameCache = None, book: OpeningBook = None) -> Hint:
+    """
+    :param endgame: Cache of solved positions shared between games.
+    :param book: Opening book to look the position up in.
+    """
+    distance = int(BoardBatch.from_boards([board]).acquire_distance(player)[0])
+    finisher = (endgame or EndgameCache(1)).solve(board, player)
+    return Hint(player, board.vanquish_spots(player), finisher, None if distance < 0 else distance,
+                best_acquires(board, player), book.lookup(board, player)[:3] if book else [])
+
+
+def move_text(move: Move, layout: Layout = None) -> str:
+    """
+    :param layout: Layout of the board the move is for, the medium board by default.
+    :return: The move as a player would type it.
+    """
+    if move.move_type == 'A':
+        return 'A ' + ' '.join(Utility.flag_alias(loc, layout) or f'{loc[0]},{loc[1]}' for loc in move.locs)
+    if move.move_type == 'V':
+        return f'V {move.corner[0]} {move.corner[1]}'
+    return move.move_type
@@ -0,0 +1,117 @@
+import time
+from bisect import bisect_left, insort
+
+from model.game import Player
+
+
+class MatchmakingPool(object):
+    """
+    Players waiting for a game, paired by Elo in periodic batches.
+    Two players are paired when their Elo differs by no more than the window of the one who has waited longest.
+    The window starts narrow and widens the longer a player waits, so nobody waits forever.
+    Waiting players are kept ordered by Elo, so finding the closest opponent takes a binary search. Call
+        <pool>.pair()
+    periodically to pair up everyone who can be paired.
+    :param window: Elo difference accepted as soon as a player joins.
+    :param widen: Elo added to the window for every second a player waits.
+    :param max_window: Largest window, None for no limit.
+    :param clock: Returns the current time in seconds.
+    """
+
+    def __init__(self, window: int = 50, widen: float = 5, max_window: int = None, clock: callable = time.time):
+        self.base_window = window
+        self.widen = widen
+        self.max_window = max_window
+        self.clock = clock
+        # uid to (elo, time joined, player), in the order players joined
+        self.waiting: {int, (int, float, Player)} = {}
+        # sorted (elo, uid) keys of the waiting players
+        self._keys: [(int, int)] = []
+        # entries of the players paired in the last batch, until the next batch
+        self._paired: {int, (int, float, Player)} = {}
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def __contains__(self, uid: int):
+        return uid in self.waiting
+
+    def join(self, player: Player) -> bool:
+        """
+        :return: False if the player was already waiting.
+        """
+        if player.uid in self.waiting:
+            return False
+        self.waiting[player.uid] = (player.elo, self.clock(), player)
+        insort(self._keys, (player.elo, player.uid))
+        return True
+
+    def leave(self, uid: int) -> bool:
+        """
+        :return: False if the player was not waiting.
+        """
+        entry = self.waiting.pop(uid, None)
+        if entry is None:
+            return False
+        del self._keys[bisect_left(self._keys, (entry[0], uid))]
+        return True
+
+    def window(self, waited: float) -> float:
+        """
+        :param waited: Seconds a player has waited.
+        :return: The Elo difference the player accepts.
+        """
+        window = self.base_window + self.widen * waited
+        return window if self.max_window is None else min(window, self.max_window)
+
+    def closest(self, uid: int) -> (int, int):
+        """
+        :return: The uid of the waiting player whose Elo is closest to the given player's, and the difference,
+        or None if nobody else is waiting.
+        """
+        elo = self.waiting[uid][0]
+        i = bisect_left(self._keys, (elo, uid))
+        candidates = [self._keys[j] for j in (i - 1, i + 1) if 0 <= j < len(self._keys)]
+        if not candidates:
+            return None
+        other_elo, other = min(candidates, key=lambda key: abs(key[0] - elo))
+        return other, abs(other_elo - elo)
+
+    def pair(self) -> [(Player, Player)]:
+        """
+        Pairs waiting players, longest waiting first, each with the closest opponent within their window.
+        Paired players leave the pool, and can be put back with <pool>.requeue(<pair>) if their game is not set up.
+        :return: The pairs, the longer waiting player of each first.
+        """
+        now = self.clock()
+        pairs = []
+        self._paired.clear()
+        for uid in list(self.waiting):
+            if uid not in self.waiting:
+                # already taken as an opponent in this batch
+                continue
+            match = self.closest(uid)
+            if match is None:
+                break
+            other, difference = match
+            if difference <= self.window(now - self.waiting[uid][1]):
+                pairs.append((self.waiting[uid][2], self.waiting[other][2]))
+                self._paired[uid] = self.waiting[uid]
+                self._paired[other] = self.waiting[other]
+                self.leave(uid)
+                self.leave(other)
+        return pairs
+
+    def requeue(self, pair: (Player, Player)):
+        """
+        Puts a pair from the last batch back in the pool, each player keeping the time they joined
+        and so the window they have reached.
+        """
+        for player in pair:
+            if player.uid in self.waiting:
+                continue
+            elo, joined, _ = self._paired.pop(player.uid, (player.elo, self.clock(), player))
+            self.waiting[player.uid] = (elo, joined, player)
+            insort(self._keys, (elo, player.uid))
+        # keep the players in the order they joined, which pair() relies on
+        self.waiting = dict(sorted(self.waiting.items(), key=lambda entry: entry[1][1]))
@@ -1,4 +1,5 @@
 from model.state import *
+from model.record import *
 import datetime
 
 
@@ -20,6 +21,29 @@ class History(object):
         self.bases = bases
         self.moves = moves
 
+    def to_bytes(self) -> bytes:
+        """
+        Packs the history into a versioned binary record.
+        :return: The packed history.
+        """
+        out = bytearray()
+        write_record(out)
+        write_history(out, self.rows, self.cols, self.bases, self.moves)
+        return bytes(out)
+
+    @staticmethod
+    def from_bytes(data: bytes):
+        """
+        Unpacks a history from a record made by History.to_bytes.
+        :param data: The packed history.
+        :return: The unpacked History.
+        """
+        rows, cols, bases, moves, _ = read_history(data, read_record(data))
+        return History(rows, cols, bases, moves)
+
+    def __reduce__(self):
+        return History.from_bytes, (self.to_bytes(),)
+
     def store(self, move):
         """
         Stores the given move.
@@ -49,6 +73,16 @@ class History(object):
             boards.append(board)
         return boards
 
+    def final_board(self):
+        """
+        Replays every move on a single board without keeping the boards in between.
+        :return: the board after the last move.
+        """
+        board = Board(self.rows, self.cols, self.bases)
+        for mv in self.moves:
+            Move(**mv).apply(board)
+        return board
+
 
 class Cache(object):
     """
@@ -67,11 +101,62 @@ class Cache(object):
     def __init__(self, history: History):
         self.hist = history
         self.current_player = 1
-        self.save = history.board_history()
-        self.latest = self.save[-1]
+        # boards are rebuilt from the history on first use, so finished games never replay
+        self._save: [Board] = None
+        self._latest: Board = None
+        # analyses of the latest board, by name and player, until the next move
+        self._analysis: {(str, int), object} = {}
         self.move = None
         self.time_since_last_move: datetime.datetime = datetime.datetime.now()
 
+    def __setstate__(self, state):
+        # caches pickled before the boards became lazy
+        if 'save' in state:
+            state['_save'] = state.pop('save')
+            state['_latest'] = state.pop('latest')
+        state.setdefault('_analysis', {})
+        self.__dict__.update(state)
+
+    @property
+    def save(self) -> [Board]:
+        """
+        Every board of the game so far, with the initial board first.
+        """
+        if self._save is None:
+            self._save = self.hist.board_history()
+            self._latest = self._save[-1]
+        return self._save
+
+    @property
+    def latest(self) -> Board:
+        """
+        The current board.
+        """
+        if self._latest is None:
+            self._latest = self.hist.final_board()
+        return self._latest
+
+    @latest.setter
+    def latest(self, board: Board):
+        self._latest = board
+        self._analysis.clear()
+
+    def analysis(self, name: str, player: int, compute: callable):
+        """
+        Analyses the latest board once, and returns the same result until the board changes.
+        :param name: Name of the analysis.
+        :param player: The player the analysis is for.
+        :param compute: Called with the latest board and the player to run the analysis.
+        :return: The result of compute.
+        """
+        key = (name, player)
+        if key not in self._analysis:
+            self._analysis[key] = compute(self.latest, player)
+        return self._analysis[key]
+
+    def vanquish_spots(self, player: int) -> [Position]:
+        return self.analysis('vanquish_spots', player, Board.vanquish_spots)
+
     def preview(self, move: Move):
         return move(self.latest, validate=True)
 
@@ -81,9 +166,17 @@ class Cache(object):
         """
         if self.move:
             return
-        self.latest = move(self.latest, validate=True)
+        if self._save is not None:
+            # the saved boards keep the board as it was
+            self.latest = move(self.latest, validate=True)
+        else:
+            # moves are checked before any cell changes, so a rejected move leaves the board as it was
+            move.apply(self.latest, validate=True)
+            self._analysis.clear()
         self.move = move
         if not self.move:
             return
-        self.save.append(self.latest)
+        if self._save is not None:
+            self._save.append(self.latest)
         self.hist.store(self.move)
+        self.time_since_last_move = datetime.datetime.now()
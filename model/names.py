@@ -0,0 +1,44 @@
+class NameIndex(object):
+    """
+    Maps player names to uids so that names can be resolved without scanning every player.
+    Names are compared in lowercase. The default name is shared by many players, so it is never indexed.
+
+    Whenever a player changes their name, call
+        <index>.rename(<uid>, <old name>, <new name>)
+    """
+
+    default_name = 'dft'
+
+    def __init__(self, names: {str, int} = None):
+        self.names: {str, int} = {}
+        if names:
+            for name, uid in names.items():
+                self.add(int(uid), name)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return str(name).lower()
+
+    def add(self, uid: int, name: str):
+        key = NameIndex.normalize(name)
+        if key != NameIndex.default_name:
+            self.names[key] = uid
+
+    def lookup(self, name: str) -> int:
+        """
+        Takes in a player's name and returns a uid, or 0 if no player has that name.
+        """
+        return self.names.get(NameIndex.normalize(name), 0)
+
+    def is_taken(self, name: str) -> bool:
+        key = NameIndex.normalize(name)
+        return key == NameIndex.default_name or key in self.names
+
+    def rename(self, uid: int, old_name: str, new_name: str):
+        """
+        Moves a player's entry from their old name to their new name.
+        """
+        old_key = NameIndex.normalize(old_name)
+        if self.names.get(old_key) == uid:
+            del self.names[old_key]
+        self.add(uid, new_name)
@@ -0,0 +1,135 @@
+from bisect import bisect_left, insort
+
+from model.game import Player
+
+
+class RankIndex(object):
+    """
+    Keeps players ordered by elo, highest first, with ties broken by uid.
+    Whenever a player's elo changes, call
+        <index>.update(<player>)
+    so that their position is moved.
+
+    Keys are kept in sorted blocks of at most 2 * block_size, with the number of keys in each block in a
+    Fenwick tree. Moving a player shifts one block instead of the whole ranking, and a rank is the keys in
+    the blocks before the player's, read from the tree, plus their position in their own block.
+    """
+    block_size = 512
+
+    def __init__(self, players: [Player] = ()):
+        # sorted (-elo, uid) keys, so that the first key is the highest ranked player
+        self._blocks: [[(int, int)]] = []
+        # the last key of each block
+        self._maxes: [(int, int)] = []
+        self._tree: [int] = []
+        self._players: {int, Player} = {}
+        self._elos: {int, int} = {}
+        for player in players:
+            self._players[player.uid] = player
+            self._elos[player.uid] = player.elo
+        keys = sorted((-elo, uid) for uid, elo in self._elos.items())
+        self._blocks = [keys[i:i + RankIndex.block_size] for i in range(0, len(keys), RankIndex.block_size)]
+        self._rebuild()
+
+    def _rebuild(self):
+        """
+        Recomputes the block maxes and the tree of block lengths after blocks were split or removed.
+        """
+        self._maxes = [block[-1] for block in self._blocks]
+        self._tree = [0] * (len(self._blocks) + 1)
+        for b, block in enumerate(self._blocks):
+            self._grow(b, len(block))
+
+    def _grow(self, b: int, delta: int):
+        b += 1
+        while b < len(self._tree):
+            self._tree[b] += delta
+            b += b & -b
+
+    def _before(self, b: int) -> int:
+        """
+        :return: The number of keys in the blocks before block b.
+        """
+        total = 0
+        while b > 0:
+            total += self._tree[b]
+            b -= b & -b
+        return total
+
+    def _insert(self, key: (int, int)):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._rebuild()
+            return
+        b = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[b]
+        insort(block, key)
+        self._maxes[b] = block[-1]
+        if len(block) > 2 * RankIndex.block_size:
+            self._blocks[b:b + 1] = [block[:RankIndex.block_size], block[RankIndex.block_size:]]
+            self._rebuild()
+        else:
+            self._grow(b, 1)
+
+    def _remove(self, key: (int, int)):
+        b = bisect_left(self._maxes, key)
+        block = self._blocks[b]
+        del block[bisect_left(block, key)]
+        if not block:
+            del self._blocks[b]
+            self._rebuild()
+        else:
+            self._maxes[b] = block[-1]
+            self._grow(b, -1)
+
+    def add(self, player: Player):
+        """
+        Inserts a player, or moves them if already present.
+        """
+        if player.uid in self._players:
+            self.update(player)
+            return
+        self._players[player.uid] = player
+        self._elos[player.uid] = player.elo
+        self._insert((-player.elo, player.uid))
+
+    def update(self, player: Player):
+        """
+        Moves a player to the position of their current elo.
+        """
+        old_elo = self._elos.get(player.uid)
+        if old_elo is None:
+            self.add(player)
+            return
+        if old_elo == player.elo:
+            return
+        self._remove((-old_elo, player.uid))
+        self._elos[player.uid] = player.elo
+        self._insert((-player.elo, player.uid))
+
+    def rank(self, player: Player) -> int:
+        """
+        :return: The position of the player, starting from 0 for the highest elo.
+        """
+        key = (-self._elos[player.uid], player.uid)
+        b = bisect_left(self._maxes, key)
+        return self._before(b) + bisect_left(self._blocks[b], key)
+
+    def top(self, k: int) -> [Player]:
+        """
+        :return: The k highest ranked players in order.
+        """
+        top = []
+        for block in self._blocks:
+            if len(top) >= k:
+                break
+            top.extend(self._players[uid] for _, uid in block[:k - len(top)])
+        return top
+
+    def __len__(self):
+        return len(self._elos)
+
+    def __iter__(self):
+        for block in self._blocks:
+            for _, uid in block:
+                yield self._players[uid]
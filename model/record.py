@@ -0,0 +1,137 @@
+"""
+Compact binary records for game histories.
+
+A history record is laid out as:
+    header:  rows (B), cols (B), base count (B), then each base as row (B), col (B)
+    moves:   move count (I), then one packed record per move:
+             type byte (B), player (B), then
+                 'A': location count (B) followed by row (B), col (B) per location
+                 'V': corner row (B), corner col (B)
+                 'C', 'Q': nothing
+
+Whole records written with write_record() are prefixed by RECORD_MAGIC and a version byte,
+so that a record can be rejected cleanly if the layout ever changes.
+Version 2 added the game id to game records, records of every version up to RECORD_VERSION can be read.
+"""
+import struct
+
+from model.state import Position
+
+RECORD_MAGIC = b'DQD'
+RECORD_VERSION = 2
+
+_byte = struct.Struct('>B')
+_pair = struct.Struct('>BB')
+_header = struct.Struct('>BBB')
+_count = struct.Struct('>I')
+_move = struct.Struct('>BB')
+_prefix = struct.Struct(f'>{len(RECORD_MAGIC)}sB')
+
+
+class InvalidRecord(Exception):
+    """
+    Thrown when a record cannot be read back.
+    """
+    pass
+
+
+def write_record(out: bytearray):
+    """
+    Writes the magic and version prefix of a record.
+    :param out: Buffer to write to.
+    """
+    out += _prefix.pack(RECORD_MAGIC, RECORD_VERSION)
+
+
+def record_version(data: bytes, offset: int = 0) -> int:
+    """
+    Checks the magic and version prefix of a record.
+    :param data: Buffer to read from.
+    :param offset: Where the record starts in the buffer.
+    :return: The version the record was written with.
+    """
+    try:
+        magic, version = _prefix.unpack_from(data, offset)
+    except struct.error:
+        raise InvalidRecord('Record is truncated.')
+    if magic != RECORD_MAGIC:
+        raise InvalidRecord('Not a Disquid record.')
+    if not 1 <= version <= RECORD_VERSION:
+        raise InvalidRecord(f'Unsupported record version {version}.')
+    return version
+
+
+def read_record(data: bytes, offset: int = 0) -> int:
+    """
+    Checks the magic and version prefix of a record.
+    :param data: Buffer to read from.
+    :param offset: Where the record starts in the buffer.
+    :return: The offset of the record body.
+    """
+    record_version(data, offset)
+    return offset + _prefix.size
+
+
+def write_history(out: bytearray, rows: int, cols: int, bases: [Position], moves: [dict]):
+    """
+    Packs a history into the given buffer.
+    :param out: Buffer to write to.
+    :param rows: Rows of the board.
+    :param cols: Columns of the board.
+    :param bases: Base positions of each player.
+    :param moves: Moves as stored in History.moves.
+    """
+    out += _header.pack(rows, cols, len(bases))
+    for base in bases:
+        out += _pair.pack(*base)
+    out += _count.pack(len(moves))
+    for mv in moves:
+        move_type = mv['move_type']
+        out += _move.pack(ord(move_type), mv['player'])
+        if move_type == 'A':
+            out += _byte.pack(len(mv['locs']))
+            for loc in mv['locs']:
+                out += _pair.pack(*loc)
+        elif move_type == 'V':
+            out += _pair.pack(*mv['corner'])
+
+
+def read_history(data: bytes, offset: int = 0):
+    """
+    Unpacks a history from the given buffer.
+    :param data: Buffer to read from.
+    :param offset: Where the history starts in the buffer.
+    :return: rows, cols, bases, moves and the offset after the history.
+    """
+    try:
+        rows, cols, base_count = _header.unpack_from(data, offset)
+        offset += _header.size
+        bases = []
+        for _ in range(base_count):
+            bases.append(_pair.unpack_from(data, offset))
+            offset += _pair.size
+        move_count, = _count.unpack_from(data, offset)
+        offset += _count.size
+        moves = []
+        for _ in range(move_count):
+            type_byte, player = _move.unpack_from(data, offset)
+            offset += _move.size
+            move_type = chr(type_byte)
+            mv = {'move_type': move_type, 'player': player}
+            if move_type == 'A':
+                loc_count, = _byte.unpack_from(data, offset)
+                offset += _byte.size
+                locs = []
+                for _ in range(loc_count):
+                    locs.append(_pair.unpack_from(data, offset))
+                    offset += _pair.size
+                mv['locs'] = locs
+            elif move_type == 'V':
+                mv['corner'] = _pair.unpack_from(data, offset)
+                offset += _pair.size
+            elif move_type not in ('C', 'Q'):
+                raise InvalidRecord(f'Unknown move type {move_type!r}.')
+            moves.append(mv)
+    except struct.error:
+        raise InvalidRecord('Record is truncated.')
+    return rows, cols, bases, moves, offset
@@ -0,0 +1,101 @@
+from model.game import *
+
+
+class Reindexer(object):
+    """
+    Rebuilds a game from the text of the moves sent in its channel.
+    Moves are applied to a single board in place, and the game's history and cache are only
+    updated once every move has been read.
+    Draw and forfeit offers are followed as on_message does, and nothing after the end of the game is read.
+
+    For each message in the channel, oldest first, call
+        <reindexer>.feed(<author id>, <message text>)
+    and then
+        <reindexer>.finish()
+    to write the result into the game.
+    """
+
+    move_prefixes = ('A', 'C', 'V', 'Q')
+
+    def __init__(self, game: Game):
+        self.game = game
+        hist = game.history
+        self.board = Board(hist.rows, hist.cols, hist.bases)
+        self.current_player = 1
+        self.read = 0
+        self.applied = 0
+        self.won = False
+        self.drawn = False
+
+    @staticmethod
+    def is_move_text(text: str) -> bool:
+        """
+        Tests if a message looks like a move, the same way on_message does.
+        """
+        return bool(text) and text[0] in Reindexer.move_prefixes and len(text.split()) <= 4
+
+    def feed(self, author_id: int, text: str) -> bool:
+        """
+        Applies a message if it is a valid move by the player whose turn it is.
+        :param author_id: The uid of the message author.
+        :param text: The message text.
+        :return: True if the message was applied as a move.
+        """
+        self.read += 1
+        if self.won or self.drawn:
+            return False
+        if text.lower() in ('draw', 'forfeit', 'cancel'):
+            self.offer(author_id, text.lower())
+            return False
+        if not Reindexer.is_move_text(text):
+            return False
+        if author_id != self.game.players[self.current_player - 1].uid:
+            return False
+        try:
+            move = Utility.read_move(self.current_player, text, self.game.layout)
+            move.apply(self.board, validate=True)
+        except InvalidMove:
+            return False
+        self.game.history.store(move)
+        self.applied += 1
+        if move.move_type == 'Q':
+            self.won = True
+        else:
+            self.current_player = 3 - self.current_player
+        return True
+
+    def offer(self, author_id: int, text: str):
+        """
+        Follows a draw or forfeit offer, or its cancellation, by either player.
+        A draw is agreed when the other player repeats it, and a forfeit when the same player repeats it,
+        which makes the other player the winner.
+        """
+        game = self.game
+        if author_id not in game.players:
+            return
+        if text == 'draw':
+            if not game.draw_suggested:
+                game.draw_suggested = author_id
+            elif game.draw_suggested != author_id:
+                self.drawn = True
+        elif text == 'forfeit':
+            if not game.forfeit_suggested:
+                game.forfeit_suggested = author_id
+            elif game.forfeit_suggested == author_id:
+                self.current_player = 2 if author_id == game.players[0].uid else 1
+                self.won = True
+        elif game.draw_suggested:
+            game.draw_suggested = 0
+        elif author_id == game.forfeit_suggested:
+            game.forfeit_suggested = 0
+
+    def finish(self) -> Game:
+        """
+        Writes the rebuilt board and turn into the game.
+        :return: The rebuilt game.
+        """
+        cache = self.game.cache
+        cache.latest = self.board
+        cache.current_player = self.current_player
+        cache.move = None
+        return self.game
@@ -0,0 +1,126 @@
+"""
+Renders boards as images, so a whole board fits in one message instead of several emoji messages.
+
+Everything that does not change between moves is drawn once and cached: the background of a board
+size, with a label on every cell naming it as a player would type it, and a solid tile per color.
+Base tiles are outlined, since a player's base emoji is often the same color as their tile emoji.
+Rendering a board pastes the tiles of the occupied cells onto a copy of the background.
+Pillow is imported on first use, since most processes never render an image.
+"""
+import io
+from functools import lru_cache
+
+from model.state import *
+
+Color = Tuple[int, int, int]
+
+
+class BoardRenderer(object):
+    """
+    Draws boards of one size. To obtain one, call
+        BoardRenderer.of(<rows>, <cols>)
+    and then
+        <renderer>.render_bytes(<board>, <palette>)
+    A palette is the (tile color, base color) of player 1 and of player 2.
+    """
+    tile = 26
+    gap = 2
+    background_color: Color = (54, 57, 72)
+    empty_color: Color = (32, 34, 37)
+    label_color: Color = (114, 118, 125)
+    base_outline_color: Color = (255, 255, 255)
+    base_outline = 3
+    default_palette: [(Color, Color)] = [((221, 46, 68), (128, 30, 32)), ((85, 172, 238), (64, 57, 193))]
+
+    def __init__(self, rows: int, cols: int):
+        self.layout = Layout.of(rows, cols)
+        self._background = None
+        self._sprites: {(Color, bool), object} = {}
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def of(rows: int, cols: int):
+        return BoardRenderer(rows, cols)
+
+    @property
+    def size(self) -> (int, int):
+        step = BoardRenderer.tile + BoardRenderer.gap
+        return self.layout.cols * step + BoardRenderer.gap, self.layout.rows * step + BoardRenderer.gap
+
+    def origin(self, pos: Position) -> (int, int):
+        """
+        :return: The top left pixel of a cell.
+        """
+        step = BoardRenderer.tile + BoardRenderer.gap
+        return pos[1] * step + BoardRenderer.gap, pos[0] * step + BoardRenderer.gap
+
+    def label(self, pos: Position) -> str:
+        """
+        :return: The shortest alias of a cell that a player can type to name it.
+        """
+        aliases = [alias for alias in self.layout.flags[pos[0]][pos[1]][0] if self.layout.translate(alias) == pos]
+        return min(aliases, key=len) if aliases else ''
+
+    def background(self):
+        """
+        The empty board, with every cell labelled by its alias, drawn the first time it is needed.
+        """
+        if self._background is None:
+            from PIL import Image, ImageDraw, ImageFont
+
+            image = Image.new('RGB', self.size, BoardRenderer.background_color)
+            draw = ImageDraw.Draw(image)
+            font = ImageFont.load_default()
+            for i in range(self.layout.rows):
+                for j in range(self.layout.cols):
+                    x, y = self.origin((i, j))
+                    draw.rectangle([x, y, x + BoardRenderer.tile - 1, y + BoardRenderer.tile - 1],
+                                   fill=BoardRenderer.empty_color)
+                    draw.text((x + 2, y + 7), self.label((i, j)), fill=BoardRenderer.label_color, font=font)
+            self._background = image
+        return self._background
+
+    def sprite(self, color: Color, base: bool = False):
+        """
+        A tile of a solid color, outlined if it is a base, drawn the first time it is used.
+        """
+        sprite = self._sprites.get((color, base))
+        if sprite is None:
+            from PIL import Image, ImageDraw
+
+            sprite = Image.new('RGB', (BoardRenderer.tile, BoardRenderer.tile), color)
+            if base:
+                ImageDraw.Draw(sprite).rectangle([0, 0, BoardRenderer.tile - 1, BoardRenderer.tile - 1],
+                                                 outline=BoardRenderer.base_outline_color,
+                                                 width=BoardRenderer.base_outline)
+            self._sprites[(color, base)] = sprite
+        return sprite
+
+    def render(self, board: Board, palette: [(Color, Color)] = None):
+        """
+        :param palette: The (tile color, base color) of each player, red and blue by default.
+        :return: The board as a Pillow image.
+        """
+        palette = palette or BoardRenderer.default_palette
+        image = self.background().copy()
+        for i, row in enumerate(board):
+            for j, cell in enumerate(row):
+                if cell.player:
+                    image.paste(self.sprite(palette[cell.player - 1][1 if cell.base else 0], cell.base),
+                                self.origin((i, j)))
+        return image
+
+    def render_bytes(self, board: Board, palette: [(Color, Color)] = None, image_format: str = 'PNG') -> bytes:
+        """
+        :return: The board encoded as an image file, PNG by default.
+        """
+        out = io.BytesIO()
+        self.render(board, palette).save(out, format=image_format)
+        return out.getvalue()
+
+
+def rgb(color: int) -> Color:
+    """
+    :return: The red, green and blue parts of a 0xRRGGBB color.
+    """
+    return (color >> 16) & 0xff, (color >> 8) & 0xff, color & 0xff
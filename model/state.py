@@ -1,8 +1,8 @@
 import json
 import math
 import os
-from collections import deque
-from functools import partial
+from collections import Counter
+from functools import partial, lru_cache
 from heapq import heappush, heappop
 from pathlib import Path
 from typing import Tuple
@@ -96,6 +96,129 @@ def generate_flag_array() -> [[Flag]]:
         return json.load(f)
 
 
+def row_name(r: int) -> str:
+    """
+    :return: Letters naming a row, 'a' to 'z' and then 'aa' onwards.
+    """
+    name = ''
+    r += 1
+    while r:
+        r, letter = divmod(r - 1, 26)
+        name = chr(ord('a') + letter) + name
+    return name
+
+
+class Layout(object):
+    """
+    Everything about a board size that stays the same for every board of that size:
+    base placement, adjacency, vanquish squares and flags.
+    Layouts are computed once per size, so to obtain one, call
+        Layout.of(<rows>, <cols>)
+    """
+    sizes: {str, Position} = {'small': (7, 14), 'medium': (14, 28), 'large': (21, 42)}
+    adjacent_offsets = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    vanquish_offsets = [(i, j) for i in range(4) for j in range(4)]
+    vanquish_surround = [(-1, 0), (-1, 1), (-1, 2), (-1, 3),
+                         (4, 0), (4, 1), (4, 2), (4, 3),
+                         (0, -1), (1, -1), (2, -1), (3, -1),
+                         (0, 4), (1, 4), (2, 4), (3, 4)]
+    # cells between each HQ and the nearest wall, enough to allow a vanquish
+    wall_gap = 4
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.hq_size = max(1, rows // 7)
+        self.base_offsets: [Position] = [(i, j) for i in range(self.hq_size) for j in range(self.hq_size)]
+        # cells of a 3 by 3 HQ inside the ring, shown in the cell color
+        self.hq_inner: [Position] = [(1, 1)] if self.hq_size == 3 else []
+        top = (rows - self.hq_size) // 2
+        self.bases: [Position] = [(top, Layout.wall_gap), (top, cols - Layout.wall_gap - self.hq_size)]
+        self.neighbours: [[[Position]]] = [
+            [[(i + dx, j + dy) for dx, dy in Layout.adjacent_offsets
+              if 0 <= i + dx < rows and 0 <= j + dy < cols] for j in range(cols)] for i in range(rows)]
+        # the neighbours again by flat index, row * cols + column, for the rule functions
+        self.flat_neighbours: [[int]] = [[i * cols + j for i, j in cells]
+                                         for row in self.neighbours for cells in row]
+        # every 4 by 4 square that fits on the board by its top left corner,
+        # with the flat indices of its cells and of the surrounding cells on the board
+        self.vanquish_windows: {Position, ([int], [int])} = {}
+        for i in range(rows - 3):
+            for j in range(cols - 3):
+                square = [(i + dx) * cols + j + dy for dx, dy in Layout.vanquish_offsets]
+                surround = [(i + dx) * cols + j + dy for dx, dy in Layout.vanquish_surround
+                            if 0 <= i + dx < rows and 0 <= j + dy < cols]
+                self.vanquish_windows[(i, j)] = (square, surround)
+        self._flags: [[Flag]] = None
+        self._positions: {str, Position} = None
+        self._aliases: {Position, str} = None
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def of(rows: int, cols: int):
+        return Layout(rows, cols)
+
+    @property
+    def flags(self) -> [[Flag]]:
+        """
+        The flag of every cell, read the first time it is needed.
+        Medium boards use the flag file, small boards the middle rows and outer columns of it,
+        and other sizes name cells by coordinates, such as 'c12' for row 2, column 11.
+        """
+        if self._flags is None:
+            medium_rows, medium_cols = Layout.sizes['medium']
+            medium = generate_flag_array()
+            if (self.rows, self.cols) == (medium_rows, medium_cols):
+                self._flags = medium
+            elif (self.rows, self.cols) == Layout.sizes['small']:
+                top = (medium_rows - self.rows) // 2
+                half = self.cols // 2
+                flags = [row[:half] + row[medium_cols - (self.cols - half):] for row in medium[top:top + self.rows]]
+                # cells of the larger medium HQs that are not part of a small HQ get a flag from the middle columns
+                base_cells = {(r + dx, c + dy) for r, c in self.bases for dx, dy in self.base_offsets}
+                counts = Counter(alias for row in flags for flag in row for alias in flag[0])
+                for i, row in enumerate(flags):
+                    spare = iter(medium[top + i][half:medium_cols - (self.cols - half)])
+                    for j, flag in enumerate(row):
+                        if (i, j) not in base_cells and any(counts[alias] > 1 for alias in flag[0]):
+                            row[j] = next(spare)
+                self._flags = flags
+            else:
+                # the medium flags are stretched over the board so it looks the same
+                self._flags = [[([f'{row_name(i)}{j + 1}'],
+                                 medium[i * medium_rows // self.rows][j * medium_cols // self.cols][1])
+                                for j in range(self.cols)] for i in range(self.rows)]
+        return self._flags
+
+    def translate(self, alias: str) -> Position:
+        """
+        :return: The position of the flag with the given alias, or None.
+        """
+        if self._positions is None:
+            positions = {}
+            for r, row in enumerate(self.flags):
+                for c, flag in enumerate(row):
+                    for name in flag[0]:
+                        positions.setdefault(name, (r, c))
+            self._positions = positions
+        return self._positions.get(alias)
+
+    def alias(self, pos: Position) -> str:
+        """
+        :return: An alias that translate() turns back into the given position, or None.
+        """
+        if self._aliases is None:
+            aliases = {}
+            for r, row in enumerate(self.flags):
+                for c, flag in enumerate(row):
+                    for name in flag[0]:
+                        if self.translate(name) == (r, c):
+                            aliases[(r, c)] = name
+                            break
+            self._aliases = aliases
+        return self._aliases.get(tuple(pos))
+
+
 class Board(list):
     """
     A representation of the state of the game and its transformations
@@ -108,33 +231,40 @@ class Board(list):
        so the first coordinate may range from 0 to rows - 1
        and the second coordinate may range from 0 to cols - 1
     """
-    adjacent_offsets = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-    base_offsets = [(i, j) for i in range(2) for j in range(2)]
-    vanquish_offsets = [(i, j) for i in range(4) for j in range(4)]
-    vanquish_surround = [(-1, 0), (-1, 1), (-1, 2), (-1, 3),
-                         (4, 0), (4, 1), (4, 2), (4, 3),
-                         (0, -1), (1, -1), (2, -1), (3, -1),
-                         (0, 4), (1, 4), (2, 4), (3, 4)]
-
-    flag_array: [[Flag]] = generate_flag_array()
+    adjacent_offsets = Layout.adjacent_offsets
+    vanquish_offsets = Layout.vanquish_offsets
+    vanquish_surround = Layout.vanquish_surround
 
     def __init__(self, r: int, c: int, bases: [Position]):
         super().__init__()
         self.rows = r
         self.cols = c
-        self.extend([[Cell() for j in range(c)] for i in range(r)])
+        # every cell by flat index, row * cols + column, shared with the rows
+        self._cells: [Cell] = [Cell() for _ in range(r * c)]
+        self.extend([self._cells[i * c:(i + 1) * c] for i in range(r)])
         self.bases = bases
 
         self.make_base(1)
         self.make_base(2)
 
+    @property
+    def layout(self) -> Layout:
+        return Layout.of(self.rows, self.cols)
+
+    @property
+    def flag_array(self) -> [[Flag]]:
+        """
+        The flags of the board, read from the flag file the first time any board of this size needs them.
+        """
+        return self.layout.flags
+
     def make_base(self, player: int):
         """
         Creates a new base.
         :param player: The player that owns the base.
         """
         center = self.bases[player - 1]
-        for dx, dy in Board.base_offsets:
+        for dx, dy in self.layout.base_offsets:
             self[center[0] + dx][center[1] + dy].set_base(player)
 
     def deepcopy(self):
@@ -142,12 +272,26 @@ class Board(list):
         Creates a completely new class with identical values.
         :return: A new Board with the same values as the given instance.
         """
-        cpy = Board(self.rows, self.cols, self.bases)
-        for i in range(self.rows):
-            for j in range(self.cols):
-                cpy[i][j] = self[i][j].copy()
+        cpy = Board.__new__(Board)
+        cpy.rows = self.rows
+        cpy.cols = self.cols
+        cpy.bases = self.bases
+        cpy._cells = [Cell(cell.player, cell.base) for cell in self._cells]
+        cpy.extend([cpy._cells[i * self.cols:(i + 1) * self.cols] for i in range(self.rows)])
         return cpy
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_cells' not in state:
+            # boards pickled before the flat cell table
+            self._cells = [cell for row in self for cell in row]
+
+    def cells(self) -> [Cell]:
+        """
+        :return: Every cell of the board by flat index, row * cols + column. The cells are the board's own.
+        """
+        return self._cells
+
     def is_valid_position(self, pos: Position) -> bool:
         """
         Tests if the given position fits on the board.
@@ -162,11 +306,9 @@ class Board(list):
         :param base: Whether or not base cell included in the list
         :return: An adjacent cell using yield.
         """
-        for dx, dy in Board.adjacent_offsets:
-            loc = (center[0] + dx, center[1] + dy)
-            if self.is_valid_position(loc):
-                if base or not self[loc[0]][loc[1]].base:
-                    yield loc
+        for loc in self.layout.neighbours[center[0]][center[1]]:
+            if base or not self[loc[0]][loc[1]].base:
+                yield loc
 
     def acquire(self, player: int, locs: [Position], validate=False):
         """
@@ -190,60 +332,71 @@ class Board(list):
         :return:
         """
         enemy = 3 - player
-        # player cells that touch enemy cell
-        touching = [[0 for j in range(self.cols)] for i in range(self.rows)]
-        # fill queue w player cells
-        q = deque()
-        for i in range(self.rows):
-            for j in range(self.cols):
-                loc = (i, j)
-                if self[loc[0]][loc[1]].player == player and not self[loc[0]][loc[1]].base:
-                    q.append(loc)
-        # begin teh konker
-        while q:
-            # newly conquered cell
-            curr = q.popleft()
-            for i, j in self.adjacent(curr):
-                adj = (i, j)
-                # update neighbour
-                if self[adj[0]][adj[1]].player == enemy:
-                    touching[i][j] += 1
-                    if touching[i][j] >= 2:
-                        # conquer neighbour
-                        self[adj[0]][adj[1]].player = player
-                        q.append(adj)
+        cells = self._cells
+        neighbours = self.layout.flat_neighbours
+        # player cells that touch each enemy cell, a byte per cell since no cell has more than four neighbours
+        touching = bytearray(len(cells))
+        # conquered cells that the scan below has already passed
+        behind = []
+        # the result does not depend on the order player cells are visited in, so visit them in board order
+        for k in range(len(cells)):
+            cell = cells[k]
+            if cell.player != player or cell.base:
+                continue
+            curr = k
+            while True:
+                for n in neighbours[curr]:
+                    adj = cells[n]
+                    # update neighbour
+                    if adj.player == enemy and not adj.base:
+                        touching[n] += 1
+                        if touching[n] >= 2:
+                            # conquer neighbour
+                            adj.player = player
+                            # cells ahead of the scan are visited when it gets there
+                            if n < k:
+                                behind.append(n)
+                if not behind:
+                    break
+                curr = behind.pop()
 
     def vanquish_spots(self, player: int):
-        return [(i,j) for i in range(self.rows) for j in range(self.cols) 
-                if self.is_valid_vanquish(player, (i,j))]
+        cells = self._cells
+        return [corner for corner, window in self.layout.vanquish_windows.items()
+                if Board._valid_window(cells, player, window)]
 
-    def is_valid_vanquish(self, player: int, corner: Position) -> bool:
+    @staticmethod
+    def _valid_window(cells: [Cell], player: int, window: ([int], [int])) -> bool:
         """
-        Checks whether a given vanquish is a valid move
-        :param player: The player who is vanquishing.
-        :param corner: Top left corner of the square to be vanquished.
-        :return: True if move is valid, or else False
+        :param cells: The cells of the board by flat index.
+        :param window: The cells of a square and around it, from Layout.vanquish_windows.
         """
+        square, surround = window
         # check that player surrounds square
         surrounding = 0
-        for dx, dy in Board.vanquish_surround:
-            loc = (corner[0] + dx, corner[1] + dy)
-            if self.is_valid_position(loc):
-                cell = self[loc[0]][loc[1]]
-                if not cell.base and cell.player == player:
-                    surrounding += 1
+        for k in surround:
+            if cells[k].player == player and not cells[k].base:
+                surrounding += 1
         if surrounding < 4:
             return False
         # check that square is a single color of nonbase cells
-        square_player = self[corner[0]][corner[1]].player
-        for dx, dy in Board.vanquish_offsets:
-            loc = (corner[0] + dx, corner[1] + dy)
-            if not self.is_valid_position(loc) or self[loc[0]][loc[1]].base or \
-                    self[loc[0]][loc[1]].player != square_player:
+        square_player = cells[square[0]].player
+        for k in square:
+            if cells[k].base or cells[k].player != square_player:
                 return False
-        # is a valid move
         return True
 
+    def is_valid_vanquish(self, player: int, corner: Position) -> bool:
+        """
+        Checks whether a given vanquish is a valid move
+        :param player: The player who is vanquishing.
+        :param corner: Top left corner of the square to be vanquished.
+        :return: True if move is valid, or else False
+        """
+        window = self.layout.vanquish_windows.get(tuple(corner))
+        # squares that do not fit on the board are never valid
+        return window is not None and Board._valid_window(self._cells, player, window)
+
     def vanquish(self, player: int, corner: Position, validate=False):
         """
         Vanquishes a 4x4 square of the same color given that:
@@ -251,31 +404,15 @@ class Board(list):
         :param player: The player who is vanquishing.
         :param corner: Top left corner of the square to be vanquished.
         """
-        # check that player surrounds square
-        if validate:
-            surrounding = 0
-            for dx, dy in Board.vanquish_surround:
-                loc = (corner[0] + dx, corner[1] + dy)
-                if self.is_valid_position(loc):
-                    cell = self[loc[0]][loc[1]]
-                    if not cell.base and cell.player == player:
-                        surrounding += 1
-            if surrounding < 4:
-                raise InvalidMove()
-        # check that square is a single color
-        square_player = self[corner[0]][corner[1]].player
-        square = []
-        for dx, dy in Board.vanquish_offsets:
-            loc = (corner[0] + dx, corner[1] + dy)
-            if validate:
-                if not self.is_valid_position(loc) or \
-                        self[loc[0]][loc[1]].base or \
-                        self[loc[0]][loc[1]].player != square_player:
-                    raise InvalidMove()
-            square.append(self[loc[0]][loc[1]])
+        window = self.layout.vanquish_windows.get(tuple(corner))
+        if window is None:
+            raise InvalidMove()
+        cells = self._cells
+        if validate and not Board._valid_window(cells, player, window):
+            raise InvalidMove()
         # delete square
-        for sq in square:
-            sq.player = 0
+        for k in window[0]:
+            cells[k].player = 0
 
     def conquest(self, player: int):
         """
@@ -283,45 +420,50 @@ class Board(list):
         :param player: The player number that is attempting the move.
         """
         enemy = 3 - player
+        cells = self._cells
+        neighbours = self.layout.flat_neighbours
         # distance to player base
-        dist = [[math.inf for j in range(self.cols)] for i in range(self.rows)]
+        dist = [math.inf] * len(cells)
         # is distance fixed
-        visited = [[False for j in range(self.cols)] for i in range(self.rows)]
+        visited = [False] * len(cells)
         # path from player base
-        prev = [[None for j in range(self.cols)] for i in range(self.rows)]
+        prev = [None] * len(cells)
 
         i, j = self.bases[player - 1]
-        start = (i, j)
-        dist[i][j] = 0
+        start = i * self.cols + j
+        dist[start] = 0
         pq = [(0, start)]
 
         while pq:
             # current least-distance cell
             path_len, curr = heappop(pq)
-            visited[curr[0]][curr[1]] = True
-            for i, j in self.adjacent(curr, base=True):
-                if not visited[i][j] and self[i][j].player == player:
+            visited[curr] = True
+            for k in neighbours[curr]:
+                cell = cells[k]
+                if not visited[k] and cell.player == player:
                     # update unvisited neighbours for shorter path
-                    if dist[i][j] > path_len + 1:
-                        prev[i][j] = curr
-                        dist[i][j] = path_len + 1
-                        heappush(pq, (dist[i][j], (i, j)))
+                    if dist[k] > path_len + 1:
+                        prev[k] = curr
+                        dist[k] = path_len + 1
+                        heappush(pq, (dist[k], k))
                 # trace path if found
-                if self[i][j].base and self[i][j].player == enemy:
+                if cell.base and cell.player == enemy:
                     while curr != start:
-                        self[curr[0]][curr[1]].base = True
-                        curr = prev[curr[0]][curr[1]]
+                        cells[curr].base = True
+                        curr = prev[curr]
                     return
         # no path found
         raise InvalidMove
 
     def __str__(self):
         """
-        Converts the Board into a readable string that is sent
-        to the discord client as 3 separate messages.
+        Converts the Board into a readable string, one row per line,
+        which Game splits into as few messages as the length limit allows.
         """
+        layout = self.layout
+        inner = {(top + dx, left + dy) for top, left in self.bases for dx, dy in layout.hq_inner}
         emoji_string = ''
-        for j, (cell_row, flag_row) in enumerate(zip(self, Board.flag_array)):
+        for j, (cell_row, flag_row) in enumerate(zip(self, layout.flags)):
             for i, (cell, flag) in enumerate(zip(cell_row, flag_row)):
                 player = cell.player
                 if player == 0:
@@ -330,17 +472,13 @@ class Board(list):
                 else:
                     # player cell stand-in code
                     emoji = 'p' + str(player)
-                    if cell.base:
+                    if cell.base and (j, i) not in inner:
                         # base stand-in code
                         emoji += 'b'
                 # add this cell's emoji to string
                 emoji_string += emoji
-                # if row end, add line break
-                if i == 27:
-                    emoji_string += '\n'
-                    # add message breaks on 5th and 9th rows
-                    if j == 4 or j == 8:
-                        emoji_string += '#msg'
+            # row end, add line break
+            emoji_string += '\n'
         return emoji_string
 
 
@@ -375,18 +513,27 @@ class Move(object):
 
     def __call__(self, board: Board, *, validate=False):
         b = board.deepcopy()
+        self.apply(b, validate=validate)
+        return b
+
+    def apply(self, board: Board, *, validate=False):
+        """
+        Executes the move on the given board in place.
+        Every move raises InvalidMove before changing any cell, so a rejected move leaves the board untouched.
+        :param board: The board to change.
+        :param validate: Whether or not to validate if the move can be performed.
+        """
         if self.move_type == 'A':
-            func = partial(b.acquire, validate=validate)
+            func = partial(board.acquire, validate=validate)
         elif self.move_type == 'C':
-            func = b.conquer
+            func = board.conquer
         elif self.move_type == 'V':
-            func = partial(b.vanquish, validate=validate)
+            func = partial(board.vanquish, validate=validate)
         elif self.move_type == 'Q':
-            func = b.conquest
+            func = board.conquest
         else:
             raise InvalidMove
         func(**{k: v for k, v in self.__dict__.items() if k != 'move_type'})
-        return b
 
 
 class InvalidMove(Exception):
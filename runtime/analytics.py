@@ -0,0 +1,146 @@
+"""
+Post-game analytics over the game archive, written as CSV for offline analysis.
+
+Finished games are read one at a time and replayed on a single board, so memory use does not
+grow with the size of the archive. Two files are written to the output directory:
+    games.csv   one row per game: players, their Elo, winner, length and move counts
+    moves.csv   one row per move: the player, the move type and how many cells it changed
+
+Games already in games.csv are skipped, so running the job again only appends new games.
+Elo is the players' current Elo, since the archive does not record Elo at the time of the game.
+
+Usage:
+    python -m runtime.analytics
+    python -m runtime.analytics --data data/ --out data/analytics/
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from pathlib import Path
+
+from model.archive import GameArchive
+from model.game import *
+from runtime.store import SharedStore, PlayerStore
+
+game_columns = ['game_id', 'player1', 'player2', 'player1_elo', 'player2_elo', 'winner', 'moves',
+                'acquires', 'conquers', 'vanquishes', 'conquests', 'largest_swing', 'first_player_won']
+move_columns = ['game_id', 'move', 'player', 'type', 'cells']
+
+
+def count_cells(board: Board, player: int, base: bool = False) -> int:
+    return sum(1 for row in board for cell in row if cell.player == player and cell.base == base)
+
+
+def analyse_game(game: Game) -> ({str, object}, [{str, object}]):
+    """
+    Replays a game, measuring every move.
+    :return: The row of the game and the rows of its moves.
+    """
+    hist = game.history
+    board = Board(hist.rows, hist.cols, hist.bases)
+    moves = []
+    counts = {'A': 0, 'C': 0, 'V': 0, 'Q': 0}
+    winner = 0
+    for number, mv in enumerate(hist.moves):
+        move = Move(**mv)
+        if move.move_type == 'A':
+            cells = len(move.locs)
+        elif move.move_type == 'V':
+            cells = len(Board.vanquish_offsets)
+        elif move.move_type == 'C':
+            before = count_cells(board, move.player)
+        else:
+            before = count_cells(board, move.player, base=True)
+        move.apply(board)
+        if move.move_type == 'C':
+            cells = count_cells(board, move.player) - before
+        elif move.move_type == 'Q':
+            cells = count_cells(board, move.player, base=True) - before
+            winner = move.player
+        counts[move.move_type] += 1
+        moves.append({'game_id': game.game_id, 'move': number, 'player': move.player,
+                      'type': move.move_type, 'cells': cells})
+
+    players = list(game.players) + [None] * (2 - len(game.players))
+    swings = [row['cells'] for row in moves if row['type'] == 'C']
+    row = {
+        'game_id': game.game_id,
+        'player1': players[0].uid if players[0] else '',
+        'player2': players[1].uid if players[1] else '',
+        'player1_elo': players[0].elo if players[0] else '',
+        'player2_elo': players[1].elo if players[1] else '',
+        'winner': winner,
+        'moves': len(moves),
+        'acquires': counts['A'],
+        'conquers': counts['C'],
+        'vanquishes': counts['V'],
+        'conquests': counts['Q'],
+        'largest_swing': max(swings, default=0),
+        'first_player_won': int(winner == 1) if winner else '',
+    }
+    return row, moves
+
+
+def processed_games(games_file: Path) -> {int}:
+    """
+    :return: The ids of the games already written to the games file.
+    """
+    if not os.path.exists(games_file):
+        return set()
+    with open(games_file, 'r', newline='') as f:
+        return {int(row['game_id']) for row in csv.DictReader(f)}
+
+
+def run(archive: GameArchive, out_dir: Path) -> (int, int):
+    """
+    Appends the games of the archive that are not in the output yet.
+    :return: The number of games and moves written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    games_file = out_dir.joinpath('games.csv')
+    moves_file = out_dir.joinpath('moves.csv')
+    done = processed_games(games_file)
+    # a moves file without a games file is left over from an interrupted first run
+    fresh = not done and not os.path.exists(games_file)
+    game_count = move_count = 0
+    with open(games_file, 'a', newline='') as gf, open(moves_file, 'w' if fresh else 'a', newline='') as mf:
+        game_writer = csv.DictWriter(gf, game_columns)
+        move_writer = csv.DictWriter(mf, move_columns)
+        if fresh:
+            game_writer.writeheader()
+            move_writer.writeheader()
+        for game_id in list(archive.index):
+            if game_id in done:
+                continue
+            try:
+                game = archive.load(game_id)
+            except (KeyError, InvalidRecord):
+                print(f'Skipping unreadable game {game_id}.')
+                continue
+            row, moves = analyse_game(game)
+            # moves first, so a game is only marked done once its moves are written
+            move_writer.writerows(moves)
+            game_writer.writerow(row)
+            game_count += 1
+            move_count += len(moves)
+    return game_count, move_count
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(description='Writes per-game and per-move statistics of finished games.')
+    parser.add_argument('--data', type=Path, default=Path('data/'), help='the bot\'s data directory')
+    parser.add_argument('--out', type=Path, default=None, help='output directory, <data>/analytics/ by default')
+    args = parser.parse_args(argv)
+
+    players = PlayerStore(SharedStore(args.data.joinpath('shared.db')))
+    archive = GameArchive(args.data.joinpath('history/'), players)
+    start = time.perf_counter()
+    games, moves = run(archive, args.out or args.data.joinpath('analytics/'))
+    print(f'Wrote {games} games and {moves} moves in {time.perf_counter() - start:.2f}s.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
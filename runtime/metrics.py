@@ -0,0 +1,186 @@
+"""
+Timing instrumentation for the bot's hot paths.
+
+Durations are aggregated into histograms keyed by metric name and labels, and counters hold totals.
+Both can be rendered in the Prometheus text format and served on a local port, or summarised
+for the admin stats command.
+
+To time a block, use
+    with metrics.timer('disquid_command_seconds', command='start'):
+        ...
+"""
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+
+Labels = ((str, str),)
+
+
+class Histogram(object):
+    """
+    Counts observations into cumulative buckets, the way Prometheus histograms do.
+    """
+
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+    def __init__(self):
+        self.counts = [0] * len(Histogram.buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(Histogram.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, fraction: float) -> float:
+        """
+        :return: The upper bound of the bucket holding the given quantile.
+        """
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(Histogram.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return math.inf
+
+
+class Timing(object):
+    """
+    The duration of a block timed with Metrics.timer, in seconds.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+
+class Metrics(object):
+    """
+    Holds every histogram and counter of the process.
+    """
+
+    def __init__(self):
+        self.histograms: {(str, Labels), Histogram} = {}
+        self.counters: {(str, Labels), float} = {}
+        self.server = None
+
+    @staticmethod
+    def key(name: str, labels: {str, str}) -> (str, Labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = Metrics.key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def add(self, name: str, value: float = 1, **labels):
+        key = Metrics.key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def remove(self, name: str, **labels):
+        """
+        Drops a counter, for labels that stop being relevant such as a finished game.
+        """
+        self.counters.pop(Metrics.key(name, labels), None)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Observes how long the enclosed block took, in seconds, even if it raises.
+        Works around awaits as well, in which case the time spent suspended is included.
+        The yielded Timing holds the duration once the block exits.
+        """
+        timing = Timing()
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.elapsed = time.perf_counter() - start
+            self.observe(name, timing.elapsed, **labels)
+
+    @staticmethod
+    def format_labels(labels: Labels, extra: str = None) -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render(self) -> str:
+        """
+        :return: Every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(Histogram.buckets, histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                bound_label = f'le="{le}"'
+                lines.append(f'{name}_bucket{Metrics.format_labels(labels, bound_label)} {cumulative}')
+            lines.append(f'{name}_sum{Metrics.format_labels(labels)} {histogram.total}')
+            lines.append(f'{name}_count{Metrics.format_labels(labels)} {histogram.count}')
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{Metrics.format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, top: int = 10) -> [str]:
+        """
+        :return: Lines describing the histograms and counters with the most total time, highest first.
+        """
+        lines = []
+        by_total = sorted(self.histograms.items(), key=lambda item: item[1].total, reverse=True)
+        for (name, labels), histogram in by_total[:top]:
+            label_str = ','.join(v for _, v in labels)
+            lines.append(f'{name}[{label_str}]: {histogram.count} calls, '
+                         f'{histogram.total / histogram.count * 1000:.1f}ms mean, '
+                         f'p99 <= {histogram.quantile(0.99) * 1000:.0f}ms, {histogram.total:.1f}s total')
+        by_value = sorted(self.counters.items(), key=lambda item: item[1], reverse=True)
+        for (name, labels), value in by_value[:top]:
+            label_str = ','.join(v for _, v in labels)
+            lines.append(f'{name}[{label_str}]: {value:.2f}')
+        return lines
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9108):
+        """
+        Serves the rendered metrics over HTTP on a local port, for Prometheus to scrape.
+        Calling this again while already serving does nothing.
+        """
+        if self.server:
+            return
+
+        async def respond(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request = await reader.readline()
+                # discard the headers
+                while (await reader.readline()).strip():
+                    pass
+                if request.split()[1:2] == [b'/metrics']:
+                    body = self.render().encode()
+                    status = b'200 OK'
+                else:
+                    body = b'Not found\n'
+                    status = b'404 Not Found'
+                writer.write(b'HTTP/1.0 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        self.server = await asyncio.start_server(respond, host, port)
+
+
+metrics = Metrics()
@@ -0,0 +1,90 @@
+"""
+Pools of Discord objects that are expensive to create and delete, kept for reuse between games.
+
+Creating and deleting channels and roles are slow, heavily rate limited API calls, so finished
+games hand their channel and color roles back to a pool and new games take them from it.
+Pools hold ids grouped by a key, such as (guild id, category id) for channels or (guild id, color)
+for roles, and are saved as JSON with the rest of the bot's state.
+"""
+import json
+import os
+from collections import deque
+from pathlib import Path
+
+
+class ResourcePool(object):
+    """
+    Ids of free objects grouped by key. Ids are handed out oldest first.
+    :param limit: Free objects kept per key, beyond which given objects are refused, so the caller deletes them.
+    """
+
+    def __init__(self, limit: int = 8):
+        self.limit = limit
+        self.free: {object, deque} = {}
+        self._keys: {int, object} = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, object_id: int):
+        return object_id in self._keys
+
+    def take(self, key) -> int:
+        """
+        :return: The id of a free object with the key, or None.
+        """
+        ids = self.free.get(key)
+        if not ids:
+            return None
+        object_id = ids.popleft()
+        del self._keys[object_id]
+        if not ids:
+            del self.free[key]
+        return object_id
+
+    def give(self, key, object_id: int) -> bool:
+        """
+        :return: Whether the object was pooled. If not, the caller should delete it.
+        """
+        if object_id in self._keys:
+            return True
+        ids = self.free.setdefault(key, deque())
+        if len(ids) >= self.limit:
+            return False
+        ids.append(object_id)
+        self._keys[object_id] = key
+        return True
+
+    def discard(self, object_id: int):
+        """
+        Forgets an object, such as one deleted by someone else.
+        """
+        key = self._keys.pop(object_id, None)
+        if key is not None:
+            self.free[key].remove(object_id)
+            if not self.free[key]:
+                del self.free[key]
+
+    def to_json(self) -> [[object]]:
+        return [[key, list(ids)] for key, ids in self.free.items()]
+
+    def load_json(self, entries: [[object]]):
+        for key, ids in entries:
+            # JSON turns tuple keys into lists
+            key = tuple(key) if isinstance(key, list) else key
+            for object_id in ids:
+                self.give(key, object_id)
+
+
+def save_pools(path: Path, pools: {str, ResourcePool}):
+    with open(path, 'w') as f:
+        json.dump({name: pool.to_json() for name, pool in pools.items()}, f)
+
+
+def load_pools(path: Path, pools: {str, ResourcePool}):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    for name, pool in pools.items():
+        pool.load_json(saved.get(name, []))
@@ -0,0 +1,109 @@
+"""
+Diagnostics for a live event loop: a sampling profiler and a loop lag monitor.
+
+Both work from a separate thread by reading the loop thread's current frame,
+so they can see code that is blocking the loop without the loop's cooperation.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_stack(thread_id: int) -> [str]:
+    """
+    :return: The frames currently running on a thread, outermost first, as 'file:function:line'.
+    """
+    frame = sys._current_frames().get(thread_id)
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stack of one thread at a fixed interval and counts identical stacks.
+    The result is in the collapsed stack format read by flamegraph.pl and speedscope.
+    :param thread_id: Identifier of the thread to sample, as given by threading.get_ident().
+    :param interval: Seconds between samples.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+
+    def run(self, duration: float):
+        """
+        Samples for the given number of seconds. Blocks, so run it outside the sampled thread.
+        """
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            stack = frame_stack(self.thread_id)
+            if stack:
+                self.samples[';'.join(stack)] += 1
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+class LoopMonitor(object):
+    """
+    Watches an event loop for lag.
+    A coroutine on the loop records a heartbeat, and a watchdog thread checks it. When the heartbeat
+    is late by more than the threshold, the watchdog logs the stack that is holding the loop,
+    and logs the total lag once the loop is free again.
+    :param loop: The loop to watch, which must be running on the current thread when start() is called.
+    :param threshold: Seconds of lag before a stall is logged.
+    :param interval: Seconds between heartbeats.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.5, interval: float = 0.1):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.beat = time.monotonic()
+        self.thread_id = None
+        self.stalls = 0
+        self.worst = 0.0
+        self._task = None
+
+    def start(self):
+        """
+        Starts the heartbeat and the watchdog. Calling this again does nothing.
+        """
+        if self._task:
+            return
+        self.thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self._task = self.loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name='loop-monitor', daemon=True).start()
+
+    async def _heartbeat(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        stalled_since = None
+        while not self.loop.is_closed():
+            time.sleep(self.interval)
+            lag = time.monotonic() - self.beat - self.interval
+            if lag > self.threshold and stalled_since is None:
+                stalled_since = self.beat
+                self.stalls += 1
+                stack = frame_stack(self.thread_id)
+                print(f'Event loop blocked for {lag:.2f}s, currently in:\n  ' + '\n  '.join(stack[-12:]))
+            elif lag <= self.threshold and stalled_since is not None:
+                total = self.beat - stalled_since - self.interval
+                self.worst = max(self.worst, total)
+                print(f'Event loop unblocked after {total:.2f}s.')
+                stalled_since = None
+
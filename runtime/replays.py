@@ -0,0 +1,139 @@
+"""
+Replay videos of finished games, rendered in a pool of worker processes and rebuilt only when needed.
+
+Every video is recorded in a manifest with a hash of the game's moves, so a video is only rendered
+again when it is missing or the game it shows has changed, and only posted once. Rendering a video
+encodes a frame per move, which is CPU bound, so videos are rendered in separate processes, as many
+at once as there are cores, instead of blocking the event loop one after another.
+
+Usage:
+    replays = ReplayBuilder(video_dir, temp_dir)
+    built = await replays.build(replays.stale(games))
+"""
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from model.game import Game
+from model.record import write_history
+
+
+def render_replay(data: bytes, temp_dir: str, video_dir: str, file_name: str) -> str:
+    """
+    Renders the video of a packed game. Runs in a worker process.
+    :return: The file name of the video.
+    """
+    game = Game.from_bytes(data, {})
+    game.to_video(Path(temp_dir), Path(video_dir), file_name)
+    return file_name
+
+
+class ReplayBuilder(object):
+    """
+    Keeps the videos in a directory up to date with the games they show.
+    Videos are saved as <game id>.mp4 and posted as <player 1>-v-<player 2>.mp4.
+    :param video_dir: Directory holding the videos and the manifest.
+    :param temp_dir: Directory for the frames of videos being rendered, one subdirectory per video.
+    :param workers: Videos rendered at once, the number of cores by default.
+    """
+    manifest_name = 'manifest.json'
+
+    def __init__(self, video_dir: Path, temp_dir: Path, workers: int = None):
+        self.video_dir = video_dir
+        self.temp_dir = temp_dir
+        self.workers = workers
+        self.manifest_file = video_dir.joinpath(ReplayBuilder.manifest_name)
+        # game id to the hash of the moves shown, the name it is posted as and whether it was posted
+        self.manifest: {int, dict} = {}
+        self._pool: ProcessPoolExecutor = None
+
+        os.makedirs(video_dir, exist_ok=True)
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r') as f:
+                self.manifest = {int(k): v for k, v in json.load(f).items()}
+
+    @staticmethod
+    def key(game: Game) -> str:
+        """
+        :return: A hash of everything a video of the game shows: the board size, the bases and the moves.
+        """
+        out = bytearray()
+        hist = game.history
+        write_history(out, hist.rows, hist.cols, hist.bases, hist.moves)
+        return hashlib.sha1(out).hexdigest()
+
+    @staticmethod
+    def display_name(game: Game) -> str:
+        return f'{game.players[0].name}-v-{game.players[1].name}.mp4'
+
+    def path(self, game_id: int) -> Path:
+        return self.video_dir.joinpath(f'{game_id}.mp4')
+
+    def is_current(self, game: Game) -> bool:
+        entry = self.manifest.get(game.game_id)
+        return entry is not None and entry['hash'] == ReplayBuilder.key(game) and os.path.exists(
+            self.path(game.game_id))
+
+    def stale(self, games) -> [Game]:
+        """
+        :param games: Games that should have a video.
+        :return: The games whose video is missing or shows different moves.
+        """
+        return [game for game in games if not self.is_current(game)]
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        return self._pool
+
+    async def build(self, games: [Game]) -> [Game]:
+        """
+        Renders the videos of the given games in the worker processes.
+        A game whose video fails to render is left out, so it is tried again on the next build.
+        :return: The games whose video was rendered.
+        """
+        if not games:
+            return []
+        loop = asyncio.get_event_loop()
+        renders = [loop.run_in_executor(self.pool(), render_replay, game.to_bytes(),
+                                        str(self.temp_dir.joinpath(str(game.game_id))), str(self.video_dir),
+                                        str(game.game_id))
+                   for game in games]
+        built = []
+        for game, result in zip(games, await asyncio.gather(*renders, return_exceptions=True)):
+            if isinstance(result, Exception):
+                print(f'Failed to render the replay of game {game.game_id}: {result!r}')
+                continue
+            entry = self.manifest.get(game.game_id)
+            # videos named by their players come from before the manifest, and were posted when their game ended
+            legacy_file = self.video_dir.joinpath(ReplayBuilder.display_name(game))
+            posted = entry['posted'] if entry else os.path.exists(legacy_file)
+            self.manifest[game.game_id] = {'hash': ReplayBuilder.key(game), 'name': ReplayBuilder.display_name(game),
+                                              'posted': posted}
+            built.append(game)
+        self.save()
+        return built
+
+    def unposted(self) -> [int]:
+        """
+        :return: The ids of the games whose video was rendered but never posted.
+        """
+        return [game_id for game_id, entry in self.manifest.items()
+                if not entry['posted'] and os.path.exists(self.path(game_id))]
+
+    def mark_posted(self, game_id: int):
+        self.manifest[game_id]['posted'] = True
+        self.save()
+
+    def save(self):
+        with open(str(self.manifest_file) + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(str(self.manifest_file) + '.tmp', self.manifest_file)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
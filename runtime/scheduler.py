@@ -0,0 +1,153 @@
+"""
+A single scheduler for every deadline the bot keeps: challenge expiry, channel deletion, auto save.
+
+Timers live in one heap and are fired by one task, so pending timers cost a heap entry each
+instead of a sleeping task each. Timers that come due close together are fired as a batch.
+Deadlines are wall clock times and every timer is named by a kind, a key and JSON arguments,
+so the pending timers can be saved with the rest of the bot's state and picked up after a restart.
+
+Usage:
+    scheduler = Scheduler()
+    scheduler.register('delete_channel', delete_channel)
+    scheduler.schedule('delete_channel', 3600, channel_id, channel_id)
+    asyncio.run_coroutine_threadsafe(scheduler.run(), loop)
+"""
+import asyncio
+import heapq
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+
+
+class Scheduler(object):
+    """
+    Fires registered handlers at their deadlines.
+    A timer is identified by its kind and key, so scheduling the same kind and key again replaces the timer.
+    :param resolution: Seconds after a deadline that later timers are fired with it, in the same batch.
+    :param clock: Returns the current wall clock time in seconds.
+    """
+
+    def __init__(self, resolution: float = 1.0, clock: callable = time.time):
+        self.resolution = resolution
+        self.clock = clock
+        self.handlers: {str, callable} = {}
+        # entries are (deadline, sequence, kind, key, args), and only the latest sequence of a timer is live
+        self._heap: [(float, int, str, object, list)] = []
+        self._live: {(str, object), int} = {}
+        self._sequence = 0
+        self._wakeup: asyncio.Event = None
+
+    def register(self, kind: str, handler: callable):
+        """
+        :param handler: Called with the arguments of each timer of this kind, may be a coroutine function.
+        """
+        self.handlers[kind] = handler
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, timer: (str, object)):
+        return timer in self._live
+
+    def schedule(self, kind: str, delay: float, key=None, *args):
+        """
+        Schedules a timer, replacing any pending timer of the same kind and key.
+        :param delay: Seconds from now.
+        :param key: Tells timers of the same kind apart, must be hashable and JSON serializable.
+        :param args: Arguments for the handler, must be JSON serializable.
+        """
+        self._push(self.clock() + delay, kind, key, list(args))
+
+    def cancel(self, kind: str, key=None) -> bool:
+        """
+        :return: Whether a pending timer was cancelled.
+        """
+        # the heap entry is skipped when it comes due
+        return self._live.pop((kind, key), None) is not None
+
+    def _push(self, deadline: float, kind: str, key, args: list):
+        self._sequence += 1
+        self._live[(kind, key)] = self._sequence
+        heapq.heappush(self._heap, (deadline, self._sequence, kind, key, args))
+        if self._wakeup is not None and self._heap[0][1] == self._sequence:
+            # the new timer is the earliest, so the runner must wake up sooner than it planned
+            self._wakeup.set()
+
+    def due(self) -> [(str, object, list)]:
+        """
+        Removes the timers that are due, along with those due within the resolution after them.
+        :return: The kind, key and arguments of every timer in the batch, earliest first.
+        """
+        batch = []
+        now = self.clock()
+        if not self._heap or self._heap[0][0] > now:
+            return batch
+        cutoff = now + self.resolution
+        while self._heap and self._heap[0][0] <= cutoff:
+            deadline, sequence, kind, key, args = heapq.heappop(self._heap)
+            if self._live.get((kind, key)) == sequence:
+                del self._live[(kind, key)]
+                batch.append((kind, key, args))
+        return batch
+
+    async def fire(self, batch: [(str, object, list)]):
+        """
+        Runs the handlers of a batch of timers concurrently. A failing handler does not stop the others.
+        """
+        calls = []
+        for kind, key, args in batch:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                print(f'No handler for {kind} timer {key}, dropping it.')
+                continue
+            calls.append(self._call(kind, key, handler, args))
+        await asyncio.gather(*calls)
+
+    @staticmethod
+    async def _call(kind: str, key, handler: callable, args: list):
+        try:
+            result = handler(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f'{kind} timer {key} failed: {e!r}')
+
+    async def run(self):
+        """
+        Fires timers as they come due, until cancelled.
+        """
+        self._wakeup = asyncio.Event()
+        while True:
+            await self.fire(self.due())
+            self._wakeup.clear()
+            # skip cancelled timers, so they do not wake the runner
+            while self._heap and self._live.get((self._heap[0][2], self._heap[0][3])) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            timeout = max(0.0, self._heap[0][0] - self.clock()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def save(self, path: Path):
+        """
+        Writes the pending timers to a JSON file.
+        """
+        timers = [[deadline, kind, key, args] for deadline, sequence, kind, key, args in sorted(self._heap)
+                  if self._live.get((kind, key)) == sequence]
+        with open(path, 'w') as f:
+            json.dump(timers, f)
+
+    def load(self, path: Path):
+        """
+        Adds the timers saved to a JSON file. Timers whose deadline passed while the bot was down fire at once.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            timers = json.load(f)
+        for deadline, kind, key, args in timers:
+            # JSON turns tuple keys into lists
+            self._push(deadline, kind, tuple(key) if isinstance(key, list) else key, args)
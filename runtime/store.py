@@ -0,0 +1,292 @@
+"""
+State shared between shard processes, kept in one SQLite file.
+
+Each shard process receives the events of its own guilds, so games never need to be shared,
+but players, their Elo, guild prefixes and guild settings are seen by every shard. They are stored here and
+every shard keeps the players it has used in memory.
+
+Elo only changes inside an immediate transaction that reads the current values first, so two
+shards finishing games of the same player at once both count. Other player fields are written
+when they differ from what was last read, and shards pick up each other's changes on refresh().
+"""
+import pickle
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from model.game import Player
+
+schema = '''
+CREATE TABLE IF NOT EXISTS players (
+    uid INTEGER PRIMARY KEY,
+    elo INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    profile BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_name ON players (name);
+CREATE TABLE IF NOT EXISTS prefixes (
+    gid INTEGER PRIMARY KEY,
+    prefix TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS guild_settings (
+    gid INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (gid, name)
+);
+'''
+
+
+class SharedStore(object):
+    """
+    A connection to the shared database. Every shard process opens its own.
+    :param path: The database file, created along with its tables if missing.
+    :param timeout: Seconds to wait for another shard's transaction before giving up.
+    """
+
+    def __init__(self, path: Path, timeout: float = 30.0):
+        self.path = path
+        self.connection = sqlite3.connect(str(path), timeout=timeout, isolation_level=None)
+        # lets shards read while another one writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(schema)
+
+    @contextmanager
+    def transaction(self) -> sqlite3.Connection:
+        """
+        Holds the write lock for the enclosed block, which is committed unless it raises.
+        """
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def close(self):
+        self.connection.close()
+
+
+class PlayerStore(object):
+    """
+    Players by uid, backed by the shared store and used like the dict of players it replaces.
+    Players are read from the store the first time they are used and cached after.
+    """
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._cache: {int, Player} = {}
+        self._written: {int, bytes} = {}
+
+    @staticmethod
+    def profile(player: Player) -> bytes:
+        """
+        :return: Everything about the player except Elo, which is only written in transactions.
+        """
+        return pickle.dumps({k: v for k, v in player.__dict__.items() if k != 'elo'})
+
+    def _load(self, uid: int) -> Player:
+        row = self.store.connection.execute(
+            'SELECT elo, profile FROM players WHERE uid = ?', (uid,)).fetchone()
+        if row is None:
+            raise KeyError(uid)
+        player = Player.__new__(Player)
+        player.__dict__.update(pickle.loads(row[1]))
+        player.elo = row[0]
+        self._cache[uid] = player
+        self._written[uid] = row[1]
+        return player
+
+    def import_players(self, players: {int, Player}):
+        """
+        Copies players into the store, such as those of the pickled player file used before it.
+        Players already in the store are left as they are.
+        """
+        with self.store.transaction() as db:
+            db.executemany('INSERT OR IGNORE INTO players VALUES (?, ?, ?, ?)',
+                           [(p.uid, p.elo, p.name, PlayerStore.profile(p)) for p in players.values()])
+
+    def __getitem__(self, uid: int) -> Player:
+        try:
+            return self._cache[uid]
+        except KeyError:
+            return self._load(uid)
+
+    def __setitem__(self, uid: int, player: Player):
+        profile = PlayerStore.profile(player)
+        with self.store.transaction() as db:
+            db.execute('INSERT OR IGNORE INTO players VALUES (?, ?, ?, ?)', (uid, player.elo, player.name, profile))
+        self._cache[uid] = player
+        self._written[uid] = profile
+
+    def __contains__(self, uid) -> bool:
+        return uid in self._cache or self.store.connection.execute(
+            'SELECT 1 FROM players WHERE uid = ?', (uid,)).fetchone() is not None
+
+    def __len__(self):
+        return self.store.connection.execute('SELECT COUNT(*) FROM players').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self) -> [int]:
+        return [uid for uid, in self.store.connection.execute('SELECT uid FROM players')]
+
+    def values(self) -> [Player]:
+        return [self[uid] for uid in self.keys()]
+
+    def items(self) -> [(int, Player)]:
+        return [(uid, self[uid]) for uid in self.keys()]
+
+    def names(self) -> {str, int}:
+        """
+        :return: The uid of every player by name, read straight from the store.
+        """
+        return {name: uid for uid, name in self.store.connection.execute('SELECT uid, name FROM players')}
+
+    def name_owner(self, name: str) -> int:
+        """
+        :return: The uid of the player with the name in the store, including names set by other shards,
+        or 0 if no player has it.
+        """
+        row = self.store.connection.execute(
+            'SELECT uid FROM players WHERE name = ? LIMIT 1', (name.lower(),)).fetchone()
+        return row[0] if row else 0
+
+    def flush(self, players: [Player] = None):
+        """
+        Writes the players that changed since they were read or last written.
+        :param players: The players to check, every cached player by default.
+        """
+        changed = []
+        for player in self._cache.values() if players is None else players:
+            profile = PlayerStore.profile(player)
+            if profile != self._written.get(player.uid):
+                changed.append((player.name, profile, player.uid))
+        if not changed:
+            return
+        with self.store.transaction() as db:
+            db.executemany('UPDATE players SET name = ?, profile = ? WHERE uid = ?', changed)
+        for _, profile, uid in changed:
+            self._written[uid] = profile
+
+    def _sync(self, player: Player, elo: int):
+        """
+        Sets the Elo of a player and of the cached player with the same uid, which may be a different
+        object when the player was loaded along with a game.
+        """
+        player.elo = elo
+        cached = self._cache.get(player.uid)
+        if cached is not None:
+            cached.elo = elo
+
+    def record_result(self, winner: Player, loser: Player):
+        """
+        Updates the Elo of both players of a finished game against their current Elo in the store.
+        """
+        with self.store.transaction() as db:
+            rows = dict(db.execute('SELECT uid, elo FROM players WHERE uid IN (?, ?)', (winner.uid, loser.uid)))
+            winner.elo = rows.get(winner.uid, winner.elo)
+            loser.elo = rows.get(loser.uid, loser.elo)
+            winner.calc_elo(loser, True)
+            loser.calc_elo(winner, False)
+            db.executemany('UPDATE players SET elo = ? WHERE uid = ?',
+                           [(winner.elo, winner.uid), (loser.elo, loser.uid)])
+        self._sync(winner, winner.elo)
+        self._sync(loser, loser.elo)
+
+    def set_elo(self, player: Player, elo: int):
+        with self.store.transaction() as db:
+            db.execute('UPDATE players SET elo = ? WHERE uid = ?', (elo, player.uid))
+        self._sync(player, elo)
+
+    def refresh(self) -> [(Player, str)]:
+        """
+        Reads the Elo and names other shards have written for the cached players.
+        Local changes are flushed first so they are not replaced.
+        :return: Every player that changed, with the name it had before.
+        """
+        self.flush()
+        changed = []
+        for uid, elo, name in self.store.connection.execute('SELECT uid, elo, name FROM players'):
+            player = self._cache.get(uid)
+            if player is None or (player.elo == elo and player.name == name):
+                continue
+            old_name = player.name
+            player.elo = elo
+            if player.name != name:
+                player.__dict__.update(self._load(uid).__dict__)
+                self._cache[uid] = player
+            changed.append((player, old_name))
+        return changed
+
+
+class PrefixStore(object):
+    """
+    Command prefixes by guild id, written through to the shared store.
+    """
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._prefixes: {int, str} = dict(store.connection.execute('SELECT gid, prefix FROM prefixes'))
+
+    def import_prefixes(self, prefixes: {int, str}):
+        with self.store.transaction() as db:
+            db.executemany('INSERT OR IGNORE INTO prefixes VALUES (?, ?)', list(prefixes.items()))
+        self._prefixes = dict(self.store.connection.execute('SELECT gid, prefix FROM prefixes'))
+
+    def __getitem__(self, gid: int) -> str:
+        return self._prefixes[gid]
+
+    def __setitem__(self, gid: int, prefix: str):
+        with self.store.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO prefixes VALUES (?, ?)', (gid, prefix))
+        self._prefixes[gid] = prefix
+
+    def __delitem__(self, gid: int):
+        with self.store.transaction() as db:
+            db.execute('DELETE FROM prefixes WHERE gid = ?', (gid,))
+        del self._prefixes[gid]
+
+    def pop(self, gid: int, *default) -> str:
+        if gid not in self._prefixes:
+            return self._prefixes.pop(gid, *default)
+        prefix = self._prefixes[gid]
+        del self[gid]
+        return prefix
+
+    def __contains__(self, gid) -> bool:
+        return gid in self._prefixes
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def __iter__(self):
+        return iter(self._prefixes)
+
+    def items(self):
+        return self._prefixes.items()
+
+
+class GuildSettings(object):
+    """
+    One named setting by guild id, written through to the shared store.
+    :param name: Name of the setting.
+    :param default: Value of guilds that have not changed the setting.
+    """
+
+    def __init__(self, store: SharedStore, name: str, default: str):
+        self.store = store
+        self.name = name
+        self.default = default
+        self._values: {int, str} = dict(store.connection.execute(
+            'SELECT gid, value FROM guild_settings WHERE name = ?', (name,)))
+
+    def __getitem__(self, gid: int) -> str:
+        return self._values.get(gid, self.default)
+
+    def __setitem__(self, gid: int, value: str):
+        with self.store.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO guild_settings VALUES (?, ?, ?)', (gid, self.name, value))
+        self._values[gid] = value
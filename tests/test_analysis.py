@@ -0,0 +1,32 @@
+"""
+Batch board evaluation against the per-board loops it replaces.
+"""
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from bench.analysis import check
+from bench.positions import *
+from model.analysis import BoardBatch
+
+
+@pytest.mark.parametrize('size', list(Layout.sizes))
+def test_batch_agrees_with_loops(size):
+    rng = random.Random(size)
+    rows, cols = Layout.sizes[size]
+    boards = [random_board(rows, cols, seed=k, density=rng.uniform(0.3, 0.95)) for k in range(150)]
+    check(boards, BoardBatch.from_boards(boards))
+
+
+@pytest.mark.parametrize('size', list(Layout.sizes))
+def test_acquire_distance_is_zero_exactly_when_a_conquest_is_possible(size):
+    rng = random.Random(size)
+    rows, cols = Layout.sizes[size]
+    boards = [random_board(rows, cols, seed=k, density=rng.uniform(0.5, 1.0)) for k in range(150)]
+    batch = BoardBatch.from_boards(boards)
+    for player in (1, 2):
+        conquest, acquire = batch.conquest_distance(player), batch.acquire_distance(player)
+        assert ((conquest >= 0) == (acquire == 0)).all()
+        assert (acquire >= -1).all()
@@ -0,0 +1,54 @@
+"""
+Finished games archived on disk, shared between shard processes.
+"""
+from model.archive import *
+
+
+def finished(channel_id: int, game_id: int = None) -> Game:
+    game = Game(channel_id, [Player(1, name='a'), Player(2, name='b')], game_id=game_id)
+    game.cache.receive(Move('C', 1))
+    return game
+
+
+def test_shard_reads_other_indexes_before_writing_its_own(tmp_path):
+    unsharded = GameArchive(tmp_path, {})
+    unsharded.append(finished(10))
+    unsharded.save()
+
+    # a shard starting for the first time has no index file of its own yet
+    shard = GameArchive(tmp_path, {}, index_name='index-1')
+    assert list(shard.index) == [10]
+    shard.append(finished(11))
+    shard.save()
+
+    assert sorted(GameArchive(tmp_path, {}).index) == [10, 11]
+    assert sorted(GameArchive(tmp_path, {}, index_name='index-2').index) == [10, 11]
+    # each process only writes the games it archived itself
+    with open(tmp_path.joinpath('index-1.json'), 'r') as f:
+        assert list(json.load(f)) == ['11']
+
+
+def test_archived_games_load_back(tmp_path):
+    archive = GameArchive(tmp_path, {})
+    game = finished(12)
+    archive.append(game)
+    archive.save()
+    loaded = GameArchive(tmp_path, {}).load(12)
+    assert loaded.history.moves == game.history.moves
+    assert 12 in archive and 13 not in archive
+
+
+def test_games_in_a_reused_channel_are_kept_apart(tmp_path):
+    archive = GameArchive(tmp_path, {})
+    first, second = finished(14, game_id=100), finished(14, game_id=101)
+    second.cache.receive(Move('C', 2))
+    archive.append(first)
+    assert second not in archive
+    archive.append(second)
+    archive.save()
+
+    reloaded = GameArchive(tmp_path, {})
+    assert sorted(reloaded.index) == [100, 101]
+    assert reloaded.load(100).history.moves == first.history.moves
+    assert reloaded.load(101).history.moves == second.history.moves
+    assert 14 not in reloaded
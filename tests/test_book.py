@@ -0,0 +1,107 @@
+"""
+The endgame cache, checked against a plain search and against the conquest rule itself.
+"""
+import random
+from collections import deque
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from bench.positions import *
+from model.book import *
+
+
+def fewest_acquires(board: Board, player: int) -> int:
+    """
+    The fewest empty cells the player must acquire before a conquest, found one cell at a time, or None.
+    """
+    dist = {}
+    q = deque()
+    for i in range(board.rows):
+        for j in range(board.cols):
+            if board[i][j].base and board[i][j].player == player:
+                dist[(i, j)] = 0
+                q.append((i, j))
+    while q:
+        i, j = q.popleft()
+        for a, b in board.adjacent((i, j), base=True):
+            cell = board[a][b]
+            if cell.player not in (0, player):
+                continue
+            d = dist[(i, j)] + (cell.player == 0)
+            if (a, b) not in dist or d < dist[(a, b)]:
+                dist[(a, b)] = d
+                q.appendleft((a, b)) if cell.player == player else q.append((a, b))
+    ends = [d for (i, j), d in dist.items()
+            if any(board[a][b].base and board[a][b].player == 3 - player for a, b in board.adjacent((i, j), base=True))]
+    return min(ends, default=None)
+
+
+def can_conquer(board: Board, player: int) -> bool:
+    try:
+        board.deepcopy().conquest(player)
+    except InvalidMove:
+        return False
+    return True
+
+
+def boards(size: str, count: int = 120) -> [Board]:
+    rng = random.Random(size)
+    rows, cols = Layout.sizes[size]
+    return [random_board(rows, cols, seed=k, density=rng.uniform(0.5, 1.0)) for k in range(count)]
+
+
+@pytest.mark.parametrize('size', list(Layout.sizes))
+def test_routes_are_cheapest_and_make_a_conquest_possible(size):
+    for board in boards(size):
+        for player in (1, 2):
+            route = conquest_route(board, player)
+            expected = fewest_acquires(board, player)
+            assert (route is None) == (expected is None)
+            if route is None:
+                continue
+            assert len(route) == expected
+            assert len(set(route)) == len(route)
+            assert all(type(i) is int and type(j) is int for i, j in route)
+            assert all(board[i][j].player == 0 for i, j in route)
+            after = board.deepcopy()
+            after.acquire(player, route, validate=True)
+            assert can_conquer(after, player)
+
+
+@pytest.mark.parametrize('size', list(Layout.sizes))
+def test_solve_finds_finishers(size):
+    cache = EndgameCache()
+    solved = set()
+    for board in boards(size):
+        for player in (1, 2):
+            move = cache.solve(board, player)
+            distance = fewest_acquires(board, player)
+            if distance is None or distance > max_key_locs:
+                assert move is None
+            elif distance == 0:
+                assert move.move_type == 'Q' and can_conquer(board, player)
+            else:
+                assert move.move_type == 'A' and len(move.locs) == distance
+                after = board.deepcopy()
+                move.apply(after, validate=True)
+                assert can_conquer(after, player)
+            solved.add(move.move_type if move else None)
+    if size == 'small':
+        # small boards are crowded enough to have every kind of answer
+        assert solved == {'Q', 'A', None}
+
+
+def test_solved_positions_are_remembered():
+    board = boards('small', 1)[0]
+    cache = EndgameCache(size=2)
+    first = cache.solve(board, 1)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.solve(board, 1) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    # the least recently used position is forgotten once the cache is full
+    cache.solve(board, 2)
+    cache.solve(boards('small', 2)[1], 1)
+    cache.solve(board, 1)
+    assert (cache.hits, cache.misses) == (1, 4)
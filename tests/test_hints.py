@@ -0,0 +1,102 @@
+"""
+Hints, checked against a plain search over the board and against the moves they suggest.
+"""
+import random
+from collections import deque
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from bench.positions import *
+from model.hints import *
+
+
+def acquire_costs(board: Board, player: int, sources: {Position, int}) -> {Position, int}:
+    """
+    The fewest empty cells the player must acquire to join each cell they can reach to the sources,
+    counting the cell itself, found one cell at a time.
+    """
+    dist = dict(sources)
+    q = deque(sources)
+    while q:
+        i, j = q.popleft()
+        for a, b in board.adjacent((i, j), base=True):
+            cell = board[a][b]
+            if cell.player not in (0, player):
+                continue
+            d = dist[(i, j)] + (cell.player == 0)
+            if (a, b) not in dist or d < dist[(a, b)]:
+                dist[(a, b)] = d
+                q.appendleft((a, b)) if cell.player == player else q.append((a, b))
+    return dist
+
+
+def touches_enemy_base(board: Board, player: int, pos: Position) -> bool:
+    return any(board[a][b].base and board[a][b].player == 3 - player for a, b in board.adjacent(pos, base=True))
+
+
+def reference(board: Board, player: int) -> (int, {Position, int}):
+    """
+    :return: The fewest empty cells needed for a conquest, or None, and for every empty cell the
+    empty cells still needed after acquiring it, on the best route through it.
+    """
+    cells = [(i, j) for i in range(board.rows) for j in range(board.cols)]
+    from_base = acquire_costs(board, player, {pos: 0 for pos in cells
+                                              if board[pos[0]][pos[1]].base and board[pos[0]][pos[1]].player == player})
+    ends = {pos: int(board[pos[0]][pos[1]].player == 0) for pos in cells
+            if board[pos[0]][pos[1]].player in (0, player) and touches_enemy_base(board, player, pos)}
+    from_enemy = acquire_costs(board, player, ends)
+    distance = min((from_base[pos] for pos in ends if pos in from_base), default=None)
+    remaining = {pos: from_base[pos] + from_enemy[pos] - 2 for pos in cells
+                 if board[pos[0]][pos[1]].player == 0 and pos in from_base and pos in from_enemy}
+    return distance, remaining
+
+
+def can_conquer(board: Board, player: int) -> bool:
+    try:
+        board.deepcopy().conquest(player)
+    except InvalidMove:
+        return False
+    return True
+
+
+@pytest.mark.parametrize('size', list(Layout.sizes))
+def test_hints_match_the_board(size):
+    rng = random.Random(size)
+    rows, cols = Layout.sizes[size]
+    endgame = EndgameCache()
+    for k in range(80):
+        board = random_board(rows, cols, seed=k, density=rng.uniform(0.2, 1.0))
+        for player in (1, 2):
+            hint = compute_hint(board, player, endgame)
+            distance, remaining = reference(board, player)
+            assert hint.vanquish_spots == board.vanquish_spots(player)
+            assert hint.distance == distance
+            assert hint.conquest == can_conquer(board, player)
+            assert hint.finisher == endgame.solve(board, player)
+            assert hint.book_moves == []
+
+            ranked = sorted(remaining.values())[:Hint.top_cells]
+            assert [left for _, left in hint.acquires] == ranked
+            for pos, left in hint.acquires:
+                assert remaining[pos] == left
+            if distance:
+                # the best cell is on a cheapest route
+                assert hint.acquires[0][1] == distance - 1
+
+
+def test_hints_include_book_moves(tmp_path):
+    game = Game(1, [Player(1), Player(2)], *Layout.sizes['small'])
+    board = game.cache.latest.deepcopy()
+    cell = open_cells(board)[0]
+    game.cache.receive(Move('A', 1, locs=[cell]))
+    path = tmp_path.joinpath('book.dqb')
+    assert OpeningBook.build([game, game], path) == 1
+    book = OpeningBook(path)
+    try:
+        hint = compute_hint(board, 1, book=book)
+    finally:
+        book.close()
+    assert [(entry.move.locs, entry.plays) for entry in hint.book_moves] == [([cell], 2)]
+    assert move_text(hint.book_moves[0].move, board.layout) == 'A ' + Utility.flag_alias(cell, board.layout)
@@ -0,0 +1,58 @@
+"""
+Pairing queued players by Elo.
+"""
+from model.matchmaking import *
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_pairs_closest_within_window():
+    clock = Clock()
+    pool = MatchmakingPool(window=50, widen=5, clock=clock)
+    for uid, elo in ((1, 1000), (2, 1040), (3, 1300)):
+        pool.join(Player(uid, elo=elo))
+    assert [(a.uid, b.uid) for a, b in pool.pair()] == [(1, 2)]
+    assert 3 in pool and len(pool) == 1
+
+
+def test_window_widens_with_waiting():
+    clock = Clock()
+    pool = MatchmakingPool(window=50, widen=5, clock=clock)
+    pool.join(Player(1, elo=1000))
+    pool.join(Player(2, elo=1200))
+    assert pool.pair() == []
+    clock.now = 30
+    assert [(a.uid, b.uid) for a, b in pool.pair()] == [(1, 2)]
+
+
+def test_requeued_players_keep_their_place():
+    clock = Clock()
+    pool = MatchmakingPool(window=50, widen=5, clock=clock)
+    pool.join(Player(1, elo=1000))
+    pool.join(Player(2, elo=1200))
+    clock.now = 30
+    pair = pool.pair()[0]
+    assert len(pool) == 0
+    clock.now = 31
+    pool.join(Player(3, elo=1100))
+    pool.requeue(pair)
+    assert list(pool.waiting) == [1, 2, 3]
+    # the requeued players have still waited long enough to be paired with each other
+    assert [(a.uid, b.uid) for a, b in pool.pair()] == [(1, 3)]
+    assert pool.waiting[2][1] == 0.0
+
+
+def test_requeue_of_a_waiting_player_changes_nothing():
+    clock = Clock()
+    pool = MatchmakingPool(clock=clock)
+    player = Player(1, elo=1000)
+    pool.join(player)
+    pool.requeue((player,))
+    assert len(pool) == 1 and pool._keys == [(1000, 1)]
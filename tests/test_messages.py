@@ -0,0 +1,26 @@
+"""
+Splitting rendered boards into Discord messages.
+"""
+import pytest
+
+from model.game import *
+
+custom_emoji = ('<:a_long_custom_tile_name:766082501705203713>', '<:a_long_custom_base_name:766082503789379584>')
+
+
+@pytest.mark.parametrize('size', list(Layout.sizes))
+@pytest.mark.parametrize('emoji', [None, custom_emoji])
+def test_messages_fit_and_keep_rows_whole(size, emoji):
+    players = [Player(1), Player(2)]
+    game = Game(1, players, *Layout.sizes[size])
+    if emoji:
+        players[0].emoji = [emoji] + list(players[0].emoji)
+    # cover a third of the board so player emoji are mixed in with flags
+    game.cache.latest.acquire(1, [(i, j) for i in range(game.layout.rows) for j in range(0, game.layout.cols, 3)
+                                  if not game.cache.latest[i][j].base])
+    messages = str(game).split('#msg')
+    assert all(len(message) <= Game.message_limit for message in messages)
+    assert all(message.endswith('\n') for message in messages)
+    assert ''.join(messages).count('\n') == game.layout.rows
+    # no two neighbouring messages would have fit in one
+    assert all(len(a) + len(b.split('\n')[0]) + 1 > Game.message_limit for a, b in zip(messages, messages[1:]))
@@ -0,0 +1,49 @@
+"""
+Players ranked by elo as their elo changes.
+"""
+import random
+
+import pytest
+
+from model.ranking import *
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # small blocks, so a few hundred players split and empty blocks many times
+    monkeypatch.setattr(RankIndex, 'block_size', 4)
+
+
+def expected(players: [Player]) -> [int]:
+    return [player.uid for player in sorted(players, key=lambda p: (-p.elo, p.uid))]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_ranks_follow_elo_changes(small_blocks, seed):
+    rng = random.Random(seed)
+    players = [Player(uid, elo=rng.randrange(0, 100)) for uid in range(60)]
+    index = RankIndex(players[:30])
+    for player in players[30:]:
+        index.add(player)
+    for _ in range(500):
+        player = rng.choice(players)
+        player.elo = max(0, player.elo + rng.choice((-30, -15, 15, 30)))
+        index.update(player)
+        order = expected(players)
+        assert [p.uid for p in index] == order
+        assert index.rank(player) == order.index(player.uid)
+    assert [p.uid for p in index.top(10)] == expected(players)[:10]
+    assert [index.rank(p) for p in players] == [expected(players).index(p.uid) for p in players]
+    assert len(index) == 60
+
+
+def test_everyone_at_one_elo(small_blocks):
+    players = [Player(uid) for uid in range(20)]
+    index = RankIndex()
+    for player in reversed(players):
+        index.add(player)
+    assert [index.rank(p) for p in players] == list(range(20))
+    players[7].elo = 10
+    index.update(players[7])
+    assert index.rank(players[7]) == 0
+    assert index.top(3) == [players[7], players[0], players[1]]
@@ -0,0 +1,141 @@
+"""
+Round trips of games and histories through their binary records and through pickle,
+checked against the boards the moves replay to.
+"""
+import pickle
+import random
+
+import pytest
+
+from bench.selfplay import choose_move, flag_aliases
+from model.game import *
+
+
+def play(seed: int, size: str = 'medium', max_moves: int = 400) -> Game:
+    """
+    Plays a seeded random game the way the bot does, until a conquest or the move limit.
+    """
+    rng = random.Random(seed)
+    players = [Player(1000 + seed, elo=seed, name=f'a{seed}'), Player(2000 + seed, elo=2 * seed, name=f'b{seed}')]
+    game = Game(seed, players, *Layout.sizes[size], role_ids=[11, None], game_id=5000 + seed)
+    aliases = flag_aliases(game.layout)
+    cache = game.cache
+    for _ in range(max_moves):
+        player = cache.current_player
+        try:
+            cache.receive(Utility.read_move(player, choose_move(cache.latest, player, rng, aliases), game.layout))
+        except InvalidMove:
+            continue
+        finally:
+            cache.move = None
+        if game.history.moves[-1]['move_type'] == 'Q':
+            break
+        cache.current_player = 3 - player
+    return game
+
+
+def cells(board: Board) -> [(int, bool)]:
+    return [(cell.player, cell.base) for row in board for cell in row]
+
+
+def assert_same_game(game: Game, other: Game):
+    assert other.channel_id == game.channel_id
+    assert other.game_id == game.game_id
+    assert other.history.moves == game.history.moves
+    assert (other.history.rows, other.history.cols) == (game.history.rows, game.history.cols)
+    assert [tuple(base) for base in other.history.bases] == [tuple(base) for base in game.history.bases]
+    # the final board is replayed from the moves, so it must match the board the game was played on
+    assert cells(other.cache.latest) == cells(game.cache.latest)
+    assert cells(other.history.final_board()) == cells(game.cache.latest)
+    assert other.cache.current_player == game.cache.current_player
+    assert other.draw_suggested == game.draw_suggested
+    assert other.forfeit_suggested == game.forfeit_suggested
+    assert other.role_ids == game.role_ids
+    assert [(p.uid, p.name, p.elo) for p in other.players] == [(p.uid, p.name, p.elo) for p in game.players]
+
+
+games = {(seed, size): play(seed, size) for size in Layout.sizes for seed in range(4)}
+
+
+def test_games_cover_every_move_type():
+    played = {mv['move_type'] for game in games.values() for mv in game.history.moves}
+    assert played == {'A', 'C', 'V', 'Q'}
+
+
+@pytest.mark.parametrize('key', list(games))
+def test_game_bytes_round_trip(key):
+    game = games[key]
+    assert_same_game(game, Game.from_bytes(game.to_bytes(), {p.uid: p for p in game.players}))
+
+
+@pytest.mark.parametrize('key', list(games))
+def test_game_pickle_round_trip(key):
+    game = games[key]
+    assert_same_game(game, pickle.loads(pickle.dumps(game)))
+
+
+@pytest.mark.parametrize('key', list(games))
+def test_history_round_trip(key):
+    hist = games[key].history
+    for other in (History.from_bytes(hist.to_bytes()), pickle.loads(pickle.dumps(hist))):
+        assert other.moves == hist.moves
+        assert cells(other.final_board()) == cells(games[key].cache.latest)
+
+
+def v1_record(game: Game) -> bytes:
+    """
+    Packs a game the way records were written before they had a game id.
+    """
+    out = bytearray(RECORD_MAGIC + bytes([1]))
+    out += Game.record_header_v1.pack(game.channel_id, game.cache.current_player, game.draw_suggested,
+                                      game.forfeit_suggested, game.cache.time_since_last_move.timestamp(),
+                                      len(game.players))
+    for player, role_id in zip(game.players, game.role_ids):
+        out += Game.record_player.pack(player.uid, role_id or 0)
+    hist = game.history
+    write_history(out, hist.rows, hist.cols, hist.bases, hist.moves)
+    return bytes(out)
+
+
+@pytest.mark.parametrize('key', list(games))
+def test_version_1_records_are_read_by_channel_id(key):
+    game = games[key]
+    loaded = Game.from_bytes(v1_record(game), {p.uid: p for p in game.players})
+    # games from before channels were reused are known by their channel
+    assert loaded.game_id == loaded.channel_id == game.channel_id
+    loaded.game_id = game.game_id
+    assert_same_game(game, loaded)
+
+
+def test_forfeit_round_trip():
+    game = play(7, max_moves=30)
+    # the forfeiting player confirmed, so the other player is the winner
+    game.forfeit_suggested = game.players[0].uid
+    game.cache.current_player = 2
+    assert_same_game(game, Game.from_bytes(game.to_bytes(), {p.uid: p for p in game.players}))
+    assert_same_game(game, pickle.loads(pickle.dumps(game)))
+
+
+def test_draw_round_trip():
+    game = play(8, max_moves=30)
+    game.draw_suggested = game.players[1].uid
+    assert_same_game(game, Game.from_bytes(game.to_bytes(), {p.uid: p for p in game.players}))
+    assert_same_game(game, pickle.loads(pickle.dumps(game)))
+
+
+def test_unknown_players_are_created():
+    game = games[(0, 'medium')]
+    other = Game.from_bytes(game.to_bytes(), {})
+    assert [p.uid for p in other.players] == [p.uid for p in game.players]
+
+
+@pytest.mark.parametrize('data', [b'', b'XYZ\x01', b'DQD\x09'])
+def test_invalid_records_are_rejected(data):
+    with pytest.raises(InvalidRecord):
+        Game.from_bytes(data, {})
+
+
+def test_truncated_record_is_rejected():
+    data = games[(0, 'medium')].to_bytes()
+    with pytest.raises(InvalidRecord):
+        Game.from_bytes(data[:len(data) // 2], {})
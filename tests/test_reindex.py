@@ -0,0 +1,84 @@
+"""
+Rebuilding games from the messages in their channel.
+"""
+import random
+
+from bench.selfplay import choose_move, flag_aliases
+from model.reindex import *
+
+
+def transcript(seed: int, max_moves: int = 300) -> (Game, [(int, str)]):
+    """
+    Plays a seeded random game and keeps every message sent in its channel, including rejected moves.
+    :return: The game as played, and the (author id, text) of each message.
+    """
+    rng = random.Random(seed)
+    game = Game(seed, [Player(1), Player(2)])
+    aliases = flag_aliases(game.layout)
+    cache = game.cache
+    messages = [(1, 'good luck'), (3, 'A 1 1')]
+    for _ in range(max_moves):
+        player = cache.current_player
+        text = choose_move(cache.latest, player, rng, aliases)
+        messages.append((player, text))
+        try:
+            cache.receive(Utility.read_move(player, text, game.layout))
+        except InvalidMove:
+            continue
+        finally:
+            cache.move = None
+        if game.history.moves[-1]['move_type'] == 'Q':
+            break
+        cache.current_player = 3 - player
+    return game, messages
+
+
+def reindex(messages: [(int, str)]) -> Reindexer:
+    reindexer = Reindexer(Game(0, [Player(1), Player(2)]))
+    for author_id, text in messages:
+        reindexer.feed(author_id, text)
+    reindexer.finish()
+    return reindexer
+
+
+def cells(board: Board) -> [(int, bool)]:
+    return [(cell.player, cell.base) for row in board for cell in row]
+
+
+def test_rebuilds_played_games():
+    for seed in range(5):
+        game, messages = transcript(seed)
+        reindexer = reindex(messages)
+        assert reindexer.game.history.moves == game.history.moves
+        assert cells(reindexer.game.cache.latest) == cells(game.cache.latest)
+        assert reindexer.won == (game.history.moves[-1]['move_type'] == 'Q')
+
+
+def test_forfeit_ends_the_game():
+    _, messages = transcript(1, max_moves=10)
+    reindexer = reindex(messages + [(1, 'forfeit'), (1, 'Forfeit'), (2, 'C')])
+    assert reindexer.won and not reindexer.drawn
+    # the player who did not forfeit wins
+    assert reindexer.game.cache.current_player == 2
+    assert reindexer.applied == len(reindex(messages).game.history.moves)
+
+
+def test_cancelled_forfeit_continues():
+    _, messages = transcript(1, max_moves=10)
+    reindexer = reindex(messages + [(2, 'forfeit'), (2, 'cancel'), (2, 'forfeit')])
+    assert not reindexer.won
+    assert reindexer.game.forfeit_suggested == 2
+
+
+def test_draw_needs_both_players():
+    _, messages = transcript(2, max_moves=10)
+    assert not reindex(messages + [(1, 'draw'), (1, 'draw')]).drawn
+    assert not reindex(messages + [(1, 'draw'), (2, 'cancel'), (2, 'draw')]).drawn
+    reindexer = reindex(messages + [(1, 'draw'), (2, 'draw'), (1, 'C')])
+    assert reindexer.drawn and not reindexer.won
+    assert reindexer.applied == len(reindex(messages).game.history.moves)
+
+
+def test_offers_by_others_are_ignored():
+    reindexer = reindex([(3, 'forfeit'), (3, 'forfeit'), (3, 'draw'), (1, 'draw'), (3, 'draw')])
+    assert not reindexer.won and not reindexer.drawn
@@ -0,0 +1,28 @@
+"""
+Boards rendered as images.
+"""
+import pytest
+
+pytest.importorskip('PIL')
+
+from model.render import *
+
+
+def test_bases_stand_out_from_tiles_of_the_same_color():
+    renderer = BoardRenderer.of(*Layout.sizes['small'])
+    board = Board(*Layout.sizes['small'], Layout.of(*Layout.sizes['small']).bases)
+    base = board.bases[0]
+    tile = (base[0], base[1] + 1) if base[1] + 1 < board.cols else (base[0], base[1] - 1)
+    board[tile[0]][tile[1]].player = 1
+    # the default emoji palette, where each player's base emoji has the same color as their tile emoji
+    red, blue = rgb(0xdd2e45), rgb(0x55acee)
+    image = renderer.render(board, [(red, red), (blue, blue)])
+
+    def pixels(pos: Position) -> [Color]:
+        x, y = renderer.origin(pos)
+        return [image.getpixel((x + dx, y + dy)) for dy in range(BoardRenderer.tile) for dx in range(BoardRenderer.tile)]
+
+    assert pixels(base) != pixels(tile)
+    assert set(pixels(tile)) == {red}
+    # the base keeps its color inside the outline
+    assert red in pixels(base)
@@ -0,0 +1,54 @@
+"""
+Replay videos of archived games.
+"""
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from model.archive import *
+from runtime.replays import ReplayBuilder
+from runtime.store import PlayerStore, SharedStore
+
+
+def finished(game_id: int) -> Game:
+    game = Game(7, [Player(1, name='a'), Player(2, name='b')], game_id=game_id)
+    game.cache.receive(Move('C', 1))
+    game.cache.receive(Move('C', 2))
+    return game
+
+
+def test_builds_replays_in_a_clean_data_directory(tmp_path):
+    pytest.importorskip('moviepy.editor')
+    data = tmp_path.joinpath('data')
+    replays = ReplayBuilder(data.joinpath('videos'), data.joinpath('temp'), workers=1)
+    game = finished(20)
+    try:
+        built = asyncio.run(replays.build([game]))
+    finally:
+        replays.close()
+    assert built == [game]
+    assert os.path.exists(replays.path(20))
+    assert replays.unposted() == [20]
+    assert replays.stale([game]) == []
+
+
+def test_finds_stale_games_off_the_player_store_thread(tmp_path):
+    store = SharedStore(tmp_path.joinpath('store.db'))
+    players = PlayerStore(store)
+    players.import_players({1: Player(1, name='a'), 2: Player(2, name='b')})
+    archive = GameArchive(tmp_path.joinpath('history'), players)
+    archive.append(finished(21))
+    archive.save()
+    archive = GameArchive(tmp_path.joinpath('history'), players)
+    replays = ReplayBuilder(tmp_path.joinpath('videos'), tmp_path.joinpath('temp'))
+
+    with ThreadPoolExecutor(1) as executor:
+        # the store's connection can only be used from the thread that opened it
+        with pytest.raises(sqlite3.ProgrammingError):
+            executor.submit(replays.stale, archive).result()
+        stale = executor.submit(replays.stale, archive.games({})).result()
+    assert [game.game_id for game in stale] == [21]
+    assert [player.uid for player in stale[0].players] == [1, 2]
+    store.close()